@@ -2,4 +2,11 @@
 HttpFs client classes
 """
 
-from .httpfs_client import HttpFsClient
+from .async_session import AsyncHttpFsSession
+
+try:
+    from .httpfs_client import HttpFsClient
+except EnvironmentError:
+    # fusepy can't be imported without libfuse, which programs that only use
+    # AsyncHttpFsSession don't need
+    pass
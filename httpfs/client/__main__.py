@@ -9,6 +9,11 @@ import sys
 
 from fuse import FUSE
 from httpfs.client import HttpFsClient
+from httpfs.client.attr_cache import AttrCache
+from httpfs.client.block_cache import BlockCache
+from httpfs.client.block_reader import BlockReader
+from httpfs.client.disk_block_cache import DiskBlockCache
+from httpfs.common.metrics import MetricsServer
 
 LOG_FMT = "[%(asctime)s][%(levelname)s] %(message)s"
 DATE_FMT = "%Y-%m-%d %H:%M:%S"
@@ -34,6 +39,120 @@ PARSER.add_argument(
     help="API key if the server uses authentication",
     default=None
 )
+PARSER.add_argument(
+    "--connections",
+    dest="connections",
+    help="Maximum number of concurrent connections to the server",
+    type=int,
+    default=HttpFsClient._DEFAULT_CONNECTIONS
+)
+PARSER.add_argument(
+    "--attr-timeout",
+    dest="attr_timeout",
+    help="Seconds to cache file attributes, 0 to disable",
+    type=float,
+    default=AttrCache._DEFAULT_TTL
+)
+PARSER.add_argument(
+    "--negative-timeout",
+    dest="negative_timeout",
+    help="Seconds to remember that a path doesn't exist, 0 to disable",
+    type=float,
+    default=AttrCache._DEFAULT_NEGATIVE_TTL
+)
+PARSER.add_argument(
+    "--attr-cache-size",
+    dest="attr_cache_size",
+    help="Maximum number of paths in the attribute cache",
+    type=int,
+    default=AttrCache._DEFAULT_MAX_ENTRIES
+)
+PARSER.add_argument(
+    "--block-size",
+    dest="block_size",
+    help="Size in KiB of the blocks that file data is cached in",
+    type=int,
+    default=BlockCache._DEFAULT_BLOCK_SIZE // 1024
+)
+PARSER.add_argument(
+    "--cache-size",
+    dest="cache_size",
+    help="Maximum MiB of file data to cache in memory",
+    type=int,
+    default=BlockCache._DEFAULT_MAX_BYTES // 1024**2
+)
+PARSER.add_argument(
+    "--disk-cache",
+    dest="disk_cache",
+    help="Cache file data in this directory instead of in memory, so it "
+         "is kept across mounts",
+    default=None
+)
+PARSER.add_argument(
+    "--disk-cache-size",
+    dest="disk_cache_size",
+    help="Maximum GiB of file data to keep in the --disk-cache directory",
+    type=int,
+    default=DiskBlockCache._DEFAULT_MAX_BYTES // 1024**3
+)
+PARSER.add_argument(
+    "--readahead",
+    dest="readahead",
+    help="Number of blocks to prefetch for sequential reads, 0 to disable",
+    type=int,
+    default=BlockReader._DEFAULT_WINDOW
+)
+PARSER.add_argument(
+    "--writeback",
+    dest="writeback",
+    help="Buffer writes until files are flushed or closed",
+    action="store_true"
+)
+PARSER.add_argument(
+    "--writeback-limit",
+    dest="writeback_limit",
+    help="Maximum MiB of buffered writes before they are sent",
+    type=int,
+    default=HttpFsClient._DEFAULT_WRITEBACK_LIMIT // 1024**2
+)
+PARSER.add_argument(
+    "--coherent-cache",
+    dest="coherent_cache",
+    help="Let the kernel cache file data and lookups. Cached data is "
+         "dropped when a file's size or mtime has changed on the server "
+         "since it was last opened",
+    action="store_true"
+)
+PARSER.add_argument(
+    "--change-feed",
+    dest="change_feed",
+    help="Subscribe to the server's change notifications, so cached "
+         "attributes of paths changed by others are dropped within "
+         "milliseconds. Allows much longer --attr-timeout values, though "
+         "with --coherent-cache the kernel's own caches stay short-lived",
+    action="store_true"
+)
+PARSER.add_argument(
+    "--compression",
+    dest="compression",
+    help="Compress file data in transit, if the server supports it",
+    action="store_true"
+)
+PARSER.add_argument(
+    "--reconnect-timeout",
+    dest="reconnect_timeout",
+    help="Seconds to keep trying to reach the server after losing the "
+         "connection before failing requests",
+    type=float,
+    default=HttpFsClient._DEFAULT_RECONNECT_TIMEOUT
+)
+PARSER.add_argument(
+    "--metrics-port",
+    dest="metrics_port",
+    help="Serve Prometheus metrics on this local port",
+    type=int,
+    default=None
+)
 PARSER.add_argument(
     "--verbose",
     dest="verbose",
@@ -57,12 +176,53 @@ try:
     [HOSTNAME, port] = ARGS.server.rsplit(':', 1)
     port = int(port)
 
+    if ARGS.disk_cache is not None:
+        block_cache = DiskBlockCache(
+            ARGS.disk_cache,
+            ARGS.server,
+            max_bytes=ARGS.disk_cache_size * 1024**3,
+            block_size=ARGS.block_size * 1024
+        )
+    else:
+        block_cache = BlockCache(
+            max_bytes=ARGS.cache_size * 1024**2,
+            block_size=ARGS.block_size * 1024
+        )
+
+    client = HttpFsClient(
+        HOSTNAME,
+        port,
+        api_key=ARGS.api_key,
+        ca_file=ARGS.ca_file,
+        connections=ARGS.connections,
+        attr_cache=AttrCache(
+            max_entries=ARGS.attr_cache_size,
+            ttl=ARGS.attr_timeout,
+            negative_ttl=ARGS.negative_timeout
+        ),
+        block_cache=block_cache,
+        readahead=ARGS.readahead,
+        writeback=ARGS.writeback,
+        writeback_limit=ARGS.writeback_limit * 1024**2,
+        compression=ARGS.compression,
+        coherent_cache=ARGS.coherent_cache,
+        change_feed=ARGS.change_feed,
+        reconnect_timeout=ARGS.reconnect_timeout
+    )
+
+    if ARGS.metrics_port is not None:
+        metrics = [client.get_metrics()]
+        if ARGS.disk_cache is not None:
+            metrics.append(block_cache)
+        MetricsServer(ARGS.metrics_port, metrics).start()
+
     # Mount the filesystem
     FUSE(
-        HttpFsClient(HOSTNAME, port, api_key=ARGS.api_key, ca_file=ARGS.ca_file),
+        client,
         ARGS.mount,
         foreground=True,
-        allow_other=True
+        allow_other=True,
+        **client.get_mount_options()
     )
 except Exception as exception:
     logging.error("ERROR: %s", exception)
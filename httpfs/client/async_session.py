@@ -0,0 +1,497 @@
+"""
+Contains an asyncio client that talks to an HttpFs server without a mount
+"""
+
+import asyncio
+import errno
+import io
+import logging
+import os
+import secrets
+import zlib
+
+import ujson
+from pytcp_message.message import TcpMessage
+
+from ..common import FuseOpType
+from ..common.compression import PayloadCompressor, get_codec, get_codec_names
+from ..common.wire_protocol import HEADER_SIZE, WIRE_VERSION, Frame, unpack_header
+
+
+class _AsyncConnection:
+    """
+    One binary protocol connection. Requests are written as they are made
+    and their responses, which the server may send in any order, are
+    matched to them by request id
+    """
+
+    def __init__(self, reader, writer, server_ops, compressor):
+        self._reader = reader
+        self._writer = writer
+        self._server_ops = server_ops
+        self._compressor = compressor
+        self._next_request_id = 0
+        self._pending = dict()
+        self._write_lock = asyncio.Lock()
+        self._read_task = asyncio.ensure_future(self._read_responses())
+
+    @staticmethod
+    async def open(server_addr, api_key, compression, timeout, session=None):
+        """
+        Connects and negotiates the binary protocol, joining the connection to
+        session if given
+        :raises ConnectionError: If the server doesn't speak it
+        :return: The _AsyncConnection
+        """
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(*server_addr),
+            timeout
+        )
+        try:
+            hello = {
+                "type": FuseOpType.HELLO,
+                "api_key": api_key,
+                "wire_versions": [WIRE_VERSION],
+                "compression": get_codec_names() if compression else [],
+                "session": session
+            }
+            stream = io.BytesIO()
+            TcpMessage(ujson.dumps(hello).encode("utf-8")).to_stream(stream)
+            writer.write(stream.getvalue())
+            is_compressed = await asyncio.wait_for(reader.readexactly(1), timeout)
+            content_len = int.from_bytes(await reader.readexactly(8), byteorder="little")
+            content = await reader.readexactly(content_len)
+            if is_compressed == b"\x01":
+                content = zlib.decompress(content)
+            response = ujson.loads(content)
+        except (asyncio.IncompleteReadError, ValueError) as excp:
+            writer.close()
+            raise ConnectionError("Server doesn't support the binary protocol") from excp
+        except BaseException:
+            writer.close()
+            raise
+
+        if response["errno"] != 0:
+            writer.close()
+            raise ConnectionError("Server refused the connection: {}".format(response["data"]))
+        if response["data"].get("wire_version") is None:
+            writer.close()
+            raise ConnectionError("Server doesn't support this version of the binary protocol")
+
+        codec = get_codec(response["data"].get("compression"))
+        return _AsyncConnection(
+            reader,
+            writer,
+            frozenset(response["data"].get("ops", [])),
+            PayloadCompressor(codec) if codec is not None else None
+        )
+
+    def supports(self, request_type):
+        return request_type in self._server_ops
+
+    def get_compression(self):
+        if self._compressor is None:
+            return None
+        return self._compressor.get_codec().name
+
+    def in_flight(self):
+        return len(self._pending)
+
+    def is_closed(self):
+        return self._read_task.done()
+
+    async def request(self, request_type, kwargs):
+        """
+        :return: The response as an {"errno", "data"} dict
+        """
+        if self.is_closed():
+            raise BrokenPipeError("Connection to the server is closed")
+
+        self._next_request_id += 1
+        request_id = self._next_request_id
+        frame = Frame.request(request_type, request_id, **kwargs)
+        if self._compressor is not None:
+            frame.compress(self._compressor)
+
+        response = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = response
+        try:
+            async with self._write_lock:
+                self._writer.writelines(frame.to_buffers())
+                await self._writer.drain()
+            return (await response).as_response(self._compressor)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._read_task
+        except Exception as excp:
+            logging.debug("Connection closed with: %s", excp)
+
+    async def _read_responses(self):
+        error = BrokenPipeError("Server closed the connection")
+        try:
+            while True:
+                header = await self._reader.readexactly(HEADER_SIZE)
+                flags, op, frame_errno, request_id, meta_len, payload_len = unpack_header(header)
+                meta = await self._reader.readexactly(meta_len)
+                payload = await self._reader.readexactly(payload_len)
+
+                # Frames the server pushes unasked are of no interest here
+                response = self._pending.get(request_id)
+                if response is not None and not response.done():
+                    response.set_result(Frame(op, request_id, frame_errno, meta, payload, flags))
+
+        except (asyncio.IncompleteReadError, ConnectionError) as excp:
+            logging.debug("Connection to the server lost: %s", excp)
+        except ValueError as excp:
+            error = ConnectionError("Bad frame from the server: {}".format(excp))
+        finally:
+            self._writer.close()
+            for response in self._pending.values():
+                if not response.done():
+                    response.set_exception(error)
+
+
+class AsyncHttpFsSession:
+    """
+    An asyncio client for HttpFs servers, for programs that want to read and
+    write files without going through a FUSE mount.
+
+    Requests are pipelined: any number of coroutines can make requests at
+    once, and each is sent right away on whichever of the session's
+    connections has the fewest requests outstanding. Reads larger than
+    chunk_size are split into chunks that are fetched concurrently. Servers
+    handle a connection's requests concurrently as well, if they are
+    AsyncHttpFsServers, or one at a time otherwise.
+
+    Methods raise OSError with the errno the server reported. Paths are
+    absolute paths on the server.
+    ::
+        async with AsyncHttpFsSession("server", 8080) as session:
+            data = await session.read_file("/data/part-0.parquet")
+    """
+
+    _DEFAULT_CONNECTIONS = 4
+    _DEFAULT_CHUNK_SIZE = 4 * 1024**2
+    _DEFAULT_TIMEOUT = 30
+    _READDIR_PAGE_SIZE = 1024
+
+    def __init__(
+            self,
+            hostname,
+            port,
+            api_key=None,
+            connections=_DEFAULT_CONNECTIONS,
+            chunk_size=_DEFAULT_CHUNK_SIZE,
+            compression=False,
+            timeout=_DEFAULT_TIMEOUT,
+            uid=None,
+            gid=None):
+        """
+        :param hostname: The server to connect to
+        :param port: The server's port
+        :param api_key: Key to use for authentication
+        :param connections: Number of connections to the server
+        :param chunk_size: Reads larger than this many bytes are split into
+            concurrent requests
+        :param compression: Whether to compress file data sent to and from
+            the server, if it supports it
+        :param timeout: Seconds to wait to connect, or for a response
+        :param uid: User to make requests as. The current user by default
+        :param gid: Group to make requests as. The current group by default
+        """
+        self._server_addr = (hostname, port)
+        self._api_key = api_key
+        self._size = connections
+        self._chunk_size = chunk_size
+        self._compression = compression
+        self._timeout = timeout
+        self._uid = uid if uid is not None else os.getuid()
+        self._gid = gid if gid is not None else os.getgid()
+        self._connections = list()
+        self._connect_lock = None
+
+        # Files are used over every connection, so they are owned by a
+        # session rather than by the connection that opened them
+        self._session = secrets.token_hex(16)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def connect(self):
+        """
+        Opens the connections to the server. Called by the first request if
+        it hasn't been
+        :raises OSError: If the server can't be reached
+        """
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+
+        async with self._connect_lock:
+            self._connections = [c for c in self._connections if not c.is_closed()]
+            missing = self._size - len(self._connections)
+            if missing <= 0:
+                return
+
+            self._connections.extend(await asyncio.gather(*[
+                _AsyncConnection.open(
+                    self._server_addr,
+                    self._api_key,
+                    self._compression,
+                    self._timeout,
+                    session=self._session
+                )
+                for _ in range(missing)
+            ]))
+
+    async def close(self):
+        """
+        Closes the connections. File handles left open with the session are
+        closed by the server after its session timeout
+        """
+        connections, self._connections = self._connections, list()
+        await asyncio.gather(*[c.close() for c in connections])
+
+    async def supports(self, request_type):
+        """
+        :param request_type: A FuseOpType
+        :return: Whether the server has a handler for request_type
+        """
+        return (await self._get_connection()).supports(request_type)
+
+    async def get_compression(self):
+        """
+        :return: Name of the negotiated compression codec, or None
+        """
+        return (await self._get_connection()).get_compression()
+
+    async def request(self, request_type, **kwargs):
+        """
+        Sends a request and waits for its response
+        :param request_type: The FuseOpType to send
+        :param kwargs: The arguments for the request
+        :return: The response as an {"errno", "data"} dict
+        """
+        kwargs["api_key"] = self._api_key
+        connection = await self._get_connection()
+        return await asyncio.wait_for(
+            connection.request(request_type, kwargs),
+            self._timeout
+        )
+
+    async def getattr(self, path):
+        """
+        :return: The attributes of path as a dict of st_* values
+        """
+        return await self._call(FuseOpType.GET_ATTR, path=path)
+
+    async def getattr_many(self, paths):
+        """
+        Fetches the attributes of many paths at once. The requests are all
+        sent before any response is awaited, so this takes about one round
+        trip
+        :param paths: Iterable of paths
+        :return: List of attribute dicts in the order of paths, None for
+            paths that don't exist
+        """
+        async def getattr_or_none(path):
+            response = await self.request(FuseOpType.GET_ATTR, path=path)
+            if response["errno"] == errno.ENOENT:
+                return None
+            return AsyncHttpFsSession._check(response, path)
+
+        return await asyncio.gather(*[getattr_or_none(path) for path in paths])
+
+    async def listdir(self, path):
+        """
+        Lists a directory along with the attributes of its entries. Large
+        directories are listed a page at a time where the server supports
+        it
+        :param path: Path of the directory
+        :return: List of (name, attrs) pairs, without "." and ".."
+        """
+        if await self.supports(FuseOpType.READDIR_PAGE):
+            return await self._listdir_pages(path)
+
+        if await self.supports(FuseOpType.READDIR_PLUS):
+            entries = await self._call(FuseOpType.READDIR_PLUS, path=path)
+            return [(name, attrs) for name, attrs in entries if name not in (".", "..")]
+
+        names = [
+            name for name in await self._call(FuseOpType.READDIR, path=path)
+            if name not in (".", "..")
+        ]
+        all_attrs = await self.getattr_many([os.path.join(path, name) for name in names])
+        return [
+            (name, attrs) for name, attrs in zip(names, all_attrs)
+            if attrs is not None
+        ]
+
+    async def open(self, path, flags=os.O_RDONLY):
+        """
+        :param path: Path of the file
+        :param flags: os.O_* flags to open it with
+        :return: A file handle for read(), write() and release()
+        """
+        return await self._call(FuseOpType.OPEN, path=path, flags=flags)
+
+    async def create(self, path, mode=0o644):
+        """
+        Creates a file, or truncates it if it exists, and opens it for
+        writing
+        :param path: Path of the file
+        :param mode: Permission bits of a new file
+        :return: A file handle for write() and release()
+        """
+        return await self._call(FuseOpType.CREATE, path=path, mode=mode)
+
+    async def read(self, fh, size, offset=0):
+        """
+        Reads from an open file
+        :param fh: The file handle
+        :param size: Number of bytes to read
+        :param offset: Offset to start reading at
+        :return: The bytes read, fewer than size at the end of the file
+        """
+        if size <= self._chunk_size:
+            return await self._read_chunk(fh, size, offset)
+
+        chunks = await asyncio.gather(*[
+            self._read_chunk(fh, min(self._chunk_size, offset + size - chunk_offset), chunk_offset)
+            for chunk_offset in range(offset, offset + size, self._chunk_size)
+        ])
+
+        # Everything past a short chunk is past the end of the file
+        for index, chunk in enumerate(chunks):
+            if len(chunk) < self._chunk_size:
+                chunks = chunks[:index + 1]
+                break
+        return b"".join(chunks)
+
+    async def write(self, fh, data, offset=0):
+        """
+        Writes to an open file
+        :param fh: The file handle
+        :param data: The bytes to write
+        :param offset: Offset to start writing at
+        :return: The number of bytes written
+        """
+        return await self._call(FuseOpType.WRITE, file_descriptor=fh, data=data, offset=offset)
+
+    async def release(self, fh):
+        """
+        Closes a file handle
+        """
+        await self._call(FuseOpType.RELEASE, file_descriptor=fh)
+
+    async def read_file(self, path, offset=0, size=None):
+        """
+        Reads a whole file, or part of one
+        :param path: Path of the file
+        :param offset: Offset to start reading at
+        :param size: Number of bytes to read, or None to read to the end
+        :return: The bytes read
+        """
+        fh = await self.open(path)
+        try:
+            if size is None:
+                size = max(0, (await self.getattr(path))["st_size"] - offset)
+            return await self.read(fh, size, offset)
+        finally:
+            await self.release(fh)
+
+    async def write_file(self, path, data, mode=0o644):
+        """
+        Replaces the contents of a file, creating it if needed
+        :param path: Path of the file
+        :param data: The file's new contents
+        :param mode: Permission bits of a new file
+        """
+        fh = await self.create(path, mode)
+        try:
+            await asyncio.gather(*[
+                self.write(fh, data[offset:offset + self._chunk_size], offset)
+                for offset in range(0, len(data), self._chunk_size)
+            ])
+        finally:
+            await self.release(fh)
+
+    async def mkdir(self, path, mode=0o755):
+        """
+        Creates a directory
+        """
+        await self._call(FuseOpType.MKDIR, path=path, mode=mode)
+
+    async def rmdir(self, path):
+        """
+        Removes an empty directory
+        """
+        await self._call(FuseOpType.RM_DIR, path=path)
+
+    async def unlink(self, path):
+        """
+        Removes a file
+        """
+        await self._call(FuseOpType.UNLINK, path=path)
+
+    async def rename(self, old_path, new_path):
+        """
+        Moves a file or directory
+        """
+        await self._call(FuseOpType.RENAME, old_path=old_path, new_path=new_path)
+
+    async def _get_connection(self):
+        """
+        :return: The open connection with the fewest requests in flight
+        """
+        connections = [c for c in self._connections if not c.is_closed()]
+        if len(connections) < self._size:
+            await self.connect()
+            connections = self._connections
+
+        return min(connections, key=lambda connection: connection.in_flight())
+
+    async def _call(self, request_type, **kwargs):
+        """
+        Sends a request as the session's user
+        :raises OSError: If the server reports an error
+        :return: The response's data
+        """
+        response = await self.request(request_type, uid=self._uid, gid=self._gid, **kwargs)
+        return AsyncHttpFsSession._check(response, kwargs.get("path"))
+
+    @staticmethod
+    def _check(response, path=None):
+        if response["errno"] != 0:
+            error = response["errno"]
+            raise OSError(error, str(response["data"] or os.strerror(error)), path)
+        return response["data"]
+
+    async def _read_chunk(self, fh, size, offset):
+        return await self._call(FuseOpType.READ, file_descriptor=fh, size=size, offset=offset)
+
+    async def _listdir_pages(self, path):
+        fh = await self._call(FuseOpType.OPENDIR, path=path)
+        try:
+            entries = list()
+            offset = 0
+            while True:
+                page = await self._call(
+                    FuseOpType.READDIR_PAGE,
+                    file_descriptor=fh,
+                    offset=offset,
+                    count=AsyncHttpFsSession._READDIR_PAGE_SIZE
+                )
+                entries.extend((name, attrs) for name, attrs in page["entries"])
+                if page["eof"]:
+                    return entries
+                offset = page["offset"]
+        finally:
+            await self.release(fh)
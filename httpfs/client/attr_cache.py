@@ -0,0 +1,192 @@
+"""
+Contains a client-side cache for file attributes and access checks
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+#: Returned by AttrCache lookups that have no usable entry
+MISSING = object()
+
+
+class _Entry:
+    __slots__ = ["attrs", "attrs_expire", "access"]
+
+    def __init__(self):
+        self.attrs = MISSING
+        self.attrs_expire = 0
+        # (uid, gid, mode) -> (expire time, allowed)
+        self.access = dict()
+
+
+class AttrCache:
+    """
+    A bounded LRU cache of getattr results keyed by path. Paths that don't
+    exist are remembered as negative entries (attrs of None) with their own,
+    usually shorter, TTL. Access check results are kept alongside the
+    attributes of the same path so they are invalidated together.
+    """
+
+    _DEFAULT_MAX_ENTRIES = 65536
+    _DEFAULT_TTL = 1.0
+    _DEFAULT_NEGATIVE_TTL = 0.5
+
+    def __init__(
+            self,
+            max_entries=_DEFAULT_MAX_ENTRIES,
+            ttl=_DEFAULT_TTL,
+            negative_ttl=_DEFAULT_NEGATIVE_TTL,
+            clock=time.monotonic):
+        """
+        :param max_entries: Maximum number of paths to remember
+        :param ttl: Seconds that attributes stay valid, 0 to disable caching
+        :param negative_ttl: Seconds that a missing path stays cached, 0 to
+            disable negative caching
+        :param clock: Function returning the current time in seconds
+        """
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._on_add = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_ttl(self):
+        """
+        :return: Seconds that attributes stay valid
+        """
+        return self._ttl
+
+    def get_negative_ttl(self):
+        """
+        :return: Seconds that a missing path stays cached
+        """
+        return self._negative_ttl
+
+    def set_on_add(self, on_add):
+        """
+        :param on_add: Function called with a path whenever an entry is
+            created for it, or None
+        """
+        self._on_add = on_add
+
+    def get_generation(self):
+        """
+        :return: A counter that changes on every invalidation. Pass it to the
+            put_* methods so results fetched before an invalidation are
+            not cached after it.
+        """
+        return self._generation
+
+    def get_attrs(self, path):
+        """
+        :param path: Path to look up
+        :return: The cached attribute dict, None if the path is cached as
+            missing, or MISSING if nothing valid is cached
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry.attrs is MISSING:
+                return MISSING
+
+            if entry.attrs_expire <= self._clock():
+                entry.attrs = MISSING
+                return MISSING
+
+            self._entries.move_to_end(path)
+            return entry.attrs
+
+    def put_attrs(self, path, attrs, generation=None):
+        """
+        :param path: Path the attributes belong to
+        :param attrs: The attribute dict, or None if the path doesn't exist
+        :param generation: Value of get_generation() before attrs were fetched
+        """
+        ttl = self._ttl if attrs is not None else self._negative_ttl
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            entry = self._get_or_add(path)
+            entry.attrs = attrs
+            entry.attrs_expire = self._clock() + ttl
+
+    def get_access(self, path, uid, gid, mode):
+        """
+        :return: The cached result of an access check, or MISSING
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                return MISSING
+
+            cached = entry.access.get((uid, gid, mode))
+            if cached is None or cached[0] <= self._clock():
+                return MISSING
+
+            self._entries.move_to_end(path)
+            return cached[1]
+
+    def put_access(self, path, uid, gid, mode, allowed, generation=None):
+        """
+        Caches the result of an access check
+        """
+        if self._ttl <= 0:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            entry = self._get_or_add(path)
+            entry.access[(uid, gid, mode)] = (self._clock() + self._ttl, allowed)
+
+    def invalidate(self, *paths):
+        """
+        Drops everything cached for the given paths
+        """
+        with self._lock:
+            self._generation += 1
+            for path in paths:
+                self._entries.pop(path, None)
+
+    def invalidate_tree(self, path):
+        """
+        Drops everything cached for path and anything below it
+        """
+        prefix = path.rstrip("/") + "/"
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(path, None)
+            for cached_path in [p for p in self._entries if p.startswith(prefix)]:
+                del self._entries[cached_path]
+
+    def clear(self):
+        """
+        Drops all entries
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def _get_or_add(self, path):
+        entry = self._entries.get(path)
+        if entry is None:
+            entry = _Entry()
+            self._entries[path] = entry
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+            if self._on_add is not None:
+                self._on_add(path)
+        else:
+            self._entries.move_to_end(path)
+        return entry
@@ -0,0 +1,138 @@
+"""
+Contains a shared, memory-bounded cache of file blocks
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class BlockCache:
+    """
+    An LRU cache of fixed-size file blocks keyed by (path, version, block
+    number), where the version is the file's (mtime, size) when the reader
+    opened it. A file modified elsewhere is therefore read fresh the next
+    time it is opened. Total memory is capped at max_bytes.
+    """
+
+    _DEFAULT_MAX_BYTES = 64 * 1024**2
+    _DEFAULT_BLOCK_SIZE = 128 * 1024
+
+    def __init__(self, max_bytes=_DEFAULT_MAX_BYTES, block_size=_DEFAULT_BLOCK_SIZE):
+        """
+        :param max_bytes: Maximum number of bytes of file data to keep
+        :param block_size: Size of each block in bytes
+        """
+        if block_size < 1:
+            raise ValueError("Block size must be positive, got {}".format(block_size))
+
+        self._max_bytes = max_bytes
+        self._block_size = block_size
+        self._blocks = OrderedDict()
+        self._keys_by_path = dict()
+        self._size_bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def __contains__(self, key):
+        """
+        :param key: (path, version, block number)
+        """
+        return key in self._blocks
+
+    def get_block_size(self):
+        """
+        :return: The size of each block in bytes
+        """
+        return self._block_size
+
+    def get_size_bytes(self):
+        """
+        :return: Number of bytes of file data currently cached
+        """
+        return self._size_bytes
+
+    def get_generation(self):
+        """
+        :return: A counter that changes on every invalidation. Pass it to
+            put() so blocks fetched before an invalidation are not cached
+            after it.
+        """
+        return self._generation
+
+    def close(self):
+        """
+        Does nothing. Memory is released with the cache
+        """
+
+    def get(self, path, version, block):
+        """
+        :return: The cached block, or None
+        """
+        key = (path, version, block)
+        with self._lock:
+            data = self._blocks.get(key)
+            if data is not None:
+                self._blocks.move_to_end(key)
+            return data
+
+    def put(self, path, version, block, data, generation=None):
+        """
+        Caches a block, evicting the least recently used blocks if the cache
+        is full
+        :param path: Path of the file
+        :param version: The file's (mtime, size) when it was opened
+        :param block: Block number
+        :param data: The block's bytes. Shorter than the block size at EOF
+        :param generation: Value of get_generation() before data was fetched
+        """
+        if len(data) > self._max_bytes:
+            return
+
+        key = (path, version, block)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            old_data = self._blocks.pop(key, None)
+            if old_data is not None:
+                self._size_bytes -= len(old_data)
+
+            self._blocks[key] = data
+            self._keys_by_path.setdefault(path, set()).add(key)
+            self._size_bytes += len(data)
+
+            while self._size_bytes > self._max_bytes:
+                self._remove(next(iter(self._blocks)))
+
+    def invalidate(self, path):
+        """
+        Drops all cached blocks of a file
+        """
+        with self._lock:
+            self._generation += 1
+            for key in list(self._keys_by_path.get(path, [])):
+                self._remove(key)
+
+    def invalidate_tree(self, path):
+        """
+        Drops all cached blocks of path and of every file below it
+        """
+        prefix = path.rstrip("/") + "/"
+        with self._lock:
+            self._generation += 1
+            for cached_path in list(self._keys_by_path):
+                if cached_path == path or cached_path.startswith(prefix):
+                    for key in list(self._keys_by_path[cached_path]):
+                        self._remove(key)
+
+    def _remove(self, key):
+        data = self._blocks.pop(key)
+        self._size_bytes -= len(data)
+
+        path_keys = self._keys_by_path[key[0]]
+        path_keys.discard(key)
+        if not path_keys:
+            del self._keys_by_path[key[0]]
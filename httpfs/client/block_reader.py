@@ -0,0 +1,138 @@
+"""
+Contains a per-file-handle reader that reads through the block cache
+"""
+
+import logging
+import threading
+
+
+class BlockReader:
+    """
+    Serves reads for one open file handle from a BlockCache. When the handle
+    is being read sequentially, the next blocks are fetched in the
+    background so the following reads don't wait on the network.
+    """
+
+    _DEFAULT_WINDOW = 8
+
+    def __init__(self, cache, path, version, file_size, executor=None, window=_DEFAULT_WINDOW):
+        """
+        :param cache: The shared BlockCache or DiskBlockCache
+        :param path: Path of the open file
+        :param version: The file's (mtime, size) when it was opened
+        :param file_size: Size of the file when it was opened. Blocks past
+            the end are not prefetched
+        :param executor: concurrent.futures.Executor for prefetching, or None
+            to disable read-ahead
+        :param window: Number of blocks to prefetch ahead of a sequential
+            reader
+        """
+        self._cache = cache
+        self._path = path
+        self._version = version
+        self._file_size = file_size
+        self._executor = executor
+        self._window = window if executor is not None else 0
+        self._block_size = cache.get_block_size()
+        self._next_offset = 0
+        self._pending = dict()
+        self._lock = threading.Lock()
+
+    def get_path(self):
+        """
+        :return: Path of the open file
+        """
+        return self._path
+
+    def read(self, size, offset, fetch):
+        """
+        Reads size bytes at offset
+        :param size: Number of bytes to read
+        :param offset: Offset to start reading at
+        :param fetch: fetch(offset, size) -> bytes. Reads from the server
+        :return: The bytes read, fewer than size at EOF
+        """
+        if size <= 0:
+            return b""
+
+        first_block = offset // self._block_size
+        last_block = (offset + size - 1) // self._block_size
+
+        with self._lock:
+            is_sequential = offset == self._next_offset
+            self._next_offset = offset + size
+
+        if is_sequential and self._window > 0:
+            self._prefetch(
+                first_block,
+                last_block + 1,
+                last_block + self._window,
+                fetch
+            )
+
+        blocks = list()
+        for block in range(first_block, last_block + 1):
+            data = self._get_block(block, fetch)
+            blocks.append(data)
+            if len(data) < self._block_size:
+                break
+
+        start = offset - first_block * self._block_size
+        if len(blocks) == 1:
+            data = blocks[0]
+            if start == 0 and len(data) <= size:
+                return data
+            return data[start:start + size]
+
+        return b"".join(blocks)[start:start + size]
+
+    def close(self):
+        """
+        Cancels any outstanding prefetches
+        """
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+
+    def _get_block(self, block, fetch):
+        data = self._cache.get(self._path, self._version, block)
+        if data is not None:
+            return data
+
+        with self._lock:
+            future = self._pending.pop(block, None)
+
+        if future is not None:
+            try:
+                return future.result()
+            except Exception as excp:
+                # Let the synchronous fetch below report the error
+                logging.debug("Prefetch of block %d failed: %s", block, excp)
+
+        return self._fetch_block(block, fetch)
+
+    def _fetch_block(self, block, fetch):
+        generation = self._cache.get_generation()
+        data = fetch(block * self._block_size, self._block_size)
+        self._cache.put(self._path, self._version, block, data, generation=generation)
+        return data
+
+    def _prefetch(self, oldest_needed, first_block, last_block, fetch):
+        last_block = min(last_block, (self._file_size - 1) // self._block_size)
+
+        with self._lock:
+            # Forget prefetches the reader has moved past
+            for block in [b for b in self._pending if b < oldest_needed]:
+                self._pending.pop(block).cancel()
+
+            for block in range(first_block, last_block + 1):
+                if block in self._pending:
+                    continue
+                if (self._path, self._version, block) in self._cache:
+                    continue
+                self._pending[block] = self._executor.submit(
+                    self._fetch_block,
+                    block,
+                    fetch
+                )
@@ -0,0 +1,501 @@
+"""
+Contains a class that copies files and directory trees to and from an
+HttpFs server
+"""
+
+import errno
+import logging
+import os
+import secrets
+import socket
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .connection import HttpFsConnection
+from .connection_pool import HttpFsConnectionPool
+from ..common import FuseOpType
+
+
+class _FileCopy:
+    """
+    A file being copied in chunks. The last chunk to finish closes it
+    """
+
+    __slots__ = ("source", "dest", "size", "mtime", "fh", "fd", "remaining", "error", "lock")
+
+    def __init__(self, source, dest, size, mtime):
+        self.source = source
+        self.dest = dest
+        self.size = size
+        self.mtime = mtime
+        self.fh = None
+        self.fd = None
+        self.remaining = 0
+        self.error = None
+        self.lock = threading.Lock()
+
+
+class BulkCopy:
+    """
+    Copies files and directory trees to and from an HttpFs server, talking
+    to it directly instead of through a FUSE mount. Files are split into
+    chunks that are transferred over several connections at once, and
+    directories are listed concurrently, so a single copy can keep many
+    requests in flight.
+
+    get() and put() only queue work. Call wait() to block until it is done,
+    or close(cancel=True) to drop what is still queued.
+    Copied files keep their source's mtime, so a later copy with
+    only_changed=True skips files whose size and mtime match. Like cp, a
+    plain copy into an existing directory is placed inside it, while with
+    only_changed the destination is the copy itself, so repeating a copy
+    updates it in place like rsync.
+    """
+
+    _DEFAULT_CONNECTIONS = 8
+    _DEFAULT_CHUNK_SIZE = 4 * 1024**2
+    _RETRIES = 3
+
+    def __init__(
+            self,
+            hostname,
+            port,
+            api_key=None,
+            connections=_DEFAULT_CONNECTIONS,
+            chunk_size=_DEFAULT_CHUNK_SIZE,
+            compression=False):
+        """
+        :param hostname: The server to connect to
+        :param port: The server's port
+        :param api_key: Key to use for authentication
+        :param connections: Number of connections, and of requests in flight
+        :param chunk_size: Size in bytes of each READ or WRITE request
+        :param compression: Whether to compress file data sent to and from
+            the server, if it supports it
+        """
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive, got {}".format(chunk_size))
+
+        self._chunk_size = chunk_size
+        self._uid = os.getuid()
+        self._gid = os.getgid()
+        # Files are opened on one connection and copied over all of them, so
+        # the connections share a session that owns the open files
+        self._pool = HttpFsConnectionPool(
+            (hostname, port),
+            size=connections,
+            api_key=api_key,
+            compression=compression,
+            session=secrets.token_hex(16)
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=connections,
+            thread_name_prefix="httpfs-copy"
+        )
+
+        self._pending = 0
+        self._cancelled = False
+        self._open_copies = set()
+        self._done = threading.Condition()
+        self._files_copied = 0
+        self._files_skipped = 0
+        self._bytes_copied = 0
+        self._errors = list()
+        self._start_time = time.monotonic()
+
+    def close(self, cancel=False):
+        """
+        Waits for queued work and closes all connections
+        :param cancel: Whether to drop queued work rather than wait for it.
+            Requests already in flight are still waited for
+        """
+        if cancel:
+            self._cancelled = True
+            if sys.version_info >= (3, 9):
+                self._executor.shutdown(wait=True, cancel_futures=True)
+
+        # Queued work still run on Python 3.8 returns at once when cancelled
+        self._executor.shutdown(wait=True)
+
+        # Files whose remaining chunks were dropped. The server closes its
+        # side once the session's connections are gone
+        for file_copy in self._open_copies:
+            os.close(file_copy.fd)
+        self._open_copies.clear()
+        self._pool.close()
+
+    def get(self, remote_path, local_path, only_changed=False):
+        """
+        Queues copying a file or directory tree from the server
+        :param remote_path: Path on the server
+        :param local_path: Local destination
+        :param only_changed: Whether to skip files that already exist at the
+            destination with the same size and mtime
+        """
+        attrs = self._request(FuseOpType.GET_ATTR, path=remote_path)
+        if not only_changed and os.path.isdir(local_path):
+            local_path = os.path.join(local_path, os.path.basename(remote_path.rstrip("/")))
+
+        if stat.S_ISDIR(attrs["st_mode"]):
+            self._submit(self._get_dir, remote_path, local_path, only_changed)
+        else:
+            self._submit(self._get_file, remote_path, local_path, attrs, only_changed)
+
+    def put(self, local_path, remote_path, only_changed=False):
+        """
+        Queues copying a local file or directory tree to the server
+        :param local_path: Local path
+        :param remote_path: Destination path on the server
+        :param only_changed: Whether to skip files that already exist at the
+            destination with the same size and mtime
+        """
+        local_stats = os.stat(local_path)
+        remote_attrs = self._get_attrs(remote_path)
+        if not only_changed and remote_attrs is not None and stat.S_ISDIR(remote_attrs["st_mode"]):
+            remote_path = "/".join([
+                remote_path.rstrip("/"),
+                os.path.basename(os.path.abspath(local_path))
+            ])
+            remote_attrs = self._get_attrs(remote_path)
+
+        if stat.S_ISDIR(local_stats.st_mode):
+            self._submit(self._put_dir, local_path, remote_path, only_changed)
+        else:
+            self._submit(
+                self._put_file,
+                local_path,
+                remote_path,
+                local_stats,
+                remote_attrs if only_changed else None
+            )
+
+    def wait(self, timeout=None):
+        """
+        :param timeout: Seconds to wait, or None to wait until done
+        :return: Whether all queued work is done
+        """
+        with self._done:
+            return self._done.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def get_stats(self):
+        """
+        :return: (files copied, files skipped, bytes copied, seconds since
+            the copier was created)
+        """
+        return (
+            self._files_copied,
+            self._files_skipped,
+            self._bytes_copied,
+            time.monotonic() - self._start_time
+        )
+
+    def get_errors(self):
+        """
+        :return: Messages for the files that couldn't be copied
+        """
+        return list(self._errors)
+
+    def _submit(self, func, *args):
+        with self._done:
+            self._pending += 1
+        self._executor.submit(self._run, func, *args)
+
+    def _run(self, func, *args):
+        try:
+            if not self._cancelled:
+                func(*args)
+        except Exception as excp:
+            self._report_error(excp)
+        finally:
+            with self._done:
+                self._pending -= 1
+                if self._pending == 0:
+                    self._done.notify_all()
+
+    def _report_error(self, excp):
+        logging.error("%s", excp)
+        self._errors.append(str(excp))
+
+    def _request(self, request_type, **kwargs):
+        """
+        Sends a request over a pooled connection. Like HttpFsClient, it is
+        retried on connection errors if it wasn't sent yet, or if handling
+        it twice does no harm, but not once it has timed out
+        :raises OSError: If the server reports an error
+        :return: The response data
+        """
+        idempotent = HttpFsConnection.is_idempotent(request_type, kwargs)
+        for attempt in range(BulkCopy._RETRIES):
+            sent = False
+            try:
+                with self._pool.connection() as connection:
+                    sent = True
+                    response = connection.request(
+                        request_type,
+                        uid=self._uid,
+                        gid=self._gid,
+                        **kwargs
+                    )
+                break
+            except (ConnectionError, socket.timeout) as excp:
+                # A timed-out request is most likely still being handled
+                retry = not sent or (idempotent and not isinstance(excp, socket.timeout))
+                if not retry or attempt == BulkCopy._RETRIES - 1:
+                    raise
+                logging.info("Retrying %s: %s", request_type.name, excp)
+
+        if response["errno"] != 0:
+            raise OSError(
+                response["errno"],
+                "{} failed: {}".format(
+                    request_type.name,
+                    response["data"] or os.strerror(response["errno"])
+                ),
+                kwargs.get("path")
+            )
+        return response["data"]
+
+    def _get_attrs(self, remote_path):
+        try:
+            return self._request(FuseOpType.GET_ATTR, path=remote_path)
+        except OSError as excp:
+            if excp.errno == errno.ENOENT:
+                return None
+            raise
+
+    def _list_remote(self, remote_path):
+        """
+        :return: List of (name, attrs) in a remote directory
+        """
+        if self._pool.supports(FuseOpType.READDIR_PLUS):
+            listing = self._request(FuseOpType.READDIR_PLUS, path=remote_path)
+            return [(name, attrs) for name, attrs in listing if name not in (".", "..")]
+
+        listing = list()
+        for name in self._request(FuseOpType.READDIR, path=remote_path):
+            if name not in (".", ".."):
+                attrs = self._get_attrs("/".join([remote_path.rstrip("/"), name]))
+                if attrs is not None:
+                    listing.append((name, attrs))
+        return listing
+
+    @staticmethod
+    def _is_unchanged(size, mtime, other_size, other_mtime):
+        return size == other_size and int(mtime) == int(other_mtime)
+
+    def _count_copied(self):
+        with self._done:
+            self._files_copied += 1
+
+    def _count_bytes(self, size):
+        with self._done:
+            self._bytes_copied += size
+
+    def _count_skipped(self):
+        with self._done:
+            self._files_skipped += 1
+
+    # Downloads
+
+    def _get_dir(self, remote_path, local_path, only_changed):
+        os.makedirs(local_path, exist_ok=True)
+
+        for name, attrs in self._list_remote(remote_path):
+            remote_child = "/".join([remote_path.rstrip("/"), name])
+            local_child = os.path.join(local_path, name)
+
+            if stat.S_ISDIR(attrs["st_mode"]):
+                self._submit(self._get_dir, remote_child, local_child, only_changed)
+            elif stat.S_ISREG(attrs["st_mode"]):
+                self._submit(self._get_file, remote_child, local_child, attrs, only_changed)
+            else:
+                logging.warning("Skipping %s, which isn't a regular file", remote_child)
+
+    def _get_file(self, remote_path, local_path, attrs, only_changed):
+        size = attrs["st_size"]
+        if only_changed:
+            try:
+                local_stats = os.stat(local_path)
+                if BulkCopy._is_unchanged(size, attrs["st_mtime"], local_stats.st_size, local_stats.st_mtime):
+                    self._count_skipped()
+                    return
+            except FileNotFoundError:
+                pass
+
+        file_copy = _FileCopy(remote_path, local_path, size, attrs["st_mtime"])
+        file_copy.fh = self._request(FuseOpType.OPEN, path=remote_path, flags=os.O_RDONLY)
+        try:
+            file_copy.fd = os.open(
+                local_path,
+                os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                stat.S_IMODE(attrs["st_mode"])
+            )
+            os.ftruncate(file_copy.fd, size)
+        except BaseException:
+            self._finish_get(file_copy)
+            raise
+
+        self._copy_chunks(file_copy, self._get_chunk, self._finish_get)
+
+    def _get_chunk(self, file_copy, offset, size):
+        data = self._request(
+            FuseOpType.READ,
+            file_descriptor=file_copy.fh,
+            offset=offset,
+            size=size
+        )
+        os.pwrite(file_copy.fd, data, offset)
+        self._count_bytes(len(data))
+
+    def _finish_get(self, file_copy):
+        try:
+            self._request(FuseOpType.RELEASE, file_descriptor=file_copy.fh)
+        finally:
+            if file_copy.fd is not None:
+                if file_copy.error is None:
+                    os.utime(file_copy.fd, (file_copy.mtime, file_copy.mtime))
+                os.close(file_copy.fd)
+
+    # Uploads
+
+    def _put_dir(self, local_path, remote_path, only_changed):
+        remote_attrs = self._get_attrs(remote_path)
+        if remote_attrs is None:
+            self._request(
+                FuseOpType.MKDIR,
+                path=remote_path,
+                mode=stat.S_IMODE(os.stat(local_path).st_mode)
+            )
+            remote_listing = dict()
+        elif only_changed:
+            remote_listing = dict(self._list_remote(remote_path))
+        else:
+            remote_listing = dict()
+
+        with os.scandir(local_path) as entries:
+            for entry in entries:
+                remote_child = "/".join([remote_path.rstrip("/"), entry.name])
+
+                if entry.is_dir(follow_symlinks=False):
+                    self._submit(self._put_dir, entry.path, remote_child, only_changed)
+                elif entry.is_file(follow_symlinks=False):
+                    self._submit(
+                        self._put_file,
+                        entry.path,
+                        remote_child,
+                        entry.stat(),
+                        remote_listing.get(entry.name)
+                    )
+                else:
+                    logging.warning("Skipping %s, which isn't a regular file", entry.path)
+
+    def _put_file(self, local_path, remote_path, local_stats, remote_attrs):
+        """
+        :param remote_attrs: Attributes of the existing remote file to
+            compare against, or None to always copy
+        """
+        size = local_stats.st_size
+        if remote_attrs is not None and BulkCopy._is_unchanged(
+                size,
+                local_stats.st_mtime,
+                remote_attrs["st_size"],
+                remote_attrs["st_mtime"]):
+            self._count_skipped()
+            return
+
+        file_copy = _FileCopy(local_path, remote_path, size, local_stats.st_mtime)
+        file_copy.fd = os.open(local_path, os.O_RDONLY)
+        try:
+            file_copy.fh = self._request(
+                FuseOpType.CREATE,
+                path=remote_path,
+                mode=stat.S_IMODE(local_stats.st_mode)
+            )
+        except BaseException:
+            os.close(file_copy.fd)
+            raise
+
+        self._copy_chunks(file_copy, self._put_chunk, self._finish_put)
+
+    def _put_chunk(self, file_copy, offset, size):
+        data = os.pread(file_copy.fd, size, offset)
+        self._request(
+            FuseOpType.WRITE,
+            file_descriptor=file_copy.fh,
+            data=data,
+            offset=offset
+        )
+        self._count_bytes(len(data))
+
+    def _finish_put(self, file_copy):
+        try:
+            self._request(FuseOpType.RELEASE, file_descriptor=file_copy.fh)
+            if file_copy.error is None:
+                self._request(
+                    FuseOpType.UTIMENS,
+                    path=file_copy.dest,
+                    times=(file_copy.mtime, file_copy.mtime)
+                )
+        finally:
+            os.close(file_copy.fd)
+
+    # Chunking
+
+    def _copy_chunks(self, file_copy, copy_chunk, finish):
+        """
+        Queues every chunk of a file. The last chunk to finish calls
+        finish(file_copy)
+        """
+        offsets = range(0, file_copy.size, self._chunk_size)
+        if not offsets:
+            self._finish_file(file_copy, finish)
+            return
+
+        file_copy.remaining = len(offsets)
+        with self._done:
+            self._open_copies.add(file_copy)
+        for offset in offsets:
+            self._submit(
+                self._copy_chunk,
+                file_copy,
+                copy_chunk,
+                finish,
+                offset,
+                min(self._chunk_size, file_copy.size - offset)
+            )
+
+    def _copy_chunk(self, file_copy, copy_chunk, finish, offset, size):
+        try:
+            if file_copy.error is None:
+                copy_chunk(file_copy, offset, size)
+        except Exception as excp:
+            with file_copy.lock:
+                if file_copy.error is None:
+                    file_copy.error = excp
+        finally:
+            with file_copy.lock:
+                file_copy.remaining -= 1
+                is_last = file_copy.remaining == 0
+
+        if is_last:
+            self._finish_file(file_copy, finish)
+
+    def _finish_file(self, file_copy, finish):
+        with self._done:
+            self._open_copies.discard(file_copy)
+        try:
+            finish(file_copy)
+        finally:
+            if file_copy.error is not None:
+                self._report_error(
+                    "Couldn't copy {} to {}: {}".format(
+                        file_copy.source,
+                        file_copy.dest,
+                        file_copy.error
+                    )
+                )
+            else:
+                self._count_copied()
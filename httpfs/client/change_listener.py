@@ -0,0 +1,189 @@
+"""
+Contains the client side of the server's change feed
+"""
+
+import errno
+import logging
+import threading
+import time
+
+import ujson
+
+from .connection import HttpFsConnection
+from ..common import FuseOpType
+
+
+class ChangeListener:
+    """
+    Keeps a connection to the server subscribed to changes of the paths the
+    client caches, and passes on the invalidations the server pushes.
+    Paths given to watch() are sent in batches. If the connection drops,
+    changes may have been missed, so everything is invalidated once it is
+    reconnected. If the server can't send changes, the listener gives up and
+    stops queueing paths.
+    """
+
+    _BATCH_DELAY = 0.005
+    _KEEPALIVE_INTERVAL = 60
+    _RECONNECT_DELAY = 1
+
+    def __init__(self, server_addr, on_invalidate, api_key=None):
+        """
+        :param server_addr: (hostname, port) of the server
+        :param on_invalidate: Function called with (paths, trees) when the
+            server reports changes: paths whose cached attributes or data
+            are stale, and directories to drop everything below. Both are
+            None when everything must be dropped
+        :param api_key: Key to use for authentication
+        """
+        self._server_addr = server_addr
+        self._on_invalidate = on_invalidate
+        self._api_key = api_key
+        self._pending = list()
+        self._running = False
+        self._supported = True
+        self._connection = None
+        self._disconnected = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts subscribing in a background thread
+        """
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run,
+            name="httpfs-change-listener",
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Closes the subscription
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+            if self._connection is not None:
+                self._connection.close()
+
+        if self._thread is not None:
+            self._thread.join()
+
+    def watch(self, path):
+        """
+        Asks to be told when path changes
+        :param path: Path on the server
+        """
+        with self._cond:
+            if not self._supported:
+                return
+            self._pending.append(path)
+            if len(self._pending) == 1:
+                self._cond.notify()
+
+    def _give_up(self):
+        """
+        Stops subscribing for good, because the server can't send changes
+        """
+        logging.warning("Server doesn't support change notifications")
+        with self._cond:
+            self._supported = False
+            self._pending = list()
+            self._disconnected = True
+            self._cond.notify()
+
+    def _run(self):
+        while self._running and self._supported:
+            try:
+                connection = HttpFsConnection(
+                    self._server_addr,
+                    api_key=self._api_key,
+                    timeout=None
+                )
+            except OSError as excp:
+                logging.warning("Couldn't connect for change notifications: %s", excp)
+                time.sleep(ChangeListener._RECONNECT_DELAY)
+                continue
+
+            if connection.get_wire_version() is None or not connection.supports(FuseOpType.SUBSCRIBE):
+                connection.close()
+                self._give_up()
+                return
+
+            with self._cond:
+                self._connection = connection
+                self._disconnected = False
+            reader = threading.Thread(
+                target=self._read,
+                args=(connection,),
+                name="httpfs-change-reader",
+                daemon=True
+            )
+            reader.start()
+
+            # Anything cached so far may have changed without a word
+            self._on_invalidate(None, None)
+
+            try:
+                self._send_paths(connection)
+            except OSError as excp:
+                logging.warning("Change notification connection lost: %s", excp)
+            finally:
+                connection.close()
+                reader.join()
+                with self._cond:
+                    self._connection = None
+
+            if self._running and self._supported:
+                time.sleep(ChangeListener._RECONNECT_DELAY)
+
+    def _send_paths(self, connection):
+        while True:
+            with self._cond:
+                if not self._pending and self._running and not self._disconnected:
+                    self._cond.wait(ChangeListener._KEEPALIVE_INTERVAL)
+                if not self._running or self._disconnected:
+                    return
+
+            # Gives paths cached together a chance to go out together
+            time.sleep(ChangeListener._BATCH_DELAY)
+            with self._cond:
+                paths, self._pending = self._pending, list()
+
+            # An empty list keeps the server from timing the connection out
+            connection.send(FuseOpType.SUBSCRIBE, paths=paths)
+
+    def _read(self, connection):
+        failed = False
+        try:
+            while True:
+                frame = connection.receive()
+                if frame is None:
+                    break
+
+                if frame.op == FuseOpType.INVALIDATE:
+                    invalidation = ujson.loads(frame.meta)
+                    if invalidation.get("all"):
+                        self._on_invalidate(None, None)
+                    else:
+                        self._on_invalidate(invalidation["paths"], invalidation["trees"])
+                elif frame.errno == errno.ENOTSUP:
+                    # e.g. the server runs with the change feed disabled
+                    self._give_up()
+                    break
+                elif frame.errno != 0 and not failed:
+                    # Every later batch likely fails the same way
+                    failed = True
+                    logging.warning(
+                        "Subscribing to changes failed: %s",
+                        frame.as_response()["data"]
+                    )
+        except (OSError, ValueError) as excp:
+            logging.debug("Change notification reader stopped: %s", excp)
+        finally:
+            with self._cond:
+                self._disconnected = True
+                self._cond.notify()
@@ -0,0 +1,313 @@
+"""
+Contains a class that manages a single connection to an HttpFs server
+"""
+
+import base64
+import logging
+import os
+import socket
+
+import ujson
+from pytcp_message.message import TcpMessage
+
+from ..common import FuseOpType
+from ..common.compression import PayloadCompressor, get_codec, get_codec_names
+from ..common.wire_protocol import WIRE_VERSION, Frame, send_frame
+
+
+class HttpFsConnection:
+    """
+    A connection to an HttpFs server. On connect, the client and server
+    negotiate whether to use the binary frame protocol. Servers that don't
+    understand the negotiation are talked to with JSON messages. With
+    compression on, a codec for file data payloads is negotiated as well.
+    """
+
+    _DEFAULT_TIMEOUT = 3
+
+    #: Requests that can be sent again if the connection drops before their
+    #: response arrives. Handling them twice has the same effect as once, or
+    #: at worst leaves a handle open on the server. CREATE isn't one, since
+    #: it truncates the file again, and its first handle stays open until
+    #: unmount
+    _IDEMPOTENT_OPS = frozenset([
+        FuseOpType.ACCESS,
+        FuseOpType.CHMOD,
+        FuseOpType.CHOWN,
+        FuseOpType.FLUSH,
+        FuseOpType.FSYNC,
+        FuseOpType.GET_ATTR,
+        FuseOpType.OPENDIR,
+        FuseOpType.READ,
+        FuseOpType.READDIR,
+        FuseOpType.READDIR_PAGE,
+        FuseOpType.READDIR_PLUS,
+        FuseOpType.READLINK,
+        FuseOpType.RELEASE,
+        FuseOpType.STAT_FS,
+        FuseOpType.TRUNCATE,
+        FuseOpType.UTIMENS,
+        FuseOpType.WRITE
+    ])
+
+    def __init__(
+            self,
+            server_addr,
+            api_key=None,
+            binary=True,
+            timeout=_DEFAULT_TIMEOUT,
+            compression=False,
+            metrics=None,
+            session=None):
+        """
+        :param server_addr: (hostname, port) of the server
+        :param api_key: Key to use for authentication
+        :param binary: Whether to offer the binary protocol to the server
+        :param timeout: Seconds to wait for the server before giving up
+        :param compression: Whether to offer to compress file data payloads
+        :param metrics: Optional OpMetrics to record compression ratios in
+        :param session: Optional session id. Files opened over connections of
+            the same session stay open on the server for a while after the
+            connections drop
+        """
+        self._server_addr = server_addr
+        self._api_key = api_key
+        self._binary = binary
+        self._timeout = timeout
+        self._compression = compression
+        self._metrics = metrics
+        self._session = session
+        self._compressor = None
+        self._socket = None
+        self._rfile = None
+        self._wfile = None
+        self._wire_version = None
+        self._server_ops = frozenset()
+        self._next_request_id = 0
+        self.connect()
+
+    def connect(self):
+        """
+        Opens a new connection to the server, closing any existing one
+        """
+        self.close()
+        self._open_socket()
+        self._wire_version = None
+        self._server_ops = frozenset()
+        self._compressor = None
+
+        if self._binary:
+            self._negotiate()
+
+    def close(self):
+        """
+        Closes the connection to the server
+        """
+        if self._socket is None:
+            return
+
+        # Shut down first, so a receive() blocked on another thread returns
+        # instead of holding the reader's lock
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+            self._rfile.close()
+            self._wfile.close()
+        except OSError:
+            pass
+        finally:
+            self._socket.close()
+            self._socket = None
+
+    def is_alive(self):
+        """
+        Checks, without blocking, that the server hasn't closed the
+        connection, as it does when it restarts. Idle connections should be
+        checked before they are reused, since a request sent over a closed
+        connection may or may not have been handled
+        :return: Whether the connection is open and has nothing unexpected
+            waiting to be read
+        """
+        if self._socket is None:
+            return False
+
+        # Sockets with a timeout wait for data even when asked not to
+        self._socket.settimeout(0)
+        try:
+            self._socket.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        finally:
+            self._socket.settimeout(self._timeout)
+
+        # Either the server hung up or sent something no one asked for
+        return False
+
+    def get_wire_version(self):
+        """
+        :return: The negotiated binary protocol version, or None if the
+            connection uses JSON
+        """
+        return self._wire_version
+
+    def get_compression(self):
+        """
+        :return: Name of the negotiated compression codec, or None
+        """
+        if self._compressor is None:
+            return None
+        return self._compressor.get_codec().name
+
+    def supports(self, request_type):
+        """
+        :param request_type: A FuseOpType
+        :return: Whether the server reported a handler for request_type.
+            Servers that predate negotiation only have the original ops
+        """
+        if not self._server_ops:
+            return request_type <= FuseOpType.CHMOD
+        return request_type in self._server_ops
+
+    @staticmethod
+    def is_idempotent(request_type, kwargs):
+        """
+        :param request_type: A FuseOpType
+        :param kwargs: The request's arguments
+        :return: Whether a request can be sent again if the connection drops
+            while it is in flight
+        """
+        if request_type in HttpFsConnection._IDEMPOTENT_OPS:
+            return True
+        if request_type == FuseOpType.OPEN:
+            return not kwargs.get("flags", 0) & os.O_EXCL
+        if request_type == FuseOpType.COMPOUND:
+            return all(
+                HttpFsConnection.is_idempotent(sub_op["type"], sub_op)
+                for sub_op in kwargs.get("ops", [])
+            )
+        return False
+
+    def request(self, request_type, **kwargs):
+        """
+        Sends a request and waits for its response
+        :param request_type: The FuseOpType to send
+        :param kwargs: The arguments for the request. A bytes "data" argument
+            is sent as-is over the binary protocol
+        :return: The response as an {"errno", "data"} dict. Read data is
+            always returned as bytes
+        """
+        if self._socket is None:
+            raise BrokenPipeError("Not connected to {}:{}".format(*self._server_addr))
+
+        kwargs["api_key"] = self._api_key
+
+        if self._wire_version is not None:
+            return self._binary_request(request_type, **kwargs)
+        return self._json_request(request_type, **kwargs)
+
+    def send(self, request_type, **kwargs):
+        """
+        Sends a binary protocol request without waiting for its response,
+        for connections whose frames are read with receive(), possibly on
+        another thread
+        :param request_type: The FuseOpType to send
+        :param kwargs: The arguments for the request
+        :return: The request id the response will carry
+        """
+        if self._socket is None or self._wire_version is None:
+            raise BrokenPipeError("No binary connection to {}:{}".format(*self._server_addr))
+
+        kwargs["api_key"] = self._api_key
+        self._next_request_id += 1
+        send_frame(self._socket, Frame.request(request_type, self._next_request_id, **kwargs))
+        return self._next_request_id
+
+    def receive(self):
+        """
+        :return: The next Frame from the server, a response or a pushed
+            frame such as an invalidation, or None if the connection closed
+        """
+        return Frame.from_stream(self._rfile)
+
+    def _open_socket(self):
+        self._socket = socket.create_connection(
+            self._server_addr,
+            timeout=self._timeout
+        )
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._rfile = self._socket.makefile("rb")
+        self._wfile = self._socket.makefile("wb")
+
+    def _negotiate(self):
+        """
+        Offers the binary protocol to the server and records the wire version,
+        ops and compression codec the server supports
+        """
+        try:
+            response = self._json_request(
+                FuseOpType.HELLO,
+                api_key=self._api_key,
+                wire_versions=[WIRE_VERSION],
+                compression=get_codec_names() if self._compression else [],
+                session=self._session
+            )
+            if response["errno"] == 0:
+                self._wire_version = response["data"]["wire_version"]
+                self._server_ops = frozenset(response["data"].get("ops", []))
+
+                # Servers that predate compression don't answer with a codec
+                codec = get_codec(response["data"].get("compression"))
+                if codec is not None:
+                    self._compressor = PayloadCompressor(codec, metrics=self._metrics)
+
+        except (OSError, ValueError, KeyError, TypeError) as excp:
+            # Older servers drop the connection on unknown ops
+            logging.info(
+                "Server doesn't support the binary protocol (%s), using JSON",
+                excp
+            )
+            self.close()
+            self._open_socket()
+
+    def _binary_request(self, request_type, **kwargs):
+        self._next_request_id += 1
+        request_id = self._next_request_id
+
+        frame = Frame.request(request_type, request_id, **kwargs)
+        if self._compressor is not None:
+            frame.compress(self._compressor)
+
+        send_frame(self._socket, frame)
+        response = Frame.from_stream(self._rfile)
+
+        if response is None:
+            raise BrokenPipeError("Server closed the connection")
+        if response.request_id != request_id:
+            raise ConnectionError(
+                "Expected response {}, got {}".format(
+                    request_id,
+                    response.request_id
+                )
+            )
+
+        return response.as_response(self._compressor)
+
+    def _json_request(self, request_type, **kwargs):
+        if isinstance(kwargs.get("data"), (bytes, bytearray, memoryview)):
+            kwargs["data"] = base64.standard_b64encode(kwargs["data"]).decode("utf-8")
+
+        request = {"type": request_type, **kwargs}
+        TcpMessage(ujson.dumps(request).encode("utf-8")).to_stream(self._wfile)
+
+        response = TcpMessage.from_stream(self._rfile)
+        if response is None:
+            raise BrokenPipeError("Server closed the connection")
+
+        response = ujson.loads(response.get_content())
+
+        # JSON servers send file contents base64 encoded
+        if request_type == FuseOpType.READ and response["errno"] == 0:
+            response["data"] = base64.standard_b64decode(response["data"])
+
+        return response
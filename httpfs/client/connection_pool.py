@@ -0,0 +1,126 @@
+"""
+Contains a thread-safe pool of connections to an HttpFs server
+"""
+
+import queue
+import threading
+from contextlib import contextmanager
+
+from .connection import HttpFsConnection
+
+
+class HttpFsConnectionPool:
+    """
+    A bounded pool of HttpFsConnections. fusepy calls the client from many
+    threads at once; each thread checks out its own connection so requests
+    never share a socket, and up to `size` requests can be in flight.
+    Connections are opened lazily and reused.
+    """
+
+    def __init__(
+            self,
+            server_addr,
+            size=1,
+            api_key=None,
+            binary=True,
+            compression=False,
+            metrics=None,
+            session=None):
+        """
+        :param server_addr: (hostname, port) of the server
+        :param size: Maximum number of open connections
+        :param api_key: Key to use for authentication
+        :param binary: Whether to offer the binary protocol to the server
+        :param compression: Whether to offer to compress file data payloads
+        :param metrics: Optional OpMetrics to record compression ratios in
+        :param session: Optional session id all the connections join
+        """
+        if size < 1:
+            raise ValueError("Pool size must be at least 1, got {}".format(size))
+
+        self._server_addr = server_addr
+        self._api_key = api_key
+        self._binary = binary
+        self._compression = compression
+        self._metrics = metrics
+        self._session = session
+        self._size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+        # The most recently opened connection, whose HELLO says what the
+        # server supports
+        self._newest = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except:
+            pass
+
+    def get_size(self):
+        """
+        :return: The maximum number of connections in the pool
+        """
+        return self._size
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks out a connection, blocking until one is available. Idle
+        connections the server has closed are replaced. If the with-block
+        raises, the connection is assumed to be broken and is closed instead
+        of being returned to the pool.
+        """
+        with self._slots:
+            connection = None
+            while connection is None:
+                try:
+                    connection = self._idle.get_nowait()
+                except queue.Empty:
+                    connection = HttpFsConnection(
+                        self._server_addr,
+                        api_key=self._api_key,
+                        binary=self._binary,
+                        compression=self._compression,
+                        metrics=self._metrics,
+                        session=self._session
+                    )
+                    self._newest = connection
+                    break
+
+                if not connection.is_alive():
+                    connection.close()
+                    connection = None
+
+            try:
+                yield connection
+            except BaseException:
+                connection.close()
+                raise
+
+            self._idle.put(connection)
+
+    def supports(self, request_type):
+        """
+        Answers from the most recently opened connection, so it costs no
+        checkout once any connection is open, and follows the server across
+        restarts as connections are replaced
+        :param request_type: A FuseOpType
+        :return: Whether the server reported a handler for request_type
+        """
+        newest = self._newest
+        if newest is None:
+            with self.connection() as connection:
+                return connection.supports(request_type)
+        return newest.supports(request_type)
+
+    def close(self):
+        """
+        Closes all idle connections
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,443 @@
+"""
+Contains a persistent, size-bounded cache of file blocks on local disk
+"""
+
+import errno
+import fcntl
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import zlib
+from urllib.parse import quote
+
+
+class DiskBlockCache:
+    """
+    A drop-in replacement for BlockCache that keeps blocks in a local
+    directory, so they survive restarts and remounts of the client.
+
+    Each block is a file of its own, and an sqlite index maps
+    (path, mtime, size, block number) to it. Blocks are only served while
+    the file's mtime and size match the ones they were read with, so an
+    unchanged file is validated by the single GET_ATTR sent when it is
+    opened. The index lives in a directory per server, and the least
+    recently used blocks are removed once max_bytes is exceeded.
+
+    A block file is renamed into place before the index refers to it, and
+    its length and CRC-32 are checked on every read, so a crash can at
+    worst leave unused files or lose a block, never serve a torn one.
+    Files left behind by a crash are removed the next time the cache is
+    opened.
+    """
+
+    _DEFAULT_MAX_BYTES = 10 * 1024**3
+    _DEFAULT_BLOCK_SIZE = 128 * 1024
+
+    # Reads record their use of a block without committing it, so the index
+    # is only written this often by a read-only workload
+    _TOUCH_COMMIT_INTERVAL = 1024
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL UNIQUE,
+            mtime REAL NOT NULL,
+            size INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS blocks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_id INTEGER,
+            block INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            crc INTEGER NOT NULL,
+            last_used INTEGER NOT NULL,
+            UNIQUE (file_id, block)
+        );
+        CREATE INDEX IF NOT EXISTS blocks_last_used ON blocks (last_used);
+    """
+
+    def __init__(
+            self,
+            cache_dir,
+            server,
+            max_bytes=_DEFAULT_MAX_BYTES,
+            block_size=_DEFAULT_BLOCK_SIZE,
+            prefix="httpfs_client"):
+        """
+        :param cache_dir: Directory to keep cached blocks in. Created if it
+            doesn't exist
+        :param server: Identifies the server, e.g. "hostname:port". Each
+            server's blocks are kept apart
+        :param max_bytes: Maximum number of bytes of file data to keep
+        :param block_size: Size of each block in bytes. Blocks cached with a
+            different block size are dropped
+        :param prefix: Prefix of the metric names
+        :raises OSError: If the directory can't be used, or another client
+            is using it for the same server
+        """
+        if block_size < 1:
+            raise ValueError("Block size must be positive, got {}".format(block_size))
+
+        self._max_bytes = max_bytes
+        self._block_size = block_size
+        self._prefix = prefix
+        self._dir = os.path.join(cache_dir, quote(server, safe=""))
+        self._blocks_dir = os.path.join(self._dir, "blocks")
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._untouched = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self._blocks_dir, exist_ok=True)
+        self._lock_fd = os.open(os.path.join(self._dir, "lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as excp:
+            os.close(self._lock_fd)
+            if excp.errno in (errno.EAGAIN, errno.EACCES):
+                raise OSError(excp.errno, "Disk cache {} is in use by another client".format(self._dir)) from excp
+            raise
+
+        self._db = sqlite3.connect(os.path.join(self._dir, "index.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(DiskBlockCache._SCHEMA)
+        self._open()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+
+    def __contains__(self, key):
+        """
+        :param key: (path, version, block number)
+        :return: Whether the block is cached. It isn't read
+        """
+        path, (mtime, size), block = key
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM files JOIN blocks ON blocks.file_id = files.id "
+                "WHERE files.path = ? AND files.mtime = ? AND files.size = ? AND blocks.block = ?",
+                (path, mtime, size, block)
+            ).fetchone() is not None
+
+    def get_block_size(self):
+        """
+        :return: The size of each block in bytes
+        """
+        return self._block_size
+
+    def get_size_bytes(self):
+        """
+        :return: Number of bytes of file data currently cached
+        """
+        return self._size_bytes
+
+    def get_generation(self):
+        """
+        :return: A counter that changes on every invalidation. Pass it to
+            put() so blocks fetched before an invalidation are not cached
+            after it.
+        """
+        return self._generation
+
+    def get(self, path, version, block):
+        """
+        :param path: Path of the file
+        :param version: The file's (mtime, size) when it was opened
+        :param block: Block number
+        :return: The cached block, or None
+        """
+        mtime, size = version
+        with self._lock:
+            row = self._db.execute(
+                "SELECT blocks.id, blocks.length, blocks.crc, blocks.file_id FROM files "
+                "JOIN blocks ON blocks.file_id = files.id "
+                "WHERE files.path = ? AND files.mtime = ? AND files.size = ? AND blocks.block = ?",
+                (path, mtime, size, block)
+            ).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+
+            block_id, length, crc, file_id = row
+            self._touch(block_id)
+
+        try:
+            with open(self._block_path(block_id), "rb") as block_file:
+                data = block_file.read()
+        except FileNotFoundError:
+            data = None
+
+        if data is None or len(data) != length or zlib.crc32(data) != crc:
+            with self._lock:
+                self._misses += 1
+                if data is not None:
+                    logging.warning("Dropping corrupt cached block %d of %s", block, path)
+                # A missing file was evicted since, or lost in a crash
+                self._remove_blocks([(block_id, length, file_id)])
+                self._db.commit()
+            return None
+
+        with self._lock:
+            self._hits += 1
+        return data
+
+    def put(self, path, version, block, data, generation=None):
+        """
+        Caches a block, evicting the least recently used blocks if the cache
+        is full
+        :param path: Path of the file
+        :param version: The file's (mtime, size) when it was opened
+        :param block: Block number
+        :param data: The block's bytes. Shorter than the block size at EOF
+        :param generation: Value of get_generation() before data was fetched
+        """
+        if len(data) > self._max_bytes:
+            return
+
+        mtime, size = version
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            block_id = self._db.execute(
+                "INSERT INTO blocks (file_id, block, length, crc, last_used) VALUES (NULL, ?, 0, 0, 0)",
+                (block,)
+            ).lastrowid
+
+        # Written without the lock. The row above reserves the id, and
+        # belongs to no file until it is filled in
+        block_path = self._block_path(block_id)
+        try:
+            os.makedirs(os.path.dirname(block_path), exist_ok=True)
+            with open(block_path + ".tmp", "wb") as block_file:
+                block_file.write(data)
+            os.replace(block_path + ".tmp", block_path)
+        except OSError as excp:
+            logging.warning("Couldn't write to the disk cache: %s", excp)
+            with self._lock:
+                self._remove_blocks([(block_id, 0, None)])
+                self._db.commit()
+            return
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self._remove_blocks([(block_id, 0, None)])
+                self._db.commit()
+                return
+
+            file_id = self._get_file_id(path, mtime, size)
+            old_block = self._db.execute(
+                "SELECT id, length, file_id FROM blocks WHERE file_id = ? AND block = ?",
+                (file_id, block)
+            ).fetchone()
+            if old_block is not None:
+                self._remove_blocks([old_block])
+
+            self._clock += 1
+            self._db.execute(
+                "UPDATE blocks SET file_id = ?, length = ?, crc = ?, last_used = ? WHERE id = ?",
+                (file_id, len(data), zlib.crc32(data), self._clock, block_id)
+            )
+            self._size_bytes += len(data)
+            self._evict()
+            self._db.commit()
+            self._untouched = 0
+
+    def invalidate(self, path):
+        """
+        Drops all cached blocks of a file
+        """
+        with self._lock:
+            self._generation += 1
+            self._remove_files(self._db.execute(
+                "SELECT id FROM files WHERE path = ?",
+                (path,)
+            ).fetchall())
+            self._db.commit()
+
+    def invalidate_tree(self, path):
+        """
+        Drops all cached blocks of path and of every file below it
+        """
+        prefix = path.rstrip("/") + "/"
+        with self._lock:
+            self._generation += 1
+            self._remove_files(self._db.execute(
+                "SELECT id FROM files WHERE path = ? OR substr(path, 1, ?) = ?",
+                (path, len(prefix), prefix)
+            ).fetchall())
+            self._db.commit()
+
+    def close(self):
+        """
+        Writes out the index and releases the directory to other clients
+        """
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.execute("UPDATE meta SET value = '1' WHERE key = 'clean'")
+            self._db.commit()
+            self._db.close()
+            self._db = None
+            os.close(self._lock_fd)
+
+    def get_stats(self):
+        """
+        :return: Dict of the hits, misses, hit_ratio, blocks and bytes used
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            blocks = self._db.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "blocks": blocks,
+                "bytes": self._size_bytes
+            }
+
+    def render(self):
+        """
+        :return: The cache's stats in the Prometheus text exposition format
+        """
+        stats = self.get_stats()
+        name = self._prefix + "_disk_cache"
+        lines = list()
+
+        for metric, kind, description, value in (
+                ("hits_total", "counter", "Blocks read from the disk cache", stats["hits"]),
+                ("misses_total", "counter", "Blocks not found in the disk cache", stats["misses"]),
+                ("blocks", "gauge", "Blocks in the disk cache", stats["blocks"]),
+                ("bytes", "gauge", "Bytes of file data in the disk cache", stats["bytes"])):
+            lines.append("# HELP {}_{} {}".format(name, metric, description))
+            lines.append("# TYPE {}_{} {}".format(name, metric, kind))
+            lines.append("{}_{} {}".format(name, metric, value))
+
+        return "\n".join(lines) + "\n"
+
+    def _open(self):
+        meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+
+        if meta.get("block_size") != str(self._block_size):
+            if meta:
+                logging.info("Block size changed, clearing the disk cache")
+            self._db.execute("DELETE FROM blocks")
+            self._db.execute("DELETE FROM files")
+            shutil.rmtree(self._blocks_dir)
+            os.makedirs(self._blocks_dir)
+        elif meta.get("clean") != "1":
+            self._recover()
+
+        self._db.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('block_size', ?), ('clean', '0')",
+            (str(self._block_size),)
+        )
+        self._size_bytes, self._clock = self._db.execute(
+            "SELECT COALESCE(SUM(length), 0), COALESCE(MAX(last_used), 0) FROM blocks"
+        ).fetchone()
+        self._evict()
+        self._db.commit()
+
+    def _recover(self):
+        """
+        Removes what an unclean shutdown left behind: blocks that were never
+        filled in, and files the index doesn't refer to
+        """
+        self._db.execute("DELETE FROM blocks WHERE file_id IS NULL")
+        known = set(row[0] for row in self._db.execute("SELECT id FROM blocks"))
+
+        for sub_dir in os.listdir(self._blocks_dir):
+            sub_dir = os.path.join(self._blocks_dir, sub_dir)
+            for name in os.listdir(sub_dir):
+                if not name.isdigit() or int(name) not in known:
+                    os.unlink(os.path.join(sub_dir, name))
+
+        self._db.execute(
+            "DELETE FROM files WHERE NOT EXISTS "
+            "(SELECT 1 FROM blocks WHERE blocks.file_id = files.id)"
+        )
+
+    def _block_path(self, block_id):
+        return os.path.join(self._blocks_dir, "{:02x}".format(block_id & 0xff), str(block_id))
+
+    def _get_file_id(self, path, mtime, size):
+        """
+        :return: The id of path's row, replacing the row and its blocks if it
+            was for another version of the file
+        """
+        row = self._db.execute(
+            "SELECT id, mtime, size FROM files WHERE path = ?",
+            (path,)
+        ).fetchone()
+        if row is not None:
+            if (row[1], row[2]) == (mtime, size):
+                return row[0]
+            self._remove_files([row])
+
+        return self._db.execute(
+            "INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)",
+            (path, mtime, size)
+        ).lastrowid
+
+    def _touch(self, block_id):
+        self._clock += 1
+        self._db.execute("UPDATE blocks SET last_used = ? WHERE id = ?", (self._clock, block_id))
+        self._untouched += 1
+        if self._untouched >= DiskBlockCache._TOUCH_COMMIT_INTERVAL:
+            self._db.commit()
+            self._untouched = 0
+
+    def _evict(self):
+        excess = self._size_bytes - self._max_bytes
+        if excess <= 0:
+            return
+
+        victims = list()
+        for row in self._db.execute(
+                "SELECT id, length, file_id FROM blocks WHERE file_id IS NOT NULL ORDER BY last_used"):
+            victims.append(row)
+            excess -= row[1]
+            if excess <= 0:
+                break
+
+        self._remove_blocks(victims)
+
+    def _remove_files(self, file_rows):
+        for file_row in file_rows:
+            self._remove_blocks(self._db.execute(
+                "SELECT id, length, file_id FROM blocks WHERE file_id = ?",
+                (file_row[0],)
+            ).fetchall())
+            self._db.execute("DELETE FROM files WHERE id = ?", (file_row[0],))
+
+    def _remove_blocks(self, block_rows):
+        """
+        Removes blocks from the index, then their files, and files left
+        without blocks. Callers commit
+        :param block_rows: (id, length, file_id) of each block
+        """
+        file_ids = set()
+        for block_id, length, file_id in block_rows:
+            if self._db.execute("DELETE FROM blocks WHERE id = ?", (block_id,)).rowcount == 0:
+                continue
+
+            self._size_bytes -= length
+            file_ids.add(file_id)
+            try:
+                os.unlink(self._block_path(block_id))
+            except FileNotFoundError:
+                pass
+
+        for file_id in file_ids:
+            self._db.execute(
+                "DELETE FROM files WHERE id = ? AND NOT EXISTS (SELECT 1 FROM blocks WHERE file_id = ?)",
+                (file_id, file_id)
+            )
@@ -0,0 +1,257 @@
+"""
+Contains an fsspec filesystem backed by AsyncHttpFsSession, so libraries
+such as pandas and pyarrow can read from an HttpFs server directly, with
+URLs like httpfs://hostname:port/path/to/file
+"""
+
+import asyncio
+import os
+import stat
+
+try:
+    from fsspec.asyn import AsyncFileSystem, sync
+    from fsspec.spec import AbstractBufferedFile
+    from fsspec.utils import infer_storage_options
+except ImportError as excp:
+    raise ImportError("HttpFsFileSystem needs fsspec, install it with: pip install fsspec") from excp
+
+from .async_session import AsyncHttpFsSession
+
+
+class HttpFsFileSystem(AsyncFileSystem):
+    """
+    An fsspec filesystem for an HttpFs server. Byte ranges requested
+    together with cat_ranges() are fetched concurrently, each file being
+    opened once for all of its ranges.
+
+    Files returned by open() are for synchronous use. In asynchronous mode,
+    use the coroutine methods (_cat_file() and so on) instead.
+    """
+
+    protocol = "httpfs"
+    root_marker = "/"
+
+    def __init__(
+            self,
+            host,
+            port,
+            api_key=None,
+            connections=AsyncHttpFsSession._DEFAULT_CONNECTIONS,
+            compression=False,
+            **kwargs):
+        """
+        :param host: The server to connect to
+        :param port: The server's port
+        :param api_key: Key to use for authentication
+        :param connections: Number of connections to the server
+        :param compression: Whether to compress file data in transit, if the
+            server supports it
+        :param kwargs: Passed to fsspec's AsyncFileSystem, e.g. asynchronous
+            and loop
+        """
+        super().__init__(**kwargs)
+        self.session = AsyncHttpFsSession(
+            host,
+            int(port),
+            api_key=api_key,
+            connections=connections,
+            compression=compression
+        )
+
+    @classmethod
+    def _strip_protocol(cls, path):
+        path = infer_storage_options(path)["path"]
+        return "/" + path.strip("/")
+
+    @staticmethod
+    def _get_kwargs_from_urls(path):
+        options = infer_storage_options(path)
+        kwargs = dict()
+        if options.get("host"):
+            kwargs["host"] = options["host"]
+        if options.get("port"):
+            kwargs["port"] = options["port"]
+        return kwargs
+
+    @staticmethod
+    def _to_info(path, attrs):
+        if stat.S_ISDIR(attrs["st_mode"]):
+            kind = "directory"
+        elif stat.S_ISREG(attrs["st_mode"]):
+            kind = "file"
+        else:
+            kind = "other"
+
+        return {
+            "name": path,
+            "size": attrs["st_size"],
+            "type": kind,
+            "mode": attrs["st_mode"],
+            "mtime": attrs["st_mtime"],
+            "uid": attrs["st_uid"],
+            "gid": attrs["st_gid"]
+        }
+
+    async def _info(self, path, **kwargs):
+        path = self._strip_protocol(path)
+        return HttpFsFileSystem._to_info(path, await self.session.getattr(path))
+
+    async def _ls(self, path, detail=True, **kwargs):
+        path = self._strip_protocol(path)
+        try:
+            entries = [
+                HttpFsFileSystem._to_info(os.path.join(path, name), attrs)
+                for name, attrs in await self.session.listdir(path)
+            ]
+        except NotADirectoryError:
+            entries = [await self._info(path)]
+
+        if detail:
+            return entries
+        return [entry["name"] for entry in entries]
+
+    async def _cat_file(self, path, start=None, end=None, **kwargs):
+        [data] = await self._cat_path(self._strip_protocol(path), [(start, end)])
+        return data
+
+    async def _cat_ranges(self, paths, starts, ends, max_gap=None, on_error="return", **kwargs):
+        if max_gap is not None or not isinstance(paths, list):
+            return await super()._cat_ranges(paths, starts, ends, max_gap=max_gap, on_error=on_error, **kwargs)
+
+        if not isinstance(starts, list):
+            starts = [starts] * len(paths)
+        if not isinstance(ends, list):
+            ends = [ends] * len(paths)
+        if len(starts) != len(paths) or len(ends) != len(paths):
+            raise ValueError("paths, starts and ends must be the same length")
+
+        # Each file is opened once for all of its ranges
+        ranges_by_path = dict()
+        for index, (path, start, end) in enumerate(zip(paths, starts, ends)):
+            ranges_by_path.setdefault(self._strip_protocol(path), list()).append((index, start, end))
+
+        results = [None] * len(paths)
+
+        async def cat_path(path, ranges):
+            try:
+                datas = await self._cat_path(path, [(start, end) for _, start, end in ranges])
+            except Exception as excp:
+                datas = [excp] * len(ranges)
+            for (index, _, _), data in zip(ranges, datas):
+                results[index] = data
+
+        await asyncio.gather(*[cat_path(path, ranges) for path, ranges in ranges_by_path.items()])
+
+        if on_error == "raise":
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    async def _pipe_file(self, path, value, **kwargs):
+        await self.session.write_file(self._strip_protocol(path), value)
+
+    async def _rm_file(self, path, **kwargs):
+        await self.session.unlink(self._strip_protocol(path))
+
+    async def _rm(self, path, recursive=False, maxdepth=None, **kwargs):
+        paths = await self._expand_path(path, recursive=recursive, maxdepth=maxdepth)
+
+        async def unlink(path):
+            try:
+                await self.session.unlink(path)
+            except IsADirectoryError:
+                return path
+            return None
+
+        # Files go concurrently, then directories, children before parents
+        dirs = [p for p in await asyncio.gather(*[unlink(p) for p in paths]) if p is not None]
+        for dir_path in sorted(dirs, reverse=True):
+            await self.session.rmdir(dir_path)
+
+    async def _rmdir(self, path):
+        await self.session.rmdir(self._strip_protocol(path))
+
+    async def _mkdir(self, path, create_parents=True, **kwargs):
+        path = self._strip_protocol(path)
+        if create_parents:
+            await self._makedirs(path, exist_ok=True)
+        else:
+            await self.session.mkdir(path)
+
+    async def _makedirs(self, path, exist_ok=False):
+        path = self._strip_protocol(path)
+        if await self._exists(path):
+            if exist_ok:
+                return
+            raise FileExistsError(path)
+
+        parent = os.path.dirname(path)
+        if parent != path:
+            await self._makedirs(parent, exist_ok=True)
+        await self.session.mkdir(path)
+
+    def _open(self, path, mode="rb", block_size=None, autocommit=True, cache_options=None, **kwargs):
+        return HttpFsFile(
+            self,
+            self._strip_protocol(path),
+            mode=mode,
+            block_size=block_size or AsyncHttpFsSession._DEFAULT_CHUNK_SIZE,
+            autocommit=autocommit,
+            cache_options=cache_options,
+            **kwargs
+        )
+
+    async def _cat_path(self, path, ranges):
+        """
+        Reads byte ranges of one file concurrently
+        :param ranges: List of (start, end) pairs. None and negative values
+            mean the same as in slices
+        :return: List of the bytes of each range
+        """
+        fh = await self.session.open(path)
+        try:
+            size = None
+            if any(start is None or start < 0 or end is None or end < 0 for start, end in ranges):
+                size = (await self.session.getattr(path))["st_size"]
+
+            reads = list()
+            for start, end in ranges:
+                start, end, _ = slice(start, end).indices(size if size is not None else end)
+                reads.append(self.session.read(fh, max(0, end - start), start))
+            return await asyncio.gather(*reads)
+        finally:
+            await self.session.release(fh)
+
+
+class HttpFsFile(AbstractBufferedFile):
+    """
+    A file on an HttpFs server, read and written in blocks. The file stays
+    open on the server until it is closed
+    """
+
+    def __init__(self, fs, path, mode="rb", **kwargs):
+        self.fh = None
+        super().__init__(fs, path, mode=mode, **kwargs)
+        if mode == "rb":
+            self.fh = sync(fs.loop, fs.session.open, path)
+
+    def _fetch_range(self, start, end):
+        return sync(self.fs.loop, self.fs.session.read, self.fh, end - start, start)
+
+    def _initiate_upload(self):
+        self.fh = sync(self.fs.loop, self.fs.session.create, self.path)
+
+    def _upload_chunk(self, final=False):
+        data = self.buffer.getvalue()
+        if data:
+            sync(self.fs.loop, self.fs.session.write, self.fh, data, self.offset)
+        return True
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self.fh is not None:
+                fh, self.fh = self.fh, None
+                sync(self.fs.loop, self.fs.session.release, fh)
@@ -0,0 +1,103 @@
+"""
+Contains the client's table of the file handles it has given the kernel
+"""
+
+import itertools
+import os
+import threading
+
+
+class RemoteHandle:
+    """
+    A file or directory the client has open on the server, and how it was
+    opened, so it can be opened again
+    """
+
+    def __init__(self, server_handle, path, flags, uid, gid, directory=False, version=None):
+        """
+        :param server_handle: The handle the server returned
+        :param path: Path of the open file
+        :param flags: Flags the file was opened with
+        :param uid: User id the file was opened by
+        :param gid: Group id the file was opened by
+        :param directory: Whether the handle was opened with OPENDIR
+        :param version: Optional (st_mtime, st_size) of the file when it was
+            opened. A file reopened with a different version is a different
+            file
+        """
+        self.server_handle = server_handle
+        self.path = path
+        self.flags = flags
+        self.uid = uid
+        self.gid = gid
+        self.directory = directory
+        self.version = version
+
+        #: Held while the file is being reopened, so requests that find the
+        #: server handle stale at the same time only reopen it once
+        self.reopen_lock = threading.Lock()
+
+    def get_reopen_flags(self):
+        """
+        :return: Flags to open the file again with. Creating or truncating
+            the file already happened the first time
+        """
+        return self.flags & ~(os.O_CREAT | os.O_EXCL | os.O_TRUNC)
+
+
+class HandleTable:
+    """
+    Maps the handles the client gives the kernel to the server's handles.
+    Server handles don't outlive the server process, so rather than passing
+    them on, the client hands out its own and keeps the server's behind
+    them. A file whose server handle went stale can then be opened again
+    without the kernel, or the program using the file, noticing.
+    """
+
+    def __init__(self):
+        self._handles = dict()
+        self._next_handle = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._handles)
+
+    def add(self, remote_handle):
+        """
+        :param remote_handle: RemoteHandle of a newly opened file
+        :return: The handle to give the kernel
+        """
+        with self._lock:
+            handle = next(self._next_handle)
+            self._handles[handle] = remote_handle
+        return handle
+
+    def get(self, handle):
+        """
+        :param handle: A handle returned by add()
+        :return: The RemoteHandle, or None if handle isn't open
+        """
+        return self._handles.get(handle)
+
+    def remove(self, handle):
+        """
+        :param handle: A handle returned by add()
+        :return: The RemoteHandle, or None if handle isn't open
+        """
+        with self._lock:
+            return self._handles.pop(handle, None)
+
+    def rename(self, old, new):
+        """
+        Follows a rename, so files open at or below old are reopened at
+        their new path
+        :param old: The old path
+        :param new: The new path
+        """
+        prefix = old.rstrip("/") + "/"
+        with self._lock:
+            for remote_handle in self._handles.values():
+                if remote_handle.path == old:
+                    remote_handle.path = new
+                elif remote_handle.path.startswith(prefix):
+                    remote_handle.path = os.path.join(new, remote_handle.path[len(prefix):])
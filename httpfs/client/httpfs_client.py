@@ -4,21 +4,32 @@
 Contains a class to be passed to fusepy.FUSE to handle filesystem operations
 """
 
-import base64
-import binascii
 import errno
-import json
 import logging
+import os
+import secrets
 import socket
+import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 
-import ujson
 from fuse import Operations, FuseOSError, fuse_get_context
-from pytcp_message import TcpClient
 
+from .attr_cache import AttrCache, MISSING
+from .block_cache import BlockCache
+from .block_reader import BlockReader
+from .change_listener import ChangeListener
+from .connection import HttpFsConnection
+from .connection_pool import HttpFsConnectionPool
+from .disk_block_cache import DiskBlockCache
 from .fuse_logger import _FuseLogger
+from .handle_table import HandleTable, RemoteHandle
+from .write_buffer import WriteBuffer
 from ..common import FuseOpType
+from ..common.metrics import OpMetrics, payload_size
 
 
 class HttpFsClient(_FuseLogger, Operations):
@@ -27,90 +38,423 @@ class HttpFsClient(_FuseLogger, Operations):
     """
 
     _ONE_KILOBYTE = 1024
-    _RETRIES = 3
+    _DEFAULT_CONNECTIONS = 4
+    _DEFAULT_RECONNECT_TIMEOUT = 60
+    _RECONNECT_DELAY = 0.05
+    _MAX_RECONNECT_DELAY = 2
+    _DEFAULT_WRITEBACK_LIMIT = 64 * 1024**2
+    _READDIR_PAGE_SIZE = 1024
+
+    #: Largest WRITE request sent when flushing buffered writes
+    _MAX_WRITE_SIZE = 8 * 1024**2
 
     # Unimplemented filesystem ops
     bmap = None
     getxattr = None
     listxattr = None
 
-    def __init__(self, hostname, port, api_key=None, ca_file=None):
+    def __init__(
+            self,
+            hostname,
+            port,
+            api_key=None,
+            ca_file=None,
+            connections=_DEFAULT_CONNECTIONS,
+            attr_cache=None,
+            block_cache=None,
+            readahead=BlockReader._DEFAULT_WINDOW,
+            writeback=False,
+            writeback_limit=_DEFAULT_WRITEBACK_LIMIT,
+            compression=False,
+            coherent_cache=False,
+            change_feed=False,
+            reconnect_timeout=_DEFAULT_RECONNECT_TIMEOUT):
         """
         Constructor
         :param hostname: The server to connect to
         :param port: The server's port
         :param api_key: Key to use for authentication
         :param ca_file: Optional CA cert file if the server uses HTTPS
+        :param connections: Maximum number of concurrent connections to the
+            server
+        :param attr_cache: Optional AttrCache for getattr/access results. By
+            default a cache with a short TTL is used
+        :param block_cache: Optional BlockCache, or DiskBlockCache to keep
+            file data across mounts, that read-only file handles read
+            through. By default a 64 MiB cache is used
+        :param readahead: Number of blocks to prefetch for sequential
+            readers, 0 to disable
+        :param writeback: Whether to buffer writes until the file is flushed
+            instead of sending each one to the server
+        :param writeback_limit: Number of buffered bytes, across all files,
+            past which buffered writes are sent right away
+        :param compression: Whether to compress file data sent to and from
+            the server, if it supports it
+        :param coherent_cache: Whether the mount lets the kernel cache file
+            data and lookups. See get_mount_options()
+        :param change_feed: Whether to subscribe to the server's change
+            notifications, so cached attributes and data of paths changed by
+            others are dropped right away rather than when they expire
+        :param reconnect_timeout: Seconds to keep trying to reach the server
+            after losing the connection before failing requests
         """
         self._server_addr = (hostname, port)
-        self._tcp_client = TcpClient(self._server_addr)
         self._api_key = api_key
-        self._retries = HttpFsClient._RETRIES
-        self._tcp_client._socket.setsockopt(
-            socket.IPPROTO_TCP,
-            socket.TCP_NODELAY,
-            1
+        self._attr_cache = attr_cache if attr_cache is not None else AttrCache()
+        self._block_cache = block_cache if block_cache is not None else BlockCache()
+        self._readahead = readahead
+        self._readers = dict()
+        self._readers_lock = threading.Lock()
+        self._writeback = writeback
+        self._writeback_limit = writeback_limit
+        self._write_buffers = dict()
+        self._write_buffers_lock = threading.Lock()
+        self._dirty_bytes = 0
+        self._coherent_cache = coherent_cache
+        self._reconnect_timeout = reconnect_timeout
+        self._handles = HandleTable()
+        self._metrics = OpMetrics("httpfs_client")
+
+        # Files stay open on the server while the client reconnects
+        self._pool = HttpFsConnectionPool(
+            self._server_addr,
+            size=connections,
+            api_key=api_key,
+            compression=compression,
+            metrics=self._metrics,
+            session=secrets.token_hex(16)
+        )
+        self._prefetch_executor = None
+        if readahead > 0:
+            self._prefetch_executor = ThreadPoolExecutor(
+                max_workers=connections,
+                thread_name_prefix="httpfs-readahead"
+            )
+
+        # Fail fast if the server can't be reached
+        with self._pool.connection():
+            pass
+
+        self._change_listener = None
+        if change_feed:
+            self._change_listener = ChangeListener(
+                self._server_addr,
+                self._invalidate_changes,
+                api_key=api_key
+            )
+            self._attr_cache.set_on_add(self._change_listener.watch)
+            self._change_listener.start()
+
+    def get_metrics(self):
+        """
+        :return: The OpMetrics of the requests sent to the server
+        """
+        return self._metrics
+
+    def get_mount_options(self):
+        """
+        :return: Keyword arguments to pass to FUSE(). With coherent caching,
+            the kernel keeps file data in its page cache across opens and
+            caches lookups and attributes for the attribute cache's TTL.
+            libfuse's auto_cache drops a file's cached data on open only
+            when the attributes fetched by open() show a new st_mtime or
+            st_size. The change feed can't reach the kernel's caches, so
+            with it on they are kept for no longer than the default TTLs
+        """
+        if not self._coherent_cache:
+            return dict()
+
+        ttl = self._attr_cache.get_ttl()
+        negative_ttl = self._attr_cache.get_negative_ttl()
+        if self._change_listener is not None:
+            ttl = min(ttl, AttrCache._DEFAULT_TTL)
+            negative_ttl = min(negative_ttl, AttrCache._DEFAULT_NEGATIVE_TTL)
+
+        return dict(
+            auto_cache=True,
+            entry_timeout=ttl,
+            attr_timeout=ttl,
+            negative_timeout=negative_ttl
         )
 
     def __del__(self):
         try:
-            self._tcp_client.stop()
+            if self._prefetch_executor is not None:
+                self._prefetch_executor.shutdown(wait=False)
+            self._pool.close()
         except:
             pass
 
-    def _send_request(self, request_type: FuseOpType, **kwargs):
+    def _send_request(self, request_type: FuseOpType, idempotent=None, **kwargs):
         """
         Sends an HttpFsRequest of the given type with the given kwargs
         :param request_type: The request type to send
+        :param idempotent: Whether the request can be sent again if the
+            connection drops while it is in flight. By default this depends
+            on the request type
         :param kwargs: The arguments for the request
         :return: The HttpFsResponse
         """
-        request = {
-            "type": request_type,
-            "api_key": self._api_key,
-            **kwargs
-        }
+        # Don't want to log all the bytes
+        if request_type not in [FuseOpType.READ, FuseOpType.WRITE]:
+            logging.debug("%s %s", request_type.name, kwargs)
 
+        start = time.perf_counter()
+        response_obj = None
+        error = errno.EIO
         try:
-            try:
-                req_as_json = ujson.dumps(request)
-                # Don't want to log all the bytes
-                if request_type not in [FuseOpType.READ, FuseOpType.WRITE]:
-                    logging.debug(req_as_json)
-                self._tcp_client.send(req_as_json)
+            if idempotent is None:
+                idempotent = HttpFsConnection.is_idempotent(request_type, kwargs)
+            response_obj = self._send_request_with_retries(request_type, idempotent, **kwargs)
+            return response_obj
+        except FuseOSError as excp:
+            error = excp.errno
+            raise
+        finally:
+            if response_obj is not None:
+                error = response_obj["errno"]
+            self._metrics.record(
+                request_type,
+                error,
+                time.perf_counter() - start,
+                bytes_in=payload_size(response_obj["data"]) if response_obj else 0,
+                bytes_out=payload_size(kwargs.get("data"))
+            )
 
-                response = self._tcp_client.receive()
-                return ujson.loads(response)
+    def _send_request_with_retries(self, request_type, idempotent, **kwargs):
+        deadline = time.monotonic() + self._reconnect_timeout
+        delay = HttpFsClient._RECONNECT_DELAY
+
+        while True:
+            sent = False
+            try:
+                with self._pool.connection() as connection:
+                    sent = True
+                    return connection.request(request_type, **kwargs)
 
             # TODO: More descriptive errno's based on error received
-            except BrokenPipeError as excp:
-                if self._retries > 0:
-                    self._retries -= 1
-                    logging.warning(
-                        "Server disconnected: {}, retrying...".format(excp)
+            except (ConnectionError, socket.timeout) as excp:
+                # A request that timed out is most likely still being handled
+                # by a slow server, and sending it again only adds to the load
+                if sent and isinstance(excp, socket.timeout):
+                    logging.error("Timed out waiting for %s: %s", request_type.name, excp)
+                    raise FuseOSError(errno.EIO) from excp
+
+                # The pool drops the broken connection, so the next attempt
+                # gets a fresh one. A request that may have been handled is
+                # only sent again if that does no harm
+                if sent and not idempotent:
+                    logging.error(
+                        "Server disconnected during %s, which can't be retried: %s",
+                        request_type.name,
+                        excp
                     )
-                    self._tcp_client = TcpClient(self._server_addr)
-                    return self._send_request(request_type, **kwargs)
-                else:
+                    raise FuseOSError(errno.EIO) from excp
+
+                if time.monotonic() + delay > deadline:
                     logging.error(
-                        "Server disconnected. Giving up after {} tries".format(
-                            HttpFsClient._RETRIES
-                        )
+                        "Server disconnected. Giving up after %.0fs",
+                        self._reconnect_timeout
                     )
-            except json.JSONDecodeError as excp:
+                    logging.debug(traceback.format_exc())
+                    raise FuseOSError(errno.EIO) from excp
+
+                logging.warning(
+                    "Server disconnected: %s, retrying in %.2fs...",
+                    excp,
+                    delay
+                )
+                time.sleep(delay)
+                delay = min(delay * 2, HttpFsClient._MAX_RECONNECT_DELAY)
+            except ValueError as excp:
+                logging.debug(traceback.format_exc())
                 raise FuseOSError(errno.EINVAL) from excp
             except OSError as excp:
-                raise FuseOSError(excp.errno) from excp
+                logging.debug(traceback.format_exc())
+                raise FuseOSError(excp.errno or errno.EIO) from excp
             except Exception as excp:
+                logging.debug(traceback.format_exc())
                 raise FuseOSError(errno.EIO) from excp
 
-        except FuseOSError as exception:
-            if exception.errno != errno.ECONNRESET:
-                self._retries = HttpFsClient._RETRIES
-            logging.debug(traceback.format_exc())
-            raise FuseOSError(exception.errno) from exception
+    def _send_handle_request(self, request_type, fh, **kwargs):
+        """
+        Sends a request about an open handle, with the server's handle in
+        place of fh. If the server no longer knows its handle, because it
+        restarted or the client was away for longer than the server keeps
+        files open, the file is opened again and the request retried
+        :param request_type: The request type to send
+        :param fh: A handle returned by open(), create() or opendir()
+        :param kwargs: The other arguments for the request
+        :return: The HttpFsResponse
+        """
+        remote_handle = self._handles.get(fh)
+        if remote_handle is None:
+            return self._send_request(request_type, file_descriptor=fh, **kwargs)
+
+        # Appending twice would write the data twice
+        idempotent = None
+        if request_type == FuseOpType.WRITE and remote_handle.flags & os.O_APPEND:
+            idempotent = False
+
+        server_handle = remote_handle.server_handle
+        response_obj = self._send_request(
+            request_type,
+            idempotent=idempotent,
+            file_descriptor=server_handle,
+            **kwargs
+        )
+        if response_obj["errno"] != errno.EBADF or request_type == FuseOpType.RELEASE:
+            return response_obj
+
+        self._reopen(remote_handle, server_handle)
+        return self._send_request(
+            request_type,
+            idempotent=idempotent,
+            file_descriptor=remote_handle.server_handle,
+            **kwargs
+        )
+
+    def _reopen(self, remote_handle, stale_handle):
+        """
+        Opens a file again under a new server handle
+        :param remote_handle: The RemoteHandle
+        :param stale_handle: The server handle the server didn't know
+        :raises FuseOSError: ESTALE if the file can't be opened again, or
+            isn't the file that was opened
+        """
+        with remote_handle.reopen_lock:
+            # Another request may have reopened it already
+            if remote_handle.server_handle != stale_handle:
+                return
+
+            path = remote_handle.path
+            uid, gid = remote_handle.uid, remote_handle.gid
+            if remote_handle.directory:
+                requests = [(FuseOpType.OPENDIR, dict(path=path, uid=uid, gid=gid))]
+            else:
+                flags = remote_handle.get_reopen_flags()
+                requests = [(FuseOpType.OPEN, dict(path=path, flags=flags, uid=uid, gid=gid))]
+            if remote_handle.version is not None:
+                requests.append((FuseOpType.GET_ATTR, dict(path=path)))
+
+            open_result, *getattr_result = self.compound(requests)
+            if open_result["errno"] != 0:
+                logging.error("Couldn't reopen %s: %s", path, open_result["data"])
+                raise FuseOSError(errno.ESTALE)
+
+            server_handle = open_result["data"]
+            if remote_handle.version is not None:
+                version = None
+                if getattr_result and getattr_result[0]["errno"] == 0:
+                    attrs = getattr_result[0]["data"]
+                    version = (attrs["st_mtime"], attrs["st_size"])
+
+                if version != remote_handle.version:
+                    logging.error("Couldn't reopen %s: The file has changed", path)
+                    self._send_request(FuseOpType.RELEASE, file_descriptor=server_handle)
+                    raise FuseOSError(errno.ESTALE)
+
+            logging.info("Reopened %s after losing its handle", path)
+            remote_handle.server_handle = server_handle
+
+    def _invalidate_changes(self, paths, trees):
+        """
+        Drops what is cached for paths the server says have changed
+        :param paths: Changed paths, or None if anything may have changed
+        :param trees: Directories to drop everything below
+        """
+        if paths is None:
+            self._attr_cache.clear()
+            if not isinstance(self._block_cache, DiskBlockCache):
+                self._block_cache.invalidate_tree("/")
+                return
+
+            # Blocks kept on disk are keyed by the mtime and size fetched when
+            # their file is opened, so the next open revalidates them. Only
+            # files open already could be read from stale blocks
+            with self._readers_lock:
+                open_paths = {reader.get_path() for reader in self._readers.values()}
+            for path in open_paths:
+                self._block_cache.invalidate(path)
+            return
+
+        self._attr_cache.invalidate(*paths)
+        for path in paths:
+            self._block_cache.invalidate(path)
+        for tree in trees:
+            self._attr_cache.invalidate_tree(tree)
+            self._block_cache.invalidate_tree(tree)
 
-        self._retries = HttpFsClient._RETRIES
+    def _server_supports(self, request_type):
+        """
+        :param request_type: A FuseOpType
+        :return: Whether the server has a handler for request_type
+        """
+        return self._pool.supports(request_type)
+
+    def compound(self, requests):
+        """
+        Sends several requests in a single round trip. The server handles
+        them in order and stops at the first one that fails. FLUSH, FSYNC
+        and RELEASE requests without a file_descriptor use the file opened
+        by the last OPEN or CREATE in the batch
+        :param requests: List of (FuseOpType, kwargs) pairs. READ and WRITE
+            can't be batched
+        :return: List of {"errno", "data"} results for the requests that
+            were handled
+        """
+        if self._server_supports(FuseOpType.COMPOUND):
+            ops = [dict(kwargs, type=request_type) for request_type, kwargs in requests]
+            response_obj = self._send_request(FuseOpType.COMPOUND, ops=ops)
+
+            if not isinstance(response_obj["data"], list):
+                logging.error(response_obj["data"])
+                raise FuseOSError(response_obj["errno"] or errno.EIO)
+
+            return response_obj["data"]
+
+        # Servers without COMPOUND get the requests one at a time
+        results = list()
+        current_fd = None
+        for request_type, kwargs in requests:
+            if current_fd is not None and request_type in (FuseOpType.FLUSH, FuseOpType.FSYNC, FuseOpType.RELEASE):
+                kwargs = dict(kwargs)
+                kwargs.setdefault("file_descriptor", current_fd)
+
+            response_obj = self._send_request(request_type, **kwargs)
+            results.append(response_obj)
+            if response_obj["errno"] != 0:
+                break
+
+            if request_type in (FuseOpType.OPEN, FuseOpType.CREATE):
+                current_fd = response_obj["data"]
+
+        return results
+
+    @contextmanager
+    def _invalidating(self, path, entry=False, tree=False, data=False):
+        """
+        Drops cached attributes for path once the wrapped request is done,
+        whether or not it succeeded
+        :param path: The path being modified
+        :param entry: Whether path is being created, removed or renamed, which
+            also changes its parent directory's mtime
+        :param tree: Whether to also drop everything below path
+        :param data: Whether the file's contents are changing. Implied by
+            entry
+        """
+        try:
+            yield
+        finally:
+            if tree:
+                self._attr_cache.invalidate_tree(path)
+                self._block_cache.invalidate_tree(path)
+            if entry:
+                self._attr_cache.invalidate(path, os.path.dirname(path))
+            else:
+                self._attr_cache.invalidate(path)
+            if entry or data:
+                self._block_cache.invalidate(path)
 
     def access(self, path, mode):
         """
@@ -120,16 +464,30 @@ class HttpFsClient(_FuseLogger, Operations):
         :return:
         """
         uid, gid, _ = fuse_get_context()
-        response_obj = self._send_request(
-            FuseOpType.ACCESS,
-            path=path,
-            mode=mode,
-            uid=uid,
-            gid=gid
-        )
-        # Access returns a boolean in it's "data" field: whether the user has
-        # access
-        if response_obj["errno"] != 0 or not response_obj["data"]:
+
+        access_ok = self._attr_cache.get_access(path, uid, gid, mode)
+        if access_ok is MISSING:
+            generation = self._attr_cache.get_generation()
+            response_obj = self._send_request(
+                FuseOpType.ACCESS,
+                path=path,
+                mode=mode,
+                uid=uid,
+                gid=gid
+            )
+            # Access returns a boolean in it's "data" field: whether the user
+            # has access
+            access_ok = response_obj["errno"] == 0 and bool(response_obj["data"])
+            self._attr_cache.put_access(
+                path,
+                uid,
+                gid,
+                mode,
+                access_ok,
+                generation=generation
+            )
+
+        if not access_ok:
             raise FuseOSError(errno.EACCES)
 
     def create(self, path, mode, fh=None):
@@ -144,19 +502,36 @@ class HttpFsClient(_FuseLogger, Operations):
         use fh to create the new file and return zero on success
         """
         uid, gid, _ = fuse_get_context()
-        response_obj = self._send_request(
-            FuseOpType.CREATE,
-            path=path,
-            mode=mode,
-            uid=uid,
-            gid=gid
+
+        # The kernel asks for the new file's attributes right away, so fetch
+        # them in the same round trip
+        generation = self._attr_cache.get_generation()
+        with self._invalidating(path, entry=True):
+            create_result, *getattr_result = self.compound([
+                (FuseOpType.CREATE, dict(path=path, mode=mode, uid=uid, gid=gid)),
+                (FuseOpType.GET_ATTR, dict(path=path))
+            ])
+
+        if create_result["errno"] != 0:
+            logging.error(create_result["data"])
+            raise FuseOSError(create_result["errno"])
+
+        fh = self._handles.add(
+            RemoteHandle(create_result["data"], path, os.O_WRONLY, uid, gid)
         )
+        # The attributes are cached unless something other than the create's
+        # own invalidation happened since the request went out
+        if getattr_result and getattr_result[0]["errno"] == 0:
+            self._attr_cache.put_attrs(
+                path,
+                getattr_result[0]["data"],
+                generation=generation + 1
+            )
 
-        if response_obj["errno"] != 0:
-            logging.error(response_obj["data"])
-            raise FuseOSError(response_obj["errno"])
+        if self._writeback:
+            self._add_write_buffer(fh, path, uid, gid)
 
-        return response_obj["data"]
+        return fh
 
     def chmod(self, path, mode):
         """
@@ -165,13 +540,14 @@ class HttpFsClient(_FuseLogger, Operations):
         :param mode: New permissions
         """
         uid, gid, _ = fuse_get_context()
-        response_obj = self._send_request(
-            FuseOpType.CHMOD,
-            path=path,
-            mode=mode,
-            uid=uid,
-            gid=gid
-        )
+        with self._invalidating(path):
+            response_obj = self._send_request(
+                FuseOpType.CHMOD,
+                path=path,
+                mode=mode,
+                uid=uid,
+                gid=gid
+            )
 
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
@@ -185,19 +561,33 @@ class HttpFsClient(_FuseLogger, Operations):
         :param gid: New group id
         """
         caller_uid, caller_gid, _ = fuse_get_context()
-        response_obj = self._send_request(
-            FuseOpType.CHOWN,
-            path=path,
-            uid=uid,
-            gid=gid,
-            caller_uid=caller_uid,
-            caller_gid=caller_gid
-        )
+        with self._invalidating(path):
+            response_obj = self._send_request(
+                FuseOpType.CHOWN,
+                path=path,
+                uid=uid,
+                gid=gid,
+                caller_uid=caller_uid,
+                caller_gid=caller_gid
+            )
 
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
             raise FuseOSError(response_obj["errno"])
 
+    def destroy(self, path):
+        """
+        Called when the filesystem is unmounted. Stops prefetching and closes
+        the connections to the server
+        :param path: Mount point
+        """
+        if self._change_listener is not None:
+            self._change_listener.stop()
+        if self._prefetch_executor is not None:
+            self._prefetch_executor.shutdown(wait=True)
+        self._block_cache.close()
+        self._pool.close()
+
     def flush(self, path, fh=None):
         """
         Possibly flush cached data.
@@ -208,10 +598,9 @@ class HttpFsClient(_FuseLogger, Operations):
         :param fh: Optional file handle for the file to flush
         :return:
         """
-        response_obj = self._send_request(
-            FuseOpType.FLUSH,
-            file_descriptor=fh
-        )
+        self._flush_writes(fh)
+
+        response_obj = self._send_handle_request(FuseOpType.FLUSH, fh)
 
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
@@ -227,9 +616,11 @@ class HttpFsClient(_FuseLogger, Operations):
         :param fh: Optional file handle for the file to sync
         :return:
         """
-        response_obj = self._send_request(
+        self._flush_writes(fh)
+
+        response_obj = self._send_handle_request(
             FuseOpType.FSYNC,
-            file_descriptor=fh,
+            fh,
             datasync=datasync
         )
 
@@ -244,11 +635,29 @@ class HttpFsClient(_FuseLogger, Operations):
         :param fh: None if the current file isn't open
         :return:
         """
-        response_obj = self._send_request(FuseOpType.GET_ATTR, path=path)
-        if response_obj["errno"] == 0:
-            return response_obj["data"]
+        # Buffered writes may change the size and mtime
+        if self._dirty_bytes > 0:
+            self._flush_path_writes(path)
 
-        raise FuseOSError(response_obj["errno"])
+        attrs = self._attr_cache.get_attrs(path)
+
+        if attrs is MISSING:
+            generation = self._attr_cache.get_generation()
+            response_obj = self._send_request(FuseOpType.GET_ATTR, path=path)
+
+            if response_obj["errno"] == 0:
+                attrs = response_obj["data"]
+            elif response_obj["errno"] == errno.ENOENT:
+                attrs = None
+            else:
+                raise FuseOSError(response_obj["errno"])
+
+            self._attr_cache.put_attrs(path, attrs, generation=generation)
+
+        if attrs is None:
+            raise FuseOSError(errno.ENOENT)
+
+        return attrs
 
     def link(self, target, source):
         """
@@ -257,11 +666,14 @@ class HttpFsClient(_FuseLogger, Operations):
         :param source: Link name
         :return:
         """
-        response_obj = self._send_request(
-            FuseOpType.LINK,
-            target=target,
-            source=source
-        )
+        # The source's link count changes too
+        with self._invalidating(target, entry=True), \
+                self._invalidating(source):
+            response_obj = self._send_request(
+                FuseOpType.LINK,
+                target=target,
+                source=source
+            )
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
             raise FuseOSError(response_obj["errno"])
@@ -273,11 +685,12 @@ class HttpFsClient(_FuseLogger, Operations):
         :param mode: Permissions for the new directory
         :return:
         """
-        response_obj = self._send_request(
-            FuseOpType.MKDIR,
-            path=path,
-            mode=mode
-        )
+        with self._invalidating(path, entry=True):
+            response_obj = self._send_request(
+                FuseOpType.MKDIR,
+                path=path,
+                mode=mode
+            )
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
             raise FuseOSError(response_obj["errno"])
@@ -293,12 +706,13 @@ class HttpFsClient(_FuseLogger, Operations):
         :param dev: Whether node is a 'special file' (i/o device)
         :return:
         """
-        response_obj = self._send_request(
-            FuseOpType.MKNOD,
-            path=path,
-            mode=mode,
-            device=dev
-        )
+        with self._invalidating(path, entry=True):
+            response_obj = self._send_request(
+                FuseOpType.MKNOD,
+                path=path,
+                mode=mode,
+                device=dev
+            )
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
             raise FuseOSError(response_obj["errno"])
@@ -311,19 +725,67 @@ class HttpFsClient(_FuseLogger, Operations):
         :return:
         """
         uid, gid, _ = fuse_get_context()
-        response_obj = self._send_request(
-            FuseOpType.OPEN,
-            path=path,
-            flags=flags,
-            uid=uid,
-            gid=gid
-        )
+        is_read_only = flags & os.O_ACCMODE == os.O_RDONLY
 
-        if response_obj["errno"] != 0:
-            logging.error(response_obj["data"])
-            raise FuseOSError(response_obj["errno"])
+        # Buffered writes to the file must be visible to the new handle
+        if self._dirty_bytes > 0:
+            self._flush_path_writes(path)
 
-        return response_obj["data"]
+        # The kernel's cached data for the file is only kept if the
+        # attributes libfuse gets after open() are unchanged, so they must
+        # come from the server
+        if self._coherent_cache:
+            self._attr_cache.invalidate(path)
+
+        # Read-only handles key the block cache on the version of the file
+        # opened, which cached attributes may be older than, so it is
+        # fetched in the same round trip
+        requests = [
+            (FuseOpType.OPEN, dict(path=path, flags=flags, uid=uid, gid=gid))
+        ]
+        needs_attrs = self._coherent_cache and self._attr_cache.get_attrs(path) is MISSING
+        if is_read_only or needs_attrs:
+            requests.append((FuseOpType.GET_ATTR, dict(path=path)))
+
+        generation = self._attr_cache.get_generation()
+        open_result, *getattr_result = self.compound(requests)
+
+        if open_result["errno"] != 0:
+            logging.error(open_result["data"])
+            raise FuseOSError(open_result["errno"])
+
+        remote_handle = RemoteHandle(open_result["data"], path, flags, uid, gid)
+        attrs = None
+        if getattr_result and getattr_result[0]["errno"] == 0:
+            attrs = getattr_result[0]["data"]
+            self._attr_cache.put_attrs(path, attrs, generation=generation)
+
+        if not is_read_only:
+            fh = self._handles.add(remote_handle)
+            if self._writeback:
+                self._add_write_buffer(fh, path, uid, gid)
+            return fh
+
+        # Read-only handles go through the block cache
+        if attrs is None:
+            return self._handles.add(remote_handle)
+
+        # Cached blocks belong to this version of the file, so the handle
+        # can only be reopened on the same version
+        remote_handle.version = (attrs["st_mtime"], attrs["st_size"])
+        fh = self._handles.add(remote_handle)
+        reader = BlockReader(
+            self._block_cache,
+            path,
+            remote_handle.version,
+            attrs["st_size"],
+            executor=self._prefetch_executor,
+            window=self._readahead
+        )
+        with self._readers_lock:
+            self._readers[fh] = reader
+
+        return fh
 
     def read(self, path, size, offset, fh=None):
         """
@@ -336,9 +798,25 @@ class HttpFsClient(_FuseLogger, Operations):
         :return:
         """
         uid, gid, _ = fuse_get_context()
-        response_obj = self._send_request(
+        fetch = partial(self._read_remote, path, fh, uid, gid)
+
+        # Reads must see writes buffered through any handle of the file
+        if self._dirty_bytes > 0:
+            self._flush_path_writes(path)
+
+        reader = self._readers.get(fh)
+        if reader is not None:
+            return reader.read(size, offset, fetch)
+
+        return fetch(offset, size)
+
+    def _read_remote(self, path, fh, uid, gid, offset, size):
+        """
+        Reads from the server, bypassing the block cache
+        """
+        response_obj = self._send_handle_request(
             FuseOpType.READ,
-            file_descriptor=fh,
+            fh,
             size=size,
             offset=offset,
             uid=uid,
@@ -353,30 +831,132 @@ class HttpFsClient(_FuseLogger, Operations):
             )
             raise FuseOSError(response_obj["errno"])
 
+        return response_obj["data"]
+
+    def opendir(self, path):
+        """
+        Opens a directory for listing
+        :param path: Path to the directory
+        :return: A handle to list the directory with, or 0 if the server
+            can't list directories in pages
+        """
+        if not self._server_supports(FuseOpType.READDIR_PAGE):
+            return 0
+
+        uid, gid, _ = fuse_get_context()
+        response_obj = self._send_request(
+            FuseOpType.OPENDIR,
+            path=path,
+            uid=uid,
+            gid=gid
+        )
+        if response_obj["errno"] != 0:
+            raise FuseOSError(response_obj["errno"])
+
+        return self._handles.add(
+            RemoteHandle(response_obj["data"], path, os.O_RDONLY, uid, gid, directory=True)
+        )
+
+    def releasedir(self, path, fh):
+        """
+        Closes a directory handle returned by opendir()
+        :param path: Path to the directory
+        :param fh: The handle
+        """
+        if not fh:
+            return 0
+
         try:
-            return base64.standard_b64decode(response_obj["data"])
-        except binascii.Error as encoding_error:
-            logging.error("Error decoding read data: '%s'", encoding_error)
-            raise FuseOSError(errno.EIO)
+            response_obj = self._send_handle_request(FuseOpType.RELEASE, fh)
+        finally:
+            self._handles.remove(fh)
+
+        # The server may have closed it already
+        if response_obj["errno"] not in (0, errno.EBADF):
+            logging.warning("Releasing %s failed: %s", path, response_obj["data"])
+        return 0
 
     def readdir(self, path, fh=None):
         """
         Return the directory listing at path
         :param path: Path to directory to list
         :param fh: Optional file handle for the directory
-        :return: List of directory entries
+        :return: Iterable of directory entries
         """
+        # Directories opened with opendir() are listed a page at a time
+        if fh:
+            return self._readdir_pages(path, fh)
+
         uid, gid, _ = fuse_get_context()
+
+        if not self._server_supports(FuseOpType.READDIR_PLUS):
+            response_obj = self._send_request(
+                FuseOpType.READDIR,
+                path=path,
+                uid=uid,
+                gid=gid
+            )
+            if response_obj["errno"] == 0:
+                return response_obj["data"]
+
+            raise FuseOSError(response_obj["errno"])
+
+        generation = self._attr_cache.get_generation()
         response_obj = self._send_request(
-            FuseOpType.READDIR,
+            FuseOpType.READDIR_PLUS,
             path=path,
             uid=uid,
             gid=gid
         )
-        if response_obj["errno"] == 0:
-            return response_obj["data"]
+        if response_obj["errno"] != 0:
+            raise FuseOSError(response_obj["errno"])
 
-        raise FuseOSError(response_obj["errno"])
+        # Seed the attribute cache so listing the directory doesn't cost a
+        # GET_ATTR per entry
+        dir_listing = list()
+        for name, attrs in response_obj["data"]:
+            if name not in (".", ".."):
+                self._attr_cache.put_attrs(
+                    os.path.join(path, name),
+                    attrs,
+                    generation=generation
+                )
+            dir_listing.append(name)
+
+        return dir_listing
+
+    def _readdir_pages(self, path, fh):
+        """
+        Generator listing an open directory one READDIR_PAGE at a time, so
+        memory use doesn't grow with the size of the directory
+        """
+        yield "."
+        yield ".."
+
+        offset = 0
+        while True:
+            generation = self._attr_cache.get_generation()
+            response_obj = self._send_handle_request(
+                FuseOpType.READDIR_PAGE,
+                fh,
+                offset=offset,
+                count=HttpFsClient._READDIR_PAGE_SIZE
+            )
+            if response_obj["errno"] != 0:
+                raise FuseOSError(response_obj["errno"])
+
+            page = response_obj["data"]
+            for name, attrs in page["entries"]:
+                self._attr_cache.put_attrs(
+                    os.path.join(path, name),
+                    attrs,
+                    generation=generation
+                )
+                yield name
+
+            if page["eof"]:
+                return
+            offset = page["offset"]
 
     def readlink(self, link):
         """
@@ -400,11 +980,24 @@ class HttpFsClient(_FuseLogger, Operations):
         :param fh: Optional file handle
         :return:
         """
-        response_obj = self._send_request(
-            FuseOpType.RELEASE,
-            file_descriptor=fh
-        )
-        if response_obj["errno"] != 0:
+        with self._readers_lock:
+            reader = self._readers.pop(fh, None)
+        if reader is not None:
+            reader.close()
+
+        try:
+            self._flush_writes(fh)
+        finally:
+            with self._write_buffers_lock:
+                self._write_buffers.pop(fh, None)
+
+            try:
+                response_obj = self._send_handle_request(FuseOpType.RELEASE, fh)
+            finally:
+                self._handles.remove(fh)
+
+        # A handle the server already closed has nothing left to release
+        if response_obj["errno"] not in (0, errno.EBADF):
             logging.error(response_obj["data"])
             raise FuseOSError(response_obj["errno"])
 
@@ -416,17 +1009,27 @@ class HttpFsClient(_FuseLogger, Operations):
         :return:
         """
         uid, gid, _ = fuse_get_context()
-        response_obj = self._send_request(
-            FuseOpType.RENAME,
-            old_path=old,
-            new_path=new,
-            uid=uid,
-            gid=gid
-        )
+
+        # Buffered writes are sent to the path the file was opened with
+        if self._dirty_bytes > 0:
+            self._flush_path_writes(old)
+
+        with self._invalidating(new, entry=True), \
+                self._invalidating(old, entry=True, tree=True):
+            response_obj = self._send_request(
+                FuseOpType.RENAME,
+                old_path=old,
+                new_path=new,
+                uid=uid,
+                gid=gid
+            )
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
             raise FuseOSError(response_obj["errno"])
 
+        # Open files are reopened at their new path
+        self._handles.rename(old, new)
+
     def rmdir(self, path, *args, dir_fh=None):
         """
         Removes the directory at path
@@ -435,10 +1038,11 @@ class HttpFsClient(_FuseLogger, Operations):
         :param dir_fh: Optional file handle for the directory
         :return:
         """
-        response_obj = self._send_request(
-            FuseOpType.RM_DIR,
-            path=path
-        )
+        with self._invalidating(path, entry=True, tree=True):
+            response_obj = self._send_request(
+                FuseOpType.RM_DIR,
+                path=path
+            )
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
             raise FuseOSError(response_obj["errno"])
@@ -463,11 +1067,12 @@ class HttpFsClient(_FuseLogger, Operations):
         :param source: New symlink
         :return:
         """
-        response_obj = self._send_request(
-            FuseOpType.SYMLINK,
-            target=target,
-            source=source
-        )
+        with self._invalidating(target, entry=True):
+            response_obj = self._send_request(
+                FuseOpType.SYMLINK,
+                target=target,
+                source=source
+            )
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
             raise FuseOSError(response_obj["errno"])
@@ -480,11 +1085,16 @@ class HttpFsClient(_FuseLogger, Operations):
         :param fh: Optional file handle
         :return:
         """
-        response_obj = self._send_request(
-            FuseOpType.TRUNCATE,
-            path=path,
-            length=length
-        )
+        # Buffered writes must land before the file is cut
+        if self._dirty_bytes > 0:
+            self._flush_path_writes(path)
+
+        with self._invalidating(path, data=True):
+            response_obj = self._send_request(
+                FuseOpType.TRUNCATE,
+                path=path,
+                length=length
+            )
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
             raise FuseOSError(response_obj["errno"])
@@ -498,12 +1108,13 @@ class HttpFsClient(_FuseLogger, Operations):
         :return:
         """
         uid, gid, _ = fuse_get_context()
-        response_obj = self._send_request(
-            FuseOpType.UNLINK,
-            path=path,
-            uid=uid,
-            gid=gid
-        )
+        with self._invalidating(path, entry=True):
+            response_obj = self._send_request(
+                FuseOpType.UNLINK,
+                path=path,
+                uid=uid,
+                gid=gid
+            )
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
             raise FuseOSError(response_obj["errno"])
@@ -524,13 +1135,14 @@ class HttpFsClient(_FuseLogger, Operations):
         :return:
         """
         uid, gid, _ = fuse_get_context()
-        response_obj = self._send_request(
-            FuseOpType.UTIMENS,
-            path=path,
-            times=times,
-            uid=uid,
-            gid=gid
-        )
+        with self._invalidating(path):
+            response_obj = self._send_request(
+                FuseOpType.UTIMENS,
+                path=path,
+                times=times,
+                uid=uid,
+                gid=gid
+            )
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
             raise FuseOSError(response_obj["errno"])
@@ -544,21 +1156,48 @@ class HttpFsClient(_FuseLogger, Operations):
         :param fh: Optional file handle
         :return: The number of bytes actually written
         """
-        start_time = time.time()
         uid, gid, _ = fuse_get_context()
 
-        response_obj = self._send_request(
-            FuseOpType.WRITE,
-            file_descriptor=fh,
-            data=base64.standard_b64encode(data).decode("utf-8"),
-            offset=offset,
-            uid=uid,
-            gid=gid
-        )
+        with self._write_buffers_lock:
+            write_buffer = self._write_buffers.get(fh)
+
+        if write_buffer is None:
+            return self._write_remote(path, fh, data, offset, uid, gid)
+
+        dirty_change = write_buffer.add(offset, data)
+        self._attr_cache.invalidate(path)
+        self._block_cache.invalidate(path)
+
+        with self._write_buffers_lock:
+            self._dirty_bytes += dirty_change
+            over_limit = self._dirty_bytes > self._writeback_limit
+
+        # Errors are kept and reported by the next flush
+        if over_limit:
+            self._flush_writes(fh, report=False)
+
+        return len(data)
+
+    def _write_remote(self, path, fh, data, offset, uid, gid):
+        """
+        Sends a write to the server
+        :return: The number of bytes written
+        """
+        start_time = time.time()
+
+        with self._invalidating(path, data=True):
+            response_obj = self._send_handle_request(
+                FuseOpType.WRITE,
+                fh,
+                data=data,
+                offset=offset,
+                uid=uid,
+                gid=gid
+            )
 
         if response_obj["errno"] != 0:
             logging.error(response_obj["data"])
-            return FuseOSError(response_obj["errno"])
+            raise FuseOSError(response_obj["errno"])
 
         bytes_written = response_obj["data"]
         elapsed_time = time.time() - start_time
@@ -573,3 +1212,74 @@ class HttpFsClient(_FuseLogger, Operations):
         )
 
         return bytes_written
+
+    def _add_write_buffer(self, fh, path, uid, gid):
+        with self._write_buffers_lock:
+            self._write_buffers[fh] = WriteBuffer(path, uid, gid)
+
+    def _flush_writes(self, fh, report=True):
+        """
+        Sends a file handle's buffered writes to the server. Adjacent writes
+        have already been merged, so each dirty range is sent as one request
+        (split at _MAX_WRITE_SIZE)
+        :param fh: The file handle
+        :param report: Whether to raise the first error hit by this or any
+            earlier flush of the handle
+        """
+        with self._write_buffers_lock:
+            write_buffer = self._write_buffers.get(fh)
+
+        if write_buffer is None:
+            return
+
+        with write_buffer.flush_lock:
+            dirty_ranges = write_buffer.pop_all()
+
+            # Bytes being sent still count as dirty until the server has
+            # them, so reads know to wait for the flush
+            try:
+                for offset, data in dirty_ranges:
+                    try:
+                        self._write_range(write_buffer, fh, offset, data)
+                    except FuseOSError as error:
+                        if write_buffer.error is None:
+                            write_buffer.error = error
+            finally:
+                with self._write_buffers_lock:
+                    self._dirty_bytes -= sum(len(data) for _, data in dirty_ranges)
+
+            if report and write_buffer.error is not None:
+                error = write_buffer.error
+                write_buffer.error = None
+                raise FuseOSError(error.errno)
+
+    def _flush_path_writes(self, path):
+        """
+        Sends the buffered writes of every handle open on path, and waits
+        for flushes of them already under way. Errors are kept for the
+        handles' next flush
+        """
+        with self._write_buffers_lock:
+            handles = [
+                fh for fh, write_buffer in self._write_buffers.items()
+                if write_buffer.path == path and (len(write_buffer) > 0 or write_buffer.flush_lock.locked())
+            ]
+
+        for fh in handles:
+            self._flush_writes(fh, report=False)
+
+    def _write_range(self, write_buffer, fh, offset, data):
+        view = memoryview(data)
+
+        for start in range(0, len(view), HttpFsClient._MAX_WRITE_SIZE):
+            chunk = view[start:start + HttpFsClient._MAX_WRITE_SIZE]
+            bytes_written = self._write_remote(
+                write_buffer.path,
+                fh,
+                chunk,
+                offset + start,
+                write_buffer.uid,
+                write_buffer.gid
+            )
+            if bytes_written != len(chunk):
+                raise FuseOSError(errno.EIO)
@@ -0,0 +1,101 @@
+"""
+Contains a buffer of not yet written data for an open file handle
+"""
+
+import bisect
+import threading
+
+
+class WriteBuffer:
+    """
+    The dirty byte ranges of one open file handle. Overlapping and adjacent
+    writes are merged as they arrive, so a sequential writer ends up with a
+    single large range that can be sent in one request.
+    """
+
+    def __init__(self, path, uid, gid):
+        """
+        :param path: Path of the open file
+        :param uid: User id the file was opened by
+        :param gid: Group id the file was opened by
+        """
+        self.path = path
+        self.uid = uid
+        self.gid = gid
+
+        #: First error hit while writing buffered data, reported by the next
+        #: flush
+        self.error = None
+
+        #: Held while buffered data is being sent so flushes of the same
+        #: handle can't reorder overlapping writes
+        self.flush_lock = threading.Lock()
+
+        self._offsets = list()
+        self._ranges = list()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """
+        :return: Number of dirty bytes
+        """
+        return self._size
+
+    def add(self, offset, data):
+        """
+        Buffers a write. Newer data replaces older data where they overlap
+        :param offset: Offset of the write
+        :param data: Bytes written
+        :return: Change in the number of dirty bytes
+        """
+        end = offset + len(data)
+
+        with self._lock:
+            old_size = self._size
+
+            # Fast path for sequential writers
+            if self._ranges and self._offsets[-1] + len(self._ranges[-1]) == offset:
+                self._ranges[-1] += data
+                self._size += len(data)
+                return len(data)
+
+            # Find every range that overlaps or touches [offset, end]
+            first = bisect.bisect_left(self._offsets, offset)
+            if first > 0 and self._offsets[first - 1] + len(self._ranges[first - 1]) >= offset:
+                first -= 1
+            last = bisect.bisect_right(self._offsets, end)
+
+            merged_start = offset
+            merged_end = end
+            if first < last:
+                merged_start = min(offset, self._offsets[first])
+                merged_end = max(
+                    end,
+                    self._offsets[last - 1] + len(self._ranges[last - 1])
+                )
+
+            merged = bytearray(merged_end - merged_start)
+            for range_offset, range_data in zip(self._offsets[first:last], self._ranges[first:last]):
+                start = range_offset - merged_start
+                merged[start:start + len(range_data)] = range_data
+                self._size -= len(range_data)
+            merged[offset - merged_start:end - merged_start] = data
+
+            self._offsets[first:last] = [merged_start]
+            self._ranges[first:last] = [merged]
+            self._size += len(merged)
+
+            return self._size - old_size
+
+    def pop_all(self):
+        """
+        Removes and returns all dirty ranges
+        :return: List of (offset, bytearray) in offset order
+        """
+        with self._lock:
+            ranges = list(zip(self._offsets, self._ranges))
+            self._offsets = list()
+            self._ranges = list()
+            self._size = 0
+            return ranges
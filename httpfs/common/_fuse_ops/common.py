@@ -1,8 +1,12 @@
+import base64
+from contextlib import contextmanager
 from enum import auto, IntEnum, unique
 from abc import ABC, abstractmethod
 
 import ujson
 
+from ..dir_fd_cache import ParentDir
+
 
 @unique
 class FuseOpType(IntEnum):
@@ -29,6 +33,15 @@ class FuseOpType(IntEnum):
     WRITE = auto()
     CHOWN = auto()
     CHMOD = auto()
+    HELLO = auto()
+    READDIR_PLUS = auto()
+    COMPOUND = auto()
+    OPENDIR = auto()
+    READDIR_PAGE = auto()
+    SUBSCRIBE = auto()
+
+    #: Pushed by the server to subscribed connections, never requested
+    INVALIDATE = auto()
 
 
 class FuseOpResult:
@@ -54,7 +67,11 @@ class FuseOpResult:
             yield k, getattr(self, k)
 
     def to_json(self):
-        return ujson.dumps(dict(self))
+        as_dict = dict(self)
+        # Raw bytes (e.g. read results) can't be represented in JSON
+        if isinstance(self.data, (bytes, bytearray, memoryview)):
+            as_dict["data"] = base64.standard_b64encode(self.data).decode("utf-8")
+        return ujson.dumps(as_dict)
 
 
 class FuseOp(ABC):
@@ -62,4 +79,32 @@ class FuseOp(ABC):
     def handle(self, *args, **kwargs) -> FuseOpResult:
         pass
 
+    @staticmethod
+    @contextmanager
+    def use_fd(kwargs, mode=0):
+        """
+        Keeps the file descriptor behind the request's file handle open for
+        the duration of the with-block, even if the handle is released
+        meanwhile
+        :param kwargs: The request's arguments
+        :param mode: The access the request needs, os.R_OK and/or os.W_OK
+        :raises HandleError: If the request's file handle isn't open with the
+            access needed
+        :return: The file descriptor
+        """
+        open_files = kwargs.get("open_files")
+        if open_files is None:
+            yield kwargs["file_descriptor"]
+        else:
+            with open_files.use(kwargs["file_descriptor"], mode) as fd:
+                yield fd
+
+    @staticmethod
+    def open_parent(kwargs):
+        """
+        :param kwargs: The request's arguments
+        :return: A ParentDir for the request's path
+        """
+        return ParentDir(kwargs.get("dir_fds"), kwargs["path"])
+
 # TODO: Write a check_permissions(uid, gid, mode) helper
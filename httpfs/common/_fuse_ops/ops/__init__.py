@@ -1,21 +1,27 @@
 from .access import AccessOp
 from .chmod import ChmodOp
 from .chown import ChownOp
+from .compound import CompoundOp
 from .create import CreateOp
 from .flush import FlushOp
 from .fsync import FsyncOp
 from .getattr import GetAttrOp
+from .hello import HelloOp
 from .link import LinkOp
 from .mkdir import MkDirOp
 from .mknod import MkNodOp
 from .open import OpenOp
+from .opendir import OpenDirOp
 from .read import ReadOp
 from .readdir import ReadDirOp
+from .readdir_page import ReadDirPageOp
+from .readdir_plus import ReadDirPlusOp
 from .readlink import ReadLinkOp
 from .release import ReleaseOp
 from .rename import RenameOp
 from .rmdir import RmDirOp
 from .statfs import StatFsOp
+from .subscribe import SubscribeOp
 from .symlink import SymlinkOp
 from .truncate import TruncateOp
 from .unlink import UnlinkOp
@@ -0,0 +1,59 @@
+import errno
+import logging
+
+from .. import FuseOp, FuseOpResult, FuseOpType
+
+
+class CompoundOp(FuseOp):
+    #: Sub-ops that use the file descriptor opened earlier in the compound
+    #: when they don't name one
+    _FD_OPS = (FuseOpType.FLUSH, FuseOpType.FSYNC, FuseOpType.RELEASE)
+
+    #: Sub-ops that can't be batched. File data doesn't fit in the JSON
+    #: results, and compounds don't nest
+    _UNSUPPORTED_OPS = (
+        FuseOpType.COMPOUND,
+        FuseOpType.HELLO,
+        FuseOpType.READ,
+        FuseOpType.WRITE
+    )
+
+    def handle(self, *args, **kwargs):
+        result = FuseOpResult()
+        sub_results = list()
+        current_fd = None
+
+        # Imported here because the factory imports this module
+        from ...fuse_op_factory import FuseOpFactory
+
+        for sub_op in kwargs["ops"]:
+            try:
+                op_type = FuseOpType(sub_op["type"])
+            except (KeyError, ValueError):
+                op_type = None
+
+            if op_type is None or op_type in CompoundOp._UNSUPPORTED_OPS:
+                logging.warning("Error during compound request: Can't batch {}".format(sub_op.get("type")))
+                sub_result = FuseOpResult(errno.EINVAL, "Can't batch op {}".format(sub_op.get("type")))
+            else:
+                if current_fd is not None and op_type in CompoundOp._FD_OPS:
+                    sub_op.setdefault("file_descriptor", current_fd)
+
+                try:
+                    sub_result = FuseOpFactory.get_op_handler(op_type).handle(**sub_op)
+                except Exception as e:
+                    logging.error("Error during compound request: {}".format(e))
+                    sub_result = FuseOpResult(errno.EIO, str(e))
+
+            sub_results.append(dict(sub_result))
+
+            # Stop at the first failure
+            if sub_result.errno != 0:
+                result.errno = sub_result.errno
+                break
+
+            if op_type in (FuseOpType.OPEN, FuseOpType.CREATE):
+                current_fd = sub_result.data
+
+        result.data = sub_results
+        return result
@@ -3,6 +3,7 @@ import stat
 import logging
 import errno
 from .. import FuseOp, FuseOpResult
+from ...open_file_table import HandleLimitError
 
 
 class CreateOp(FuseOp):
@@ -12,6 +13,7 @@ class CreateOp(FuseOp):
         uid = kwargs["uid"]
         gid = kwargs["gid"]
         mode = kwargs["mode"]
+        open_files = kwargs.get("open_files")
 
         dir_stats = os.stat(os.path.dirname(path))
         is_dir_owner = dir_stats.st_uid == uid
@@ -34,12 +36,24 @@ class CreateOp(FuseOp):
                     mode=mode
                 )
                 os.chown(path, uid, gid)
+                if open_files is not None:
+                    fd = open_files.add(
+                        fd,
+                        os.W_OK,
+                        path=path,
+                        client=kwargs.get("client")
+                    )
                 response.data = fd
             else:
                 logging.warning("Error during create request: Access denied")
                 response.errno = errno.EACCES
                 response.data = "Access denied"
 
+        except HandleLimitError as e:
+            logging.warning("Error during create request: {}".format(e.strerror))
+            response.errno = e.errno
+            response.data = e.strerror
+
         except Exception as e:
             logging.error("Error during create request: {}".format(e))
             response.errno = errno.EIO
@@ -2,6 +2,7 @@ import os
 import logging
 import errno
 from .. import FuseOp, FuseOpResult
+from ...open_file_table import HandleError
 
 
 class FlushOp(FuseOp):
@@ -9,7 +10,12 @@ class FlushOp(FuseOp):
         result = FuseOpResult()
 
         try:
-            os.fsync(kwargs["file_descriptor"])
+            with self.use_fd(kwargs) as file_descriptor:
+                os.fsync(file_descriptor)
+        except HandleError as e:
+            logging.warning("Error during flush request: {}".format(e.strerror))
+            result.errno = e.errno
+            result.data = e.strerror
         except Exception as e:
             logging.error("Error during flush request: {}".format(e))
             result.errno = errno.EIO
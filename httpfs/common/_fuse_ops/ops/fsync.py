@@ -2,18 +2,23 @@ import os
 import logging
 import errno
 from .. import FuseOp, FuseOpResult
+from ...open_file_table import HandleError
 
 
 class FsyncOp(FuseOp):
     def handle(self, *args, **kwargs):
         result = FuseOpResult()
-        file_desc = kwargs["file_descriptor"]
 
         try:
-            if kwargs["datasync"]:
-                os.fdatasync(file_desc)
-            else:
-                os.fsync(file_desc)
+            with self.use_fd(kwargs) as file_desc:
+                if kwargs["datasync"]:
+                    os.fdatasync(file_desc)
+                else:
+                    os.fsync(file_desc)
+        except HandleError as e:
+            logging.warning("Error during fsync request: {}".format(e.strerror))
+            result.errno = e.errno
+            result.data = e.strerror
         except Exception as e:
             logging.error("Error during fsync request: {}".format(e))
             result.errno = errno.EIO
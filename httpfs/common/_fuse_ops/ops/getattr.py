@@ -16,18 +16,25 @@ class GetAttrOp(FuseOp):
         'st_uid'
     ]
 
+    @staticmethod
+    def stat_to_dict(os_attrs):
+        """
+        :param os_attrs: An os.stat_result
+        :return: The GETATTR_KEYS fields of os_attrs as a dict
+        """
+        attrs = dict()
+        for k in GetAttrOp.GETATTR_KEYS:
+            attrs[k] = getattr(os_attrs, k)
+        return attrs
+
     def handle(self, *args, **kwargs):
         result = FuseOpResult()
         path = kwargs["path"]
 
         try:
-            os_attrs = os.lstat(path)
-            attrs = dict()
-
-            for k in GetAttrOp.GETATTR_KEYS:
-                attrs[k] = getattr(os_attrs, k)
-
-            result.data = attrs
+            with self.open_parent(kwargs) as (dir_fd, name):
+                os_attrs = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+            result.data = GetAttrOp.stat_to_dict(os_attrs)
 
         except FileNotFoundError:
             logging.warning("{} not found".format(path))
@@ -0,0 +1,41 @@
+from .. import FuseOp, FuseOpResult
+from ...compression import choose_codec
+from ...wire_protocol import WIRE_VERSION
+
+
+class HelloOp(FuseOp):
+    _MAX_SESSION_LENGTH = 64
+
+    def handle(self, *args, **kwargs):
+        result = FuseOpResult()
+
+        # Pick the newest binary protocol version both sides speak, or None
+        # to stay on JSON
+        client_versions = kwargs.get("wire_versions", [])
+        common_versions = [v for v in client_versions if v <= WIRE_VERSION]
+
+        # Imported here because the factory imports this module
+        from ...fuse_op_factory import FuseOpFactory
+
+        wire_version = max(common_versions) if common_versions else None
+
+        # Payloads are only compressed in binary frames
+        if wire_version is not None:
+            codec = choose_codec(kwargs.get("compression", []))
+        else:
+            codec = None
+
+        # Clients name a session to keep their open files across
+        # reconnects. The server joins the connection to it after answering
+        session = kwargs.get("session")
+        if not isinstance(session, str) or not 0 < len(session) <= HelloOp._MAX_SESSION_LENGTH:
+            session = None
+
+        result.data = {
+            "wire_version": wire_version,
+            "ops": FuseOpFactory.get_supported_ops(),
+            "compression": codec,
+            "session": session
+        }
+
+        return result
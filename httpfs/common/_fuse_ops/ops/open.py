@@ -4,6 +4,7 @@ import errno
 import stat
 
 from .. import FuseOp, FuseOpResult
+from ...open_file_table import HandleLimitError, OpenFileTable
 
 
 class OpenOp(FuseOp):
@@ -17,6 +18,7 @@ class OpenOp(FuseOp):
 
         uid = kwargs["uid"]
         gid = kwargs["gid"]
+        open_files = kwargs.get("open_files")
 
         dir_stats = os.stat(os.path.dirname(path))
         is_dir_owner = dir_stats.st_uid == uid
@@ -36,43 +38,45 @@ class OpenOp(FuseOp):
             is_owner = file_stats.st_uid == uid
             is_group = file_stats.st_gid == gid
 
-            read_requested = (
-                flags & os.O_RDONLY or
-                flags & os.O_RDWR or
-                flags & os.O_EXCL
-            )
-            write_requested = (
-                flags & os.O_WRONLY or
-                flags & os.O_RDWR or
-                flags & os.O_APPEND
-            )
+            mode = OpenFileTable.flags_to_mode(flags)
+            if flags & os.O_TRUNC:
+                mode |= os.W_OK
 
             if uid == 0:
                 access_ok = True
-            elif is_owner:
-                if read_requested:
-                    access_ok = file_stats.st_mode & stat.S_IRUSR
-                elif write_requested:
-                    access_ok = file_stats.st_mode & stat.S_IWUSR
-            elif is_group:
-                if read_requested:
-                    access_ok = file_stats.st_mode & stat.S_IRGRP
-                elif write_requested:
-                    access_ok = file_stats.st_mode & stat.S_IWGRP
             else:
-                if read_requested:
-                    access_ok = file_stats.st_mode & stat.S_IROTH
-                elif write_requested:
-                    access_ok = file_stats.st_mode & stat.S_IROTH
+                if is_owner:
+                    read_bit, write_bit = stat.S_IRUSR, stat.S_IWUSR
+                elif is_group:
+                    read_bit, write_bit = stat.S_IRGRP, stat.S_IWGRP
+                else:
+                    read_bit, write_bit = stat.S_IROTH, stat.S_IWOTH
+
+                read_ok = not mode & os.R_OK or file_stats.st_mode & read_bit
+                write_ok = not mode & os.W_OK or file_stats.st_mode & write_bit
+                access_ok = read_ok and write_ok
 
         try:
             if access_ok:
-                result.data = os.open(path, flags)
+                fd = os.open(path, flags)
+                if open_files is not None:
+                    fd = open_files.add(
+                        fd,
+                        OpenFileTable.flags_to_mode(flags),
+                        path=path,
+                        client=kwargs.get("client")
+                    )
+                result.data = fd
             else:
                 result.errno = errno.EACCES
                 result.data = "Access denied"
                 logging.warning("Error during open request: Access denied")
 
+        except HandleLimitError as e:
+            logging.warning("Error during open request: {}".format(e.strerror))
+            result.errno = e.errno
+            result.data = e.strerror
+
         except Exception as e:
             logging.error("Error during open request: {}".format(e))
             result.errno = errno.EIO
@@ -0,0 +1,84 @@
+import os
+import logging
+import errno
+import stat
+
+from .. import FuseOp, FuseOpResult
+from ...dir_stream import DirStream
+from ...open_file_table import HandleLimitError
+
+
+class OpenDirOp(FuseOp):
+    """
+    Opens a directory to be listed a page at a time with READDIR_PAGE. The
+    handle is closed with RELEASE
+    """
+
+    @staticmethod
+    def _open_stream(fd, path, dir_stats, dir_listings):
+        """
+        :return: A DirStream that reads the directory's names from the
+            listing cache, or lists it and caches the names
+        """
+        if dir_listings is None:
+            return DirStream(fd)
+
+        names = dir_listings.get(path, dir_stats)
+        if names is not None:
+            return DirStream(fd, names=names[2:])
+
+        def on_listed(listed):
+            dir_listings.put(path, dir_stats, [".", ".."] + listed)
+
+        return DirStream(fd, on_listed=on_listed)
+
+    def handle(self, *args, **kwargs):
+        result = FuseOpResult()
+
+        path = kwargs["path"]
+        uid = kwargs["uid"]
+        gid = kwargs["gid"]
+        open_files = kwargs.get("open_files")
+
+        try:
+            file_stats = os.stat(path)
+            is_owner = file_stats.st_uid == uid
+            is_group = file_stats.st_gid == gid
+
+            if uid == 0:
+                access_ok = True
+            elif is_owner:
+                access_ok = file_stats.st_mode & stat.S_IRUSR
+            elif is_group:
+                access_ok = file_stats.st_mode & stat.S_IRGRP
+            else:
+                access_ok = file_stats.st_mode & stat.S_IROTH
+
+            if not access_ok:
+                logging.warning("Error during opendir request: Access denied")
+                result.errno = errno.EACCES
+                result.data = "Access denied"
+                return result
+
+            fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+            if open_files is not None:
+                fd = open_files.add(
+                    fd,
+                    os.R_OK,
+                    path=path,
+                    client=kwargs.get("client"),
+                    stream=OpenDirOp._open_stream(fd, path, file_stats, kwargs.get("dir_listings"))
+                )
+            result.data = fd
+
+        except HandleLimitError as e:
+            logging.warning("Error during opendir request: {}".format(e.strerror))
+            result.errno = e.errno
+            result.data = e.strerror
+
+        except OSError as e:
+            logging.warning("Error during opendir request: {}".format(e))
+            result.errno = e.errno
+            result.data = e.strerror
+
+        return result
@@ -1,46 +1,40 @@
-import base64
 import os
 import logging
 import errno
-import stat
 
 from .. import FuseOp, FuseOpResult
+from ...open_file_table import HandleError
+from ...wire_protocol import FileRange
 
 
 class ReadOp(FuseOp):
+    #: Smallest read sent with sendfile() when the response is a binary frame
+    _ZERO_COPY_MIN_SIZE = 64 * 1024
+
     def handle(self, *args, **kwargs):
         result = FuseOpResult()
 
-        file_descriptor = kwargs["file_descriptor"]
         offset = kwargs["offset"]
         size = kwargs["size"]
 
-        uid = kwargs["uid"]
-        gid = kwargs["gid"]
-
-        file_stats = os.stat(file_descriptor)
-        is_owner = file_stats.st_uid == uid
-        is_group = file_stats.st_gid == gid
-
-        if uid == 0:
-            access_ok = True
-        elif is_owner:
-            access_ok = file_stats.st_mode & stat.S_IRUSR
-        elif is_group:
-            access_ok = file_stats.st_mode & stat.S_IRGRP
-        else:
-            access_ok = file_stats.st_mode & stat.S_IROTH
-
+        # Permissions were checked when the file was opened
         try:
-            if access_ok:
-                os.lseek(file_descriptor, offset, os.SEEK_SET)
-                result.data = base64.standard_b64encode(
-                    os.read(file_descriptor, size)
-                ).decode("utf-8")
-            else:
-                logging.warning("Error during read request: Access denied")
-                result.errno = errno.EACCES
-                result.data = "Access denied"
+            with self.use_fd(kwargs, os.R_OK) as file_descriptor:
+                if kwargs.get("zero_copy") and size >= ReadOp._ZERO_COPY_MIN_SIZE:
+                    # The frame header needs the exact length, so stop at EOF.
+                    # The range is sent after the request is done, and the
+                    # file may be released by then, so it gets its own
+                    # descriptor
+                    file_size = os.fstat(file_descriptor).st_size
+                    size = max(0, min(size, file_size - offset))
+                    result.data = FileRange(os.dup(file_descriptor), offset, size)
+                else:
+                    result.data = os.pread(file_descriptor, size, offset)
+
+        except HandleError as e:
+            logging.warning("Error during read request: {}".format(e.strerror))
+            result.errno = e.errno
+            result.data = e.strerror
 
         except Exception as e:
             logging.error("Error during read request: {}".format(e))
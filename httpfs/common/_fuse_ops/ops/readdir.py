@@ -28,8 +28,17 @@ class ReadDirOp(FuseOp):
             access_ok = file_stats.st_mode & stat.S_IROTH
 
         if access_ok:
-            dir_listing = os.listdir(path)
-            dir_listing = [".", ".."] + dir_listing
+            # Repeated listings of an unchanged directory come from the cache
+            dir_listings = kwargs.get("dir_listings")
+            dir_listing = None
+            if dir_listings is not None:
+                dir_listing = dir_listings.get(path, file_stats)
+
+            if dir_listing is None:
+                dir_listing = [".", ".."] + os.listdir(path)
+                if dir_listings is not None:
+                    dir_listings.put(path, file_stats, dir_listing)
+
             result.data = dir_listing
         else:
             logging.warning("Error during readdir request: Access denied")
@@ -0,0 +1,49 @@
+import logging
+
+from .getattr import GetAttrOp
+from .. import FuseOp, FuseOpResult
+from ...dir_stream import DirStream
+
+
+class ReadDirPageOp(FuseOp):
+    """
+    Returns the next page of a directory opened with OPENDIR, as
+    {"entries": [[name, attrs], ...], "offset": next offset, "eof": bool}.
+    "." and ".." aren't included
+    """
+
+    _DEFAULT_COUNT = 1024
+    _MAX_COUNT = 8192
+
+    def handle(self, *args, **kwargs):
+        result = FuseOpResult()
+
+        offset = kwargs.get("offset", 0)
+        count = min(kwargs.get("count", ReadDirPageOp._DEFAULT_COUNT), ReadDirPageOp._MAX_COUNT)
+        open_files = kwargs.get("open_files")
+
+        try:
+            if open_files is not None:
+                with open_files.use_stream(kwargs["file_descriptor"]) as stream:
+                    page, offset, eof = stream.read(offset, count)
+            else:
+                # Nothing outlives the request without a table, so the
+                # listing is read again up to the page
+                stream = DirStream(kwargs["file_descriptor"])
+                try:
+                    page, offset, eof = stream.read(offset, count)
+                finally:
+                    stream.close()
+
+        except OSError as e:
+            logging.warning("Error during readdir page request: {}".format(e.strerror))
+            result.errno = e.errno
+            result.data = e.strerror
+            return result
+
+        result.data = {
+            "entries": [[name, GetAttrOp.stat_to_dict(stats)] for name, stats in page],
+            "offset": offset,
+            "eof": eof
+        }
+        return result
@@ -0,0 +1,85 @@
+import os
+import logging
+import errno
+import stat
+
+from .getattr import GetAttrOp
+from .. import FuseOp, FuseOpResult
+
+
+class ReadDirPlusOp(FuseOp):
+    """
+    Like ReadDirOp, but returns [name, attrs] pairs so the client doesn't
+    need a GET_ATTR round trip per entry
+    """
+
+    def handle(self, *args, **kwargs):
+        result = FuseOpResult()
+
+        path = kwargs["path"]
+        uid = kwargs["uid"]
+        gid = kwargs["gid"]
+
+        file_stats = os.stat(path)
+        is_owner = file_stats.st_uid == uid
+        is_group = file_stats.st_gid == gid
+
+        if uid == 0:
+            access_ok = True
+        elif is_owner:
+            access_ok = file_stats.st_mode & stat.S_IRUSR
+        elif is_group:
+            access_ok = file_stats.st_mode & stat.S_IRGRP
+        else:
+            access_ok = file_stats.st_mode & stat.S_IROTH
+
+        if not access_ok:
+            logging.warning("Error during readdirplus request: Access denied")
+            result.errno = errno.EACCES
+            result.data = "Access denied"
+            return result
+
+        dir_listing = [
+            [".", GetAttrOp.stat_to_dict(file_stats)],
+            ["..", None]
+        ]
+
+        # The names of an unchanged directory come from the listing cache,
+        # but attributes are always read afresh
+        dir_listings = kwargs.get("dir_listings")
+        names = None
+        if dir_listings is not None:
+            names = dir_listings.get(path, file_stats)
+
+        if names is None:
+            names = [".", ".."]
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    names.append(entry.name)
+                    try:
+                        entry_stats = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        # Removed while we were listing
+                        continue
+                    dir_listing.append(
+                        [entry.name, GetAttrOp.stat_to_dict(entry_stats)]
+                    )
+
+            if dir_listings is not None:
+                dir_listings.put(path, file_stats, names)
+        else:
+            dir_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                for name in names[2:]:
+                    try:
+                        entry_stats = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    dir_listing.append(
+                        [name, GetAttrOp.stat_to_dict(entry_stats)]
+                    )
+            finally:
+                os.close(dir_fd)
+
+        result.data = dir_listing
+        return result
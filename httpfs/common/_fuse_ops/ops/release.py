@@ -9,6 +9,17 @@ class ReleaseOp(FuseOp):
     def handle(self, *args, **kwargs):
         result = FuseOpResult()
         fd = kwargs["file_descriptor"]
+        open_files = kwargs.get("open_files")
+
+        # Requests still using the file keep it open until they finish
+        if open_files is not None:
+            try:
+                open_files.close(fd)
+            except OSError as e:
+                logging.warning("Error during release request: {}".format(e.strerror))
+                result.errno = e.errno
+                result.data = e.strerror
+            return result
 
         try:
             os.close(fd)
@@ -32,6 +32,13 @@ class RenameOp(FuseOp):
         try:
             if access_ok:
                 os.rename(old_path, new_path)
+
+                # Cached descriptors of a moved directory point to its new
+                # location, and anything already at new_path is gone
+                dir_fds = kwargs.get("dir_fds")
+                if dir_fds is not None:
+                    dir_fds.invalidate_tree(old_path)
+                    dir_fds.invalidate_tree(new_path)
             else:
                 logging.warning("Error during rename request: Access denied")
                 result.errno = errno.EACCES
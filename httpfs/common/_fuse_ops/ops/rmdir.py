@@ -15,6 +15,10 @@ class RmDirOp(FuseOp):
 
         try:
             os.rmdir(path)
+
+            dir_fds = kwargs.get("dir_fds")
+            if dir_fds is not None:
+                dir_fds.invalidate_tree(path)
         except FileNotFoundError as e:
             logging.error("{} not found".format(path))
             _errno = errno.ENOENT
@@ -0,0 +1,31 @@
+import logging
+import errno
+
+from .. import FuseOp, FuseOpResult
+
+
+class SubscribeOp(FuseOp):
+    """
+    Asks the server to push INVALIDATE frames on this connection when any of
+    the given paths change. Paths accumulate until the connection closes.
+    An empty list keeps the connection from timing out
+    """
+
+    def handle(self, *args, **kwargs):
+        result = FuseOpResult()
+
+        change_feed = kwargs.get("change_feed")
+        push = kwargs.get("push")
+        if change_feed is None or push is None:
+            result.errno = errno.ENOTSUP
+            result.data = "Change notifications are not available"
+            return result
+
+        try:
+            change_feed.watch(kwargs.get("connection"), push, kwargs.get("paths", []))
+        except OSError as e:
+            logging.warning("Error during subscribe request: {}".format(e))
+            result.errno = e.errno
+            result.data = e.strerror
+
+        return result
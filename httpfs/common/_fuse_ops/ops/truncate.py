@@ -8,12 +8,15 @@ class TruncateOp(FuseOp):
     def handle(self, *args, **kwargs):
         result = FuseOpResult()
 
-        path = kwargs["path"]
         length = kwargs["length"]
 
         try:
-            with open(path, 'r+') as f:
-                f.truncate(length)
+            with self.open_parent(kwargs) as (dir_fd, name):
+                fd = os.open(name, os.O_WRONLY, dir_fd=dir_fd)
+            try:
+                os.ftruncate(fd, length)
+            finally:
+                os.close(fd)
         except Exception as e:
             logging.error("Error during truncate request: {}".format(e))
             result.errno = errno.EIO
@@ -10,7 +10,6 @@ class UtimeNsOp(FuseOp):
     def handle(self, *args, **kwargs):
         result = FuseOpResult()
 
-        path = kwargs["path"]
         times = kwargs["times"]
 
         if isinstance(times, list):
@@ -19,30 +18,31 @@ class UtimeNsOp(FuseOp):
         uid = kwargs["uid"]
         gid = kwargs["gid"]
 
-        file_stats = os.stat(path)
-        is_owner = file_stats.st_uid == uid
-        is_group = file_stats.st_gid == gid
-
-        if uid == 0:
-            access_ok = True
-        elif is_owner:
-            access_ok = file_stats.st_mode & stat.S_IWUSR
-        elif is_group:
-            access_ok = file_stats.st_mode & stat.S_IWGRP
-        else:
-            access_ok = file_stats.st_mode & stat.S_IWOTH
-
-        try:
-            if access_ok:
-                os.utime(path, times)
+        with self.open_parent(kwargs) as (dir_fd, name):
+            file_stats = os.stat(name, dir_fd=dir_fd)
+            is_owner = file_stats.st_uid == uid
+            is_group = file_stats.st_gid == gid
+
+            if uid == 0:
+                access_ok = True
+            elif is_owner:
+                access_ok = file_stats.st_mode & stat.S_IWUSR
+            elif is_group:
+                access_ok = file_stats.st_mode & stat.S_IWGRP
             else:
-                logging.warning("Error during write request: Access denied")
-                result.errno = errno.EACCES
-                result.data = "Access denied"
-
-        except Exception as e:
-            logging.error("Error during utimens request: {}".format(e))
-            result.errno = errno.EIO
-            result.data = str(e)
+                access_ok = file_stats.st_mode & stat.S_IWOTH
+
+            try:
+                if access_ok:
+                    os.utime(name, times, dir_fd=dir_fd)
+                else:
+                    logging.warning("Error during write request: Access denied")
+                    result.errno = errno.EACCES
+                    result.data = "Access denied"
+
+            except Exception as e:
+                logging.error("Error during utimens request: {}".format(e))
+                result.errno = errno.EIO
+                result.data = str(e)
 
         return result
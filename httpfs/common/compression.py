@@ -0,0 +1,258 @@
+"""
+Contains the codecs binary frame payloads can be compressed with, and the
+per-connection logic that decides when compressing is worth it
+"""
+
+import logging
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+class Codec:
+    """
+    A compression algorithm. The id travels in the frame flags, so any peer
+    that has the codec can decode a payload without negotiating first
+    """
+
+    def __init__(self, name, codec_id, compress, decompress):
+        """
+        :param name: Name used during negotiation
+        :param codec_id: Number between 1 and 3 identifying the codec in
+            frame flags
+        :param compress: compress(bytes) -> bytes
+        :param decompress: decompress(bytes, max_length) -> bytes, raising
+            ValueError rather than produce more than max_length bytes
+        """
+        self.name = name
+        self.codec_id = codec_id
+        self.compress = compress
+        self.decompress = decompress
+
+
+def _zlib_decompress(data, max_length):
+    decompressor = zlib.decompressobj()
+    raw = decompressor.decompress(data, max_length + 1)
+    _check_decompressed(raw, max_length, decompressor.eof)
+    return raw
+
+
+def _lz4_decompress(data, max_length):
+    decompressor = lz4.frame.LZ4FrameDecompressor()
+    raw = decompressor.decompress(data, max_length=max_length + 1)
+    _check_decompressed(raw, max_length, decompressor.eof)
+    return raw
+
+
+def _zstd_decompress(data, max_length):
+    # decompress() trusts the content size in the frame header, so the
+    # output is read in chunks instead
+    chunks = list()
+    raw_size = 0
+    for chunk in zstandard.ZstdDecompressor().read_to_iter(data):
+        raw_size += len(chunk)
+        if raw_size > max_length:
+            break
+        chunks.append(chunk)
+    raw = b"".join(chunks)
+    _check_decompressed(raw, max_length, raw_size <= max_length)
+    return raw
+
+
+def _check_decompressed(raw, max_length, complete):
+    if len(raw) > max_length:
+        raise ValueError("Compressed payload expands past {} bytes".format(max_length))
+    if not complete:
+        raise ValueError("Truncated compressed payload")
+
+
+def _make_codecs():
+    # Fast settings, since the point is to beat the network, not to win on
+    # ratio
+    codecs = [
+        Codec(
+            "zlib",
+            1,
+            lambda data: zlib.compress(data, 1),
+            _zlib_decompress
+        )
+    ]
+
+    if lz4 is not None:
+        codecs.append(Codec("lz4", 2, lz4.frame.compress, _lz4_decompress))
+
+    if zstandard is not None:
+        # zstandard's contexts aren't thread-safe, so each call makes its own
+        codecs.append(Codec(
+            "zstd",
+            3,
+            lambda data: zstandard.ZstdCompressor(level=1).compress(data),
+            _zstd_decompress
+        ))
+
+    return codecs
+
+
+_CODECS = _make_codecs()
+_CODECS_BY_NAME = {codec.name: codec for codec in _CODECS}
+_CODECS_BY_ID = {codec.codec_id: codec for codec in _CODECS}
+
+
+def get_codec_names():
+    """
+    :return: Names of the available codecs, most preferred first
+    """
+    return [codec.name for codec in reversed(_CODECS)]
+
+
+def get_codec(name):
+    """
+    :param name: A codec name
+    :return: The Codec, or None if it isn't available
+    """
+    return _CODECS_BY_NAME.get(name)
+
+
+def choose_codec(offered):
+    """
+    :param offered: Codec names offered by the peer, most preferred first
+    :return: Name of the first offered codec that is available, or None
+    """
+    for name in offered:
+        if name in _CODECS_BY_NAME:
+            return name
+    return None
+
+
+def decompress(codec_id, data, max_length):
+    """
+    :param codec_id: Codec id from a frame's flags
+    :param data: The compressed payload
+    :param max_length: Largest decompressed size accepted, in bytes
+    :raises ValueError: If the codec isn't available, or the payload is
+        truncated or decompresses to more than max_length bytes
+    :return: The decompressed payload
+    """
+    codec = _CODECS_BY_ID.get(codec_id)
+    if codec is None:
+        raise ValueError("Unsupported compression codec {}".format(codec_id))
+    return codec.decompress(data, max_length)
+
+
+class PayloadCompressor:
+    """
+    Compresses the payloads one connection sends with the codec negotiated
+    for it. Payloads too small to benefit are sent as they are, as are ones
+    that don't shrink below max_ratio of their size, which for large payloads
+    is judged from a compressed sample of the start. Each payload that
+    doesn't shrink doubles the number of following payloads that are sent
+    without trying, up to _MAX_SKIP, so incompressible data costs little
+    CPU. A payload that does shrink resets the backoff.
+    """
+
+    _DEFAULT_MIN_SIZE = 1024
+    _DEFAULT_MAX_RATIO = 0.9
+    _MAX_SKIP = 64
+    _SAMPLE_SIZE = 64 * 1024
+
+    def __init__(self, codec, metrics=None, min_size=_DEFAULT_MIN_SIZE, max_ratio=_DEFAULT_MAX_RATIO):
+        """
+        :param codec: The negotiated Codec
+        :param metrics: Optional OpMetrics to record compression ratios in
+        :param min_size: Smallest payload worth compressing, in bytes
+        :param max_ratio: A compressed payload is only sent if it is at most
+            this fraction of the original size
+        """
+        self._codec = codec
+        self._metrics = metrics
+        self._min_size = min_size
+        self._max_ratio = max_ratio
+        self._skip = 0
+        self._next_skip = 1
+        self._lock = threading.Lock()
+
+    def get_codec(self):
+        return self._codec
+
+    def compress(self, payload):
+        """
+        :param payload: Bytes about to be sent
+        :return: (payload to send, codec id or 0 if it wasn't compressed)
+        """
+        if len(payload) < self._min_size:
+            return payload, 0
+
+        with self._lock:
+            if self._skip > 0:
+                self._skip -= 1
+                self.record(len(payload), len(payload))
+                return payload, 0
+
+        # A sample of a large payload says cheaply whether the rest is worth
+        # compressing
+        if len(payload) >= 2 * PayloadCompressor._SAMPLE_SIZE:
+            sample = memoryview(payload)[:PayloadCompressor._SAMPLE_SIZE]
+            if len(self._codec.compress(sample)) > len(sample) * self._max_ratio:
+                compressed = payload
+            else:
+                compressed = self._codec.compress(payload)
+        else:
+            compressed = self._codec.compress(payload)
+
+        with self._lock:
+            if len(compressed) > len(payload) * self._max_ratio:
+                self._skip = self._next_skip
+                self._next_skip = min(self._next_skip * 2, PayloadCompressor._MAX_SKIP)
+                logging.debug(
+                    "Payload only compressed to %d of %d bytes, skipping the next %d",
+                    len(compressed),
+                    len(payload),
+                    self._skip
+                )
+                compressed = None
+            else:
+                self._next_skip = 1
+
+        if compressed is None:
+            self.record(len(payload), len(payload))
+            return payload, 0
+
+        self.record(len(payload), len(compressed))
+        return compressed, self._codec.codec_id
+
+    def decompress(self, payload, codec_id, max_length):
+        """
+        :param payload: Bytes received
+        :param codec_id: Id of the codec the payload is compressed with, or 0
+            if it isn't
+        :param max_length: Largest decompressed size accepted, in bytes
+        :raises ValueError: See decompress()
+        :return: The payload, decompressed
+        """
+        if not codec_id:
+            # Counted like the payloads compress() sends as they are
+            if len(payload) >= self._min_size:
+                self.record(len(payload), len(payload))
+            return payload
+
+        raw = decompress(codec_id, payload, max_length)
+        self.record(len(raw), len(payload))
+        return raw
+
+    def record(self, raw_size, wire_size):
+        """
+        Records a payload sent or received over the connection
+        :param raw_size: Size of the payload uncompressed
+        :param wire_size: Size of the payload on the wire
+        """
+        if self._metrics is not None:
+            self._metrics.record_compression(self._codec.name, raw_size, wire_size)
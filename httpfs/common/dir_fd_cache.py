@@ -0,0 +1,155 @@
+"""
+Contains the server's cache of open directory file descriptors
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+
+class _DirFd:
+    """
+    A cached O_PATH descriptor for a directory
+    """
+
+    __slots__ = ("fd", "refs", "cached")
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.refs = 0
+        self.cached = True
+
+
+class ParentDir:
+    """
+    Context manager giving (dir_fd, name) for a path, to pass to the *at
+    variants of syscalls. name is the last component of the path, and dir_fd
+    a descriptor for the directory containing it, which stays valid until
+    the with block exits. Without a cache, or for paths ending in "/",
+    dir_fd is None and name is the whole path.
+    """
+
+    __slots__ = ("_cache", "_path", "_entry")
+
+    def __init__(self, cache, path):
+        """
+        :param cache: DirFdCache to look the directory up in, or None
+        :param path: Absolute path of a file or directory
+        """
+        self._cache = cache
+        self._path = path
+        self._entry = None
+
+    def __enter__(self):
+        if self._cache is None:
+            return None, self._path
+
+        parent, _, name = self._path.rpartition("/")
+        if not name:
+            return None, self._path
+
+        self._entry = entry = self._cache._acquire(parent or "/")
+        return entry.fd, name
+
+    def __exit__(self, *exc_info):
+        entry = self._entry
+        if entry is not None:
+            with self._cache._lock:
+                entry.refs -= 1
+                if not entry.cached and entry.refs == 0:
+                    os.close(entry.fd)
+
+
+class DirFdCache:
+    """
+    An LRU cache of O_PATH descriptors for the directories path-based
+    requests touch. Ops call the *at variants of syscalls relative to the
+    cached parent directory, so the kernel only has to look up the last
+    path component instead of walking the whole path every time.
+
+    A cached descriptor keeps pointing at its directory if the directory is
+    moved, so renames and removals of directories must call
+    invalidate_tree(). Changes made outside the server aren't seen.
+    """
+
+    _DEFAULT_MAX_SIZE = 256
+
+    def __init__(self, max_size=_DEFAULT_MAX_SIZE):
+        """
+        :param max_size: Maximum number of directory descriptors to keep open
+        """
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def open_parent(self, path):
+        """
+        :param path: Absolute path of a file or directory
+        :raises OSError: On entering, if the directory containing path can't
+            be opened
+        :return: A ParentDir for path
+        """
+        return ParentDir(self, path)
+
+    def invalidate_tree(self, path):
+        """
+        Closes the cached descriptors of path and every directory below it
+        """
+        prefix = path.rstrip("/") + "/"
+        with self._lock:
+            self._generation += 1
+            for dir_path in list(self._entries):
+                if dir_path == path or dir_path.startswith(prefix):
+                    self._retire(self._entries.pop(dir_path))
+
+    def close(self):
+        """
+        Closes every cached descriptor that isn't in use
+        """
+        with self._lock:
+            self._generation += 1
+            while self._entries:
+                self._retire(self._entries.popitem()[1])
+
+    def _acquire(self, dir_path):
+        with self._lock:
+            entry = self._entries.get(dir_path)
+            if entry is not None:
+                self._entries.move_to_end(dir_path)
+                entry.refs += 1
+                return entry
+            generation = self._generation
+
+        # Opened without the lock held, since the path walk is the slow part
+        fd = os.open(dir_path, os.O_PATH | os.O_DIRECTORY)
+
+        with self._lock:
+            entry = self._entries.get(dir_path)
+            if entry is not None:
+                os.close(fd)
+                self._entries.move_to_end(dir_path)
+                entry.refs += 1
+                return entry
+
+            entry = _DirFd(fd)
+            entry.refs = 1
+
+            # The directory may have been renamed while it was being opened
+            if generation != self._generation:
+                entry.cached = False
+                return entry
+
+            self._entries[dir_path] = entry
+            while len(self._entries) > self._max_size:
+                self._retire(self._entries.popitem(last=False)[1])
+            return entry
+
+    @staticmethod
+    def _retire(entry):
+        entry.cached = False
+        if entry.refs == 0:
+            os.close(entry.fd)
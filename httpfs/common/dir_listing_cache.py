@@ -0,0 +1,149 @@
+"""
+Contains the server's cache of directory listings
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Listing:
+    __slots__ = ("key", "names", "size")
+
+    def __init__(self, key, names, size):
+        self.key = key
+        self.names = names
+        self.size = size
+
+
+class DirListingCache:
+    """
+    An LRU cache of directory listings, bounded by an estimate of the memory
+    they use. A listing is served only while the directory's inode number,
+    mtime and ctime match the ones it was listed with, so changes made
+    outside the server are seen as well.
+
+    Timestamps have limited granularity, so a directory changed again within
+    the same tick as its listing would look unchanged. Listings of
+    directories changed in the last _RACY_WINDOW_NS are therefore not cached.
+    """
+
+    _DEFAULT_MAX_BYTES = 32 * 1024**2
+    _RACY_WINDOW_NS = 1000**3
+
+    # Rough cost of an entry besides its names: the _Listing, its key tuple
+    # and the OrderedDict slot
+    _ENTRY_OVERHEAD = 256
+
+    def __init__(self, max_bytes=_DEFAULT_MAX_BYTES, prefix="httpfs_server"):
+        """
+        :param max_bytes: Approximate maximum memory to use for listings
+        :param prefix: Prefix of the metric names
+        """
+        self._max_bytes = max_bytes
+        self._prefix = prefix
+        self._listings = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._listings)
+
+    @staticmethod
+    def _key(dir_stats):
+        return dir_stats.st_ino, dir_stats.st_mtime_ns, dir_stats.st_ctime_ns
+
+    def get(self, path, dir_stats):
+        """
+        :param path: Path of the directory
+        :param dir_stats: os.stat() result for the directory, taken now
+        :return: The cached list of names, which must not be modified, or
+            None if there is no listing for the directory as it is now
+        """
+        key = DirListingCache._key(dir_stats)
+        with self._lock:
+            listing = self._listings.get(path)
+            if listing is not None and listing.key == key:
+                self._listings.move_to_end(path)
+                self._hits += 1
+                return listing.names
+
+            self._misses += 1
+            return None
+
+    def put(self, path, dir_stats, names):
+        """
+        Caches a listing
+        :param path: Path of the directory
+        :param dir_stats: os.stat() result for the directory, taken before it
+            was listed
+        :param names: The list of names. Must not be modified afterwards
+        """
+        changed_ns = max(dir_stats.st_mtime_ns, dir_stats.st_ctime_ns)
+        if time.time_ns() - changed_ns < DirListingCache._RACY_WINDOW_NS:
+            return
+
+        size = (
+            DirListingCache._ENTRY_OVERHEAD
+            + sys.getsizeof(path)
+            + sys.getsizeof(names)
+            + sum(sys.getsizeof(name) for name in names)
+        )
+        if size > self._max_bytes:
+            return
+
+        listing = _Listing(DirListingCache._key(dir_stats), names, size)
+        with self._lock:
+            old_listing = self._listings.pop(path, None)
+            if old_listing is not None:
+                self._bytes -= old_listing.size
+
+            self._listings[path] = listing
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, evicted = self._listings.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def clear(self):
+        """
+        Drops every cached listing
+        """
+        with self._lock:
+            self._listings.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        """
+        :return: Dict of the hits, misses, hit_ratio, entries and bytes used
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "entries": len(self._listings),
+                "bytes": self._bytes
+            }
+
+    def render(self):
+        """
+        :return: The cache's stats in the Prometheus text exposition format
+        """
+        stats = self.get_stats()
+        name = self._prefix + "_dir_listing_cache"
+        lines = list()
+
+        for metric, kind, description, value in (
+                ("hits_total", "counter", "Directory listings served from the cache", stats["hits"]),
+                ("misses_total", "counter", "Directory listings read from disk", stats["misses"]),
+                ("entries", "gauge", "Directory listings cached", stats["entries"]),
+                ("bytes", "gauge", "Estimated memory used by cached listings", stats["bytes"])):
+            lines.append("# HELP {}_{} {}".format(name, metric, description))
+            lines.append("# TYPE {}_{} {}".format(name, metric, kind))
+            lines.append("{}_{} {}".format(name, metric, value))
+
+        return "\n".join(lines) + "\n"
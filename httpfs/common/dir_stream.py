@@ -0,0 +1,129 @@
+"""
+Contains the server side of a directory opened for paged reading
+"""
+
+import os
+import threading
+
+
+class DirStream:
+    """
+    Reads an open directory in pages. The os.scandir() iterator is kept
+    between pages, so each page continues where the last one ended instead
+    of listing the directory again, and no more than a page of entries is
+    held in memory.
+
+    Positions in the stream are entry counts. Asking for an earlier position
+    than the current one restarts the listing, as rewinddir() would.
+
+    A stream can instead be given the directory's names from a listing
+    cache, in which case only the entries' attributes are read from disk. A
+    stream that lists a directory of at most _MAX_RECORDED_NAMES entries
+    from start to end hands the names to on_listed, so they can be cached.
+    """
+
+    _MAX_RECORDED_NAMES = 65536
+
+    def __init__(self, fd, names=None, on_listed=None):
+        """
+        :param fd: Descriptor of the directory, opened with O_RDONLY. It is
+            not closed by close()
+        :param names: Optional list of the directory's entry names, without
+            "." and "..", to read instead of listing the directory
+        :param on_listed: Optional function called with the list of names
+            once the directory has been listed
+        """
+        self._fd = fd
+        self._names = names
+        self._on_listed = on_listed
+        self._recorded = None
+        self._entries = None
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def read(self, offset, count):
+        """
+        :param offset: Position to read from, as returned by a previous read
+            or 0 to start from the beginning
+        :param count: Maximum number of entries to read
+        :return: (list of (name, os.stat_result) pairs, position after the
+            page, whether the end of the directory was reached). Entries
+            removed while being listed are left out
+        """
+        if self._names is not None:
+            return self._read_names(offset, count)
+
+        with self._lock:
+            if self._entries is None or offset < self._offset:
+                self._restart()
+
+            eof = False
+            while self._offset < offset:
+                entry = next(self._entries, None)
+                if entry is None:
+                    eof = True
+                    break
+                self._offset += 1
+                self._record(entry.name)
+
+            page = list()
+            while not eof and len(page) < count:
+                entry = next(self._entries, None)
+                if entry is None:
+                    eof = True
+                    break
+                self._offset += 1
+                self._record(entry.name)
+
+                try:
+                    page.append((entry.name, entry.stat(follow_symlinks=False)))
+                except FileNotFoundError:
+                    continue
+
+            if eof and self._recorded is not None:
+                self._on_listed(self._recorded)
+                self._recorded = None
+
+            return page, self._offset, eof
+
+    def close(self):
+        """
+        Ends the listing. The directory descriptor is left open
+        """
+        with self._lock:
+            if self._entries is not None:
+                self._entries.close()
+                self._entries = None
+
+    def _read_names(self, offset, count):
+        page = list()
+        position = offset
+        while position < len(self._names) and len(page) < count:
+            name = self._names[position]
+            position += 1
+            try:
+                page.append((name, os.stat(name, dir_fd=self._fd, follow_symlinks=False)))
+            except FileNotFoundError:
+                continue
+
+        return page, position, position >= len(self._names)
+
+    def _record(self, name):
+        if self._recorded is None:
+            return
+        if len(self._recorded) >= DirStream._MAX_RECORDED_NAMES:
+            self._recorded = None
+        else:
+            self._recorded.append(name)
+
+    def _restart(self):
+        if self._entries is not None:
+            self._entries.close()
+
+        self._recorded = list() if self._on_listed is not None else None
+
+        # scandir() reads through a duplicate of fd, which shares its
+        # position
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        self._entries = os.scandir(self._fd)
+        self._offset = 0
@@ -8,19 +8,25 @@ class FuseOpFactory:
         FuseOpType.CREATE: CreateOp,
         FuseOpType.CHMOD: ChmodOp,
         FuseOpType.CHOWN: ChownOp,
+        FuseOpType.COMPOUND: CompoundOp,
         FuseOpType.FLUSH: FlushOp,
         FuseOpType.FSYNC: FsyncOp,
         FuseOpType.GET_ATTR: GetAttrOp,
+        FuseOpType.HELLO: HelloOp,
         FuseOpType.LINK: LinkOp,
         FuseOpType.MKDIR: MkDirOp,
         FuseOpType.MKNOD: MkNodOp,
         FuseOpType.OPEN: OpenOp,
+        FuseOpType.OPENDIR: OpenDirOp,
         FuseOpType.READ: ReadOp,
         FuseOpType.READDIR: ReadDirOp,
+        FuseOpType.READDIR_PAGE: ReadDirPageOp,
+        FuseOpType.READDIR_PLUS: ReadDirPlusOp,
         FuseOpType.RELEASE: ReleaseOp,
         FuseOpType.RENAME: RenameOp,
         FuseOpType.RM_DIR: RmDirOp,
         FuseOpType.STAT_FS: StatFsOp,
+        FuseOpType.SUBSCRIBE: SubscribeOp,
         FuseOpType.SYMLINK: SymlinkOp,
         FuseOpType.TRUNCATE: TruncateOp,
         FuseOpType.UNLINK: UnlinkOp,
@@ -28,12 +34,51 @@ class FuseOpFactory:
         FuseOpType.WRITE: WriteOp
     }
 
+    #: Handlers are stateless, so one instance per op is shared by all
+    #: requests. Indexed by the integer op code, None for unhandled ops
+    _DISPATCH = [None] * (max(FuseOpType) + 1)
+    for _op, _handler_cls in _HANDLERS.items():
+        _DISPATCH[_op] = _handler_cls()
+
+    #: Op names for logging, indexed by the integer op code
+    _OP_NAMES = [str(op) for op in range(len(_DISPATCH))]
+    for _op in FuseOpType:
+        _OP_NAMES[_op] = _op.name
+    _OP_NAMES = tuple(_OP_NAMES)
+
+    del _op, _handler_cls
+
+    @staticmethod
+    def get_supported_ops():
+        """
+        :return: The FuseOpTypes that have a handler, as ints
+        """
+        return [int(op) for op in FuseOpFactory._HANDLERS]
+
     @staticmethod
     def get_op_handler(op):
         """
-        Returns an instance of thee proper handler based on the Op type
+        Returns the shared handler for the Op type
         :param op: Type of operation
         :return: Handler for the operation
+        :raises KeyError: If there is no handler for op
+        """
+        try:
+            handler = FuseOpFactory._DISPATCH[op]
+        except (IndexError, TypeError):
+            handler = None
+
+        if handler is None:
+            raise KeyError(op)
+        return handler
+
+    @staticmethod
+    def get_op_name(op):
+        """
+        :param op: Type of operation, as an int
+        :return: The op's name, for logging
         """
-        handler_cls = FuseOpFactory._HANDLERS[op]
-        return handler_cls()
+        try:
+            return FuseOpFactory._OP_NAMES[op]
+        except (IndexError, TypeError):
+            return str(op)
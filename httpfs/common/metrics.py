@@ -0,0 +1,250 @@
+"""
+Contains per-op request metrics and an HTTP endpoint that serves them in the
+Prometheus text exposition format
+"""
+
+import bisect
+import errno
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .fuse_op_factory import FuseOpFactory
+from .wire_protocol import FileRange
+
+#: Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0
+)
+
+_PAYLOAD_TYPES = (bytes, bytearray, memoryview, FileRange)
+
+
+def payload_size(value):
+    """
+    :param value: A request argument or result
+    :return: Number of bytes of file data in value, 0 if it isn't file data
+    """
+    if isinstance(value, _PAYLOAD_TYPES):
+        return len(value)
+    return 0
+
+
+class _OpStats:
+    __slots__ = ("count", "seconds", "buckets", "bytes_in", "bytes_out")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+class OpMetrics:
+    """
+    Request counts, errors, file data bytes and latency histograms per
+    FuseOpType. Recording a request costs one bisect and one uncontended
+    lock, so it stays on all the time.
+    """
+
+    def __init__(self, prefix):
+        """
+        :param prefix: Prefix of the metric names, e.g. "httpfs_server"
+        """
+        self._prefix = prefix
+        self._ops = dict()
+        self._errors = dict()
+        self._compression = dict()
+        self._lock = threading.Lock()
+
+    def record(self, op, error, seconds, bytes_in=0, bytes_out=0):
+        """
+        Records a handled request
+        :param op: The FuseOpType
+        :param error: The errno of the result, 0 on success
+        :param seconds: How long the request took
+        :param bytes_in: Bytes of file data received
+        :param bytes_out: Bytes of file data sent
+        """
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+
+        with self._lock:
+            stats = self._ops.get(op)
+            if stats is None:
+                stats = self._ops[op] = _OpStats()
+
+            stats.count += 1
+            stats.seconds += seconds
+            stats.buckets[bucket] += 1
+            stats.bytes_in += bytes_in
+            stats.bytes_out += bytes_out
+
+            if error:
+                self._errors[(op, error)] = self._errors.get((op, error), 0) + 1
+
+    def record_compression(self, codec, raw_size, wire_size):
+        """
+        Records a file data payload sent or received on a compressed
+        connection
+        :param codec: Name of the connection's compression codec
+        :param raw_size: Size of the payload uncompressed
+        :param wire_size: Size of the payload on the wire, equal to raw_size
+            if it went uncompressed
+        """
+        with self._lock:
+            totals = self._compression.get(codec)
+            if totals is None:
+                totals = self._compression[codec] = [0, 0]
+            totals[0] += raw_size
+            totals[1] += wire_size
+
+    def render(self):
+        """
+        :return: The metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            ops = sorted(
+                (FuseOpFactory.get_op_name(op), stats.count, stats.seconds,
+                 list(stats.buckets), stats.bytes_in, stats.bytes_out)
+                for op, stats in self._ops.items()
+            )
+            errors = sorted(
+                (FuseOpFactory.get_op_name(op), errno.errorcode.get(error, str(error)), count)
+                for (op, error), count in self._errors.items()
+            )
+            compression = sorted(
+                (codec, raw_size, wire_size)
+                for codec, (raw_size, wire_size) in self._compression.items()
+            )
+
+        prefix = self._prefix
+        lines = list()
+
+        def header(name, kind, description):
+            lines.append("# HELP {}_{} {}".format(prefix, name, description))
+            lines.append("# TYPE {}_{} {}".format(prefix, name, kind))
+
+        header("requests_total", "counter", "Requests handled")
+        for name, count, _, _, _, _ in ops:
+            lines.append('{}_requests_total{{op="{}"}} {}'.format(prefix, name, count))
+
+        header("errors_total", "counter", "Requests that failed, by errno")
+        for name, error_name, count in errors:
+            lines.append(
+                '{}_errors_total{{op="{}",errno="{}"}} {}'.format(prefix, name, error_name, count)
+            )
+
+        header("bytes_received_total", "counter", "Bytes of file data received")
+        for name, _, _, _, bytes_in, _ in ops:
+            lines.append('{}_bytes_received_total{{op="{}"}} {}'.format(prefix, name, bytes_in))
+
+        header("bytes_sent_total", "counter", "Bytes of file data sent")
+        for name, _, _, _, _, bytes_out in ops:
+            lines.append('{}_bytes_sent_total{{op="{}"}} {}'.format(prefix, name, bytes_out))
+
+        header(
+            "compression_raw_bytes_total",
+            "counter",
+            "Bytes of file data payloads sent and received on compressed connections, uncompressed"
+        )
+        for codec, raw_size, _ in compression:
+            lines.append('{}_compression_raw_bytes_total{{codec="{}"}} {}'.format(prefix, codec, raw_size))
+
+        header(
+            "compression_wire_bytes_total",
+            "counter",
+            "Bytes of file data payloads sent and received on compressed connections, on the wire"
+        )
+        for codec, _, wire_size in compression:
+            lines.append('{}_compression_wire_bytes_total{{codec="{}"}} {}'.format(prefix, codec, wire_size))
+
+        header("compression_ratio", "gauge", "Raw bytes per byte on the wire on compressed connections")
+        for codec, raw_size, wire_size in compression:
+            ratio = raw_size / wire_size if wire_size else 1.0
+            lines.append('{}_compression_ratio{{codec="{}"}} {:.3f}'.format(prefix, codec, ratio))
+
+        header("request_duration_seconds", "histogram", "Time taken to handle requests")
+        for name, count, seconds, buckets, _, _ in ops:
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                cumulative += bucket_count
+                lines.append(
+                    '{}_request_duration_seconds_bucket{{op="{}",le="{}"}} {}'.format(
+                        prefix, name, bound, cumulative
+                    )
+                )
+            lines.append('{}_request_duration_seconds_sum{{op="{}"}} {}'.format(prefix, name, seconds))
+            lines.append('{}_request_duration_seconds_count{{op="{}"}} {}'.format(prefix, name, count))
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Serves one or more OpMetrics at http://address:port/metrics
+    """
+
+    def __init__(self, port, metrics, address="127.0.0.1"):
+        """
+        :param port: Port to listen on
+        :param metrics: List of OpMetrics to serve
+        :param address: Address to listen on. Local only by default
+        """
+        self._metrics = metrics
+        self._http_server = ThreadingHTTPServer(
+            (address, port),
+            self._make_handler()
+        )
+        self._http_server.daemon_threads = True
+        self._thread = None
+
+    def get_port(self):
+        """
+        :return: The port the endpoint is listening on
+        """
+        return self._http_server.server_address[1]
+
+    def start(self):
+        """
+        Starts serving in a background thread
+        """
+        self._thread = threading.Thread(
+            target=self._http_server.serve_forever,
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops serving and closes the listening socket
+        """
+        if self._thread is not None:
+            self._http_server.shutdown()
+            self._thread.join()
+        self._http_server.server_close()
+
+    def _make_handler(self):
+        metrics = self._metrics
+
+        class _MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = "".join(m.render() for m in metrics).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                logging.debug("Metrics request: " + fmt, *args)
+
+        return _MetricsHandler
@@ -0,0 +1,369 @@
+"""
+Contains the server's table of open file handles
+"""
+
+import errno
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+
+class HandleError(OSError):
+    """
+    Raised when a request's file handle isn't open, or wasn't opened with
+    the access the request needs
+    """
+
+
+class HandleLimitError(OSError):
+    """
+    Raised when a client tries to open more files than it is allowed
+    """
+
+
+class _OpenFile:
+    """
+    A file descriptor the server opened for a client
+    """
+
+    __slots__ = ("fd", "path", "mode", "client", "stream", "last_used", "users", "closing")
+
+    def __init__(self, fd, path, mode, client, stream):
+        self.fd = fd
+        self.path = path
+        self.mode = mode
+        self.client = client
+        self.stream = stream
+        self.last_used = time.monotonic()
+
+        #: Number of requests using the descriptor right now
+        self.users = 0
+
+        #: Whether the descriptor is to be closed by its last user
+        self.closing = False
+
+
+class OpenFileTable:
+    """
+    The files the server has opened for clients. Clients are given opaque
+    64-bit handles rather than raw descriptors, so a client can only use
+    files it opened, and only with the access it was granted when it opened
+    them. Permissions are checked once at open time, so reads and writes
+    only need a lookup here.
+
+    Each handle is owned by the client that opened it: the session the
+    client named when it connected, or for clients that don't name one, the
+    connection it was opened on. Any connection can use any handle, and a
+    client can't hold more than max_per_client of them.
+
+    Handles aren't closed when a connection drops, since the client may
+    still be using them over its other connections, or reconnect, e.g. after
+    a network blip. Once none of a client's connections are left, its
+    handles are closed when they go unused for session_timeout seconds.
+    Handles that go unused for idle_timeout seconds are closed regardless.
+
+    A request using a descriptor pins it with use(), so a handle released or
+    reaped meanwhile is only closed once the request is done with it.
+
+    When the server runs as several worker processes, a handle also records
+    which worker opened it: handle % worker_count == worker_id.
+    """
+
+    _DEFAULT_MAX_PER_CLIENT = 1024
+    _DEFAULT_IDLE_TIMEOUT = 6 * 60 * 60
+    _DEFAULT_SESSION_TIMEOUT = 120
+
+    _HANDLE_BITS = 62
+
+    def __init__(
+            self,
+            worker_id=0,
+            worker_count=1,
+            max_per_client=_DEFAULT_MAX_PER_CLIENT,
+            idle_timeout=_DEFAULT_IDLE_TIMEOUT,
+            session_timeout=_DEFAULT_SESSION_TIMEOUT):
+        """
+        :param worker_id: Index of the worker process that owns this table
+        :param worker_count: Number of worker processes
+        :param max_per_client: Maximum number of handles one client can hold
+            open
+        :param idle_timeout: Seconds a handle can go unused before it is
+            closed, or None to keep idle handles open
+        :param session_timeout: Seconds the handles of a client without
+            connections can go unused before they are closed
+        """
+        self._worker_id = worker_id
+        self._worker_count = worker_count
+        self._max_per_client = max_per_client
+        self._idle_timeout = idle_timeout
+        self._session_timeout = session_timeout
+        self._files = dict()
+        self._handles_by_client = dict()
+        self._client_connections = dict()
+        self._detached_clients = set()
+        self._last_reap = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._files)
+
+    @staticmethod
+    def flags_to_mode(flags):
+        """
+        :param flags: os.open() flags
+        :return: The access the flags ask for, as a bitwise OR of os.R_OK and
+            os.W_OK
+        """
+        access_mode = flags & os.O_ACCMODE
+        if access_mode == os.O_RDONLY:
+            return os.R_OK
+        if access_mode == os.O_WRONLY:
+            return os.W_OK
+        return os.R_OK | os.W_OK
+
+    def add(self, fd, mode, path=None, client=None, stream=None):
+        """
+        Takes ownership of a newly opened file descriptor. If the client
+        already holds the maximum number of handles, fd is closed
+        :param fd: The file descriptor
+        :param mode: The access granted, a bitwise OR of os.R_OK and os.W_OK
+        :param path: Path of the open file
+        :param client: Key of the client that opened it, or None if it isn't
+            tied to a client
+        :param stream: Optional object reading from fd, such as a DirStream.
+            Its close() is called when the handle is closed
+        :raises HandleLimitError: If the client has too many open handles
+        :return: The handle to give the client for fd
+        """
+        self.reap_idle()
+
+        with self._lock:
+            client_handles = self._handles_by_client.get(client, ())
+            if len(client_handles) >= self._max_per_client:
+                os.close(fd)
+                raise HandleLimitError(errno.EMFILE, "Too many open files for this client")
+
+            handle = self._new_handle()
+            self._files[handle] = _OpenFile(fd, path, mode, client, stream)
+            if client is not None:
+                self._handles_by_client.setdefault(client, set()).add(handle)
+
+        return handle
+
+    def get_fd(self, handle, mode=0):
+        """
+        :param handle: A handle returned by add()
+        :param mode: The access needed, os.R_OK and/or os.W_OK
+        :raises HandleError: EBADF if the handle isn't open, EACCES if it
+            wasn't opened with the access asked for
+        :return: The file descriptor. It isn't pinned, so requests that use
+            it should call use() instead
+        """
+        with self._lock:
+            return self._lookup(handle, mode).fd
+
+    @contextmanager
+    def use(self, handle, mode=0):
+        """
+        Pins a handle's descriptor for the duration of the with-block
+        :param handle: A handle returned by add()
+        :param mode: The access needed, os.R_OK and/or os.W_OK
+        :raises HandleError: EBADF if the handle isn't open, EACCES if it
+            wasn't opened with the access asked for
+        :return: The file descriptor
+        """
+        with self._pinned(handle, mode) as open_file:
+            yield open_file.fd
+
+    @contextmanager
+    def use_stream(self, handle):
+        """
+        Pins a handle's stream for the duration of the with-block
+        :param handle: A handle returned by add()
+        :raises HandleError: EBADF if the handle isn't open, or wasn't added
+            with a stream
+        :return: The stream given to add()
+        """
+        with self._pinned(handle) as open_file:
+            if open_file.stream is None:
+                raise HandleError(errno.EBADF, "Bad file handle")
+            yield open_file.stream
+
+    def get_owner(self, handle):
+        """
+        :param handle: A handle returned by add() in any worker
+        :return: Index of the worker that opened handle
+        """
+        return handle % self._worker_count
+
+    def close(self, handle):
+        """
+        Closes a handle. If a request is using it, its descriptor is closed
+        when the request is done
+        :param handle: A handle returned by add()
+        :raises HandleError: EBADF if the handle isn't open
+        """
+        with self._lock:
+            open_file = self._files.pop(handle, None)
+            if open_file is None:
+                raise HandleError(errno.EBADF, "Bad file handle")
+
+            self._disown(handle, open_file.client)
+
+        self._close_files([open_file])
+
+    def attach(self, client):
+        """
+        Called when a connection joins a client that owns handles across
+        connections, i.e. a session
+        :param client: The client's key
+        """
+        with self._lock:
+            self._client_connections[client] = self._client_connections.get(client, 0) + 1
+            self._detached_clients.discard(client)
+
+    def detach(self, client, expire=True):
+        """
+        Called when a connection ends. Connections that didn't join a
+        client with attach() are their own client
+        :param client: The client's key
+        :param expire: Whether the client's handles should be closed if no
+            connection rejoins it within session_timeout seconds. If False,
+            e.g. because the connection only went idle, they are left to the
+            idle timeout
+        """
+        with self._lock:
+            remaining = self._client_connections.get(client, 1) - 1
+            if remaining > 0:
+                self._client_connections[client] = remaining
+                return
+
+            self._client_connections.pop(client, None)
+            if expire and client in self._handles_by_client:
+                self._detached_clients.add(client)
+
+    def reap_idle(self, now=None):
+        """
+        Closes handles that haven't been used for idle_timeout seconds, and
+        handles of clients without connections that haven't been used for
+        session_timeout seconds. Idle handles are looked for at most once
+        every tenth of the idle timeout
+        :param now: time.monotonic() value to use as the current time
+        :return: Number of handles closed
+        """
+        now = time.monotonic() if now is None else now
+        idle_due = (
+            self._idle_timeout is not None and
+            now - self._last_reap >= self._idle_timeout / 10
+        )
+        if not idle_due and not self._detached_clients:
+            return 0
+
+        with self._lock:
+            expired_handles = [
+                handle
+                for client in self._detached_clients
+                for handle in self._handles_by_client.get(client, ())
+                if now - self._files[handle].last_used >= self._session_timeout
+            ]
+            if idle_due:
+                self._last_reap = now
+                expired_handles.extend(
+                    handle for handle, open_file in self._files.items()
+                    if now - open_file.last_used >= self._idle_timeout
+                )
+
+            open_files = list()
+            for handle in expired_handles:
+                open_file = self._files.pop(handle, None)
+                if open_file is not None:
+                    self._disown(handle, open_file.client)
+                    open_files.append(open_file)
+
+            # Clients whose handles are all closed are forgotten
+            self._detached_clients.intersection_update(self._handles_by_client)
+
+        if open_files:
+            logging.info("Closing %d idle files", len(open_files))
+        self._close_files(open_files)
+        return len(open_files)
+
+    def close_all(self):
+        """
+        Closes every open handle
+        """
+        with self._lock:
+            open_files = list(self._files.values())
+            self._files.clear()
+            self._handles_by_client.clear()
+            self._detached_clients.clear()
+
+        self._close_files(open_files)
+
+    def _lookup(self, handle, mode=0):
+        open_file = self._files.get(handle)
+        if open_file is None:
+            raise HandleError(errno.EBADF, "Bad file handle")
+        if open_file.mode & mode != mode:
+            raise HandleError(errno.EACCES, "Access denied")
+
+        open_file.last_used = time.monotonic()
+        return open_file
+
+    @contextmanager
+    def _pinned(self, handle, mode=0):
+        with self._lock:
+            open_file = self._lookup(handle, mode)
+            open_file.users += 1
+
+        try:
+            yield open_file
+        finally:
+            with self._lock:
+                open_file.users -= 1
+                close_now = open_file.closing and open_file.users == 0
+            if close_now:
+                OpenFileTable._close_file(open_file)
+
+    def _new_handle(self):
+        while True:
+            handle = secrets.randbits(OpenFileTable._HANDLE_BITS)
+            handle -= handle % self._worker_count
+            handle += self._worker_id
+            if handle not in self._files:
+                return handle
+
+    def _disown(self, handle, client):
+        client_handles = self._handles_by_client.get(client)
+        if client_handles is not None:
+            client_handles.discard(handle)
+            if not client_handles:
+                del self._handles_by_client[client]
+
+    def _close_files(self, open_files):
+        """
+        Closes files already taken out of the table. Files in use are left
+        for their last user to close
+        """
+        with self._lock:
+            unused = list()
+            for open_file in open_files:
+                if open_file.users > 0:
+                    open_file.closing = True
+                else:
+                    unused.append(open_file)
+
+        for open_file in unused:
+            OpenFileTable._close_file(open_file)
+
+    @staticmethod
+    def _close_file(open_file):
+        try:
+            if open_file.stream is not None:
+                open_file.stream.close()
+            os.close(open_file.fd)
+        except OSError as excp:
+            logging.error("Couldn't close %s: %s", open_file.path, excp)
@@ -0,0 +1,353 @@
+"""
+Binary frame format spoken between the HttpFs client and server
+
+Every frame is a fixed-size header followed by a JSON metadata section and a
+raw payload:
+::
+    | 2 bytes | 1 byte  | 1 byte | 2 bytes | 4 bytes | 8 bytes    | 4 bytes  | 8 bytes     |
+    | magic   | version | flags  | op type | errno   | request id | meta len | payload len |
+
+    | meta len bytes  | payload len bytes |
+    | JSON metadata   | raw payload       |
+
+For requests the metadata holds the op's keyword arguments. For responses it
+holds the FuseOpResult data. When FLAG_RAW_DATA is set the "data" value
+travels as the raw payload instead, so file contents are never base64 encoded
+or copied into a JSON string. A response payload can also be a FileRange,
+which is sent straight from the file with os.sendfile().
+
+A raw payload may be compressed, in which case the codec id is stored in the
+FLAG_CODEC_MASK bits of the flags.
+"""
+
+import os
+import select
+import socket
+import struct
+from contextlib import contextmanager
+
+import ujson
+
+from .compression import decompress
+
+WIRE_VERSION = 1
+
+#: First bytes of every binary frame. A legacy pytcp_message envelope always
+#: starts with a 0 or 1 compression byte, so the two can be told apart by
+#: peeking at the first byte of a message
+MAGIC = b"HF"
+
+#: The "data" field is carried as the raw payload
+FLAG_RAW_DATA = 0x01
+
+#: Id of the codec the raw payload is compressed with, 0 if uncompressed
+FLAG_CODEC_MASK = 0x06
+_FLAG_CODEC_SHIFT = 1
+
+#: Largest payload accepted, before or after decompression
+MAX_PAYLOAD_SIZE = 256 * 1024**2
+
+_HEADER = struct.Struct("!2sBBHiQIQ")
+HEADER_SIZE = _HEADER.size
+
+_BYTES_TYPES = (bytes, bytearray, memoryview)
+
+
+class FileRange:
+    """
+    A range of an open file used as a frame payload. The bytes are sent from
+    the file to the socket by the kernel without being read into memory.
+
+    The range owns its descriptor, usually a duplicate of the file's, since
+    the frame is sent after the request that made it has finished, by which
+    time the file may have been closed. Whatever sends the frame closes it
+    """
+
+    def __init__(self, fd, offset, size):
+        """
+        :param fd: The open file descriptor. Closed by close()
+        :param offset: Offset of the first byte to send
+        :param size: Number of bytes to send. Must not run past the end of
+            the file
+        """
+        self.fd = fd
+        self.offset = offset
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        """
+        Closes the descriptor. Safe to call more than once
+        """
+        fd, self.fd = self.fd, -1
+        if fd >= 0:
+            os.close(fd)
+
+
+class Frame:
+    """
+    A single binary protocol message
+    """
+
+    def __init__(self, op, request_id=0, errno=0, meta=b"", payload=b"", flags=0):
+        """
+        :param op: FuseOpType of the request this frame belongs to
+        :param request_id: Id used to match a response to its request
+        :param errno: Error number of a response, 0 for requests
+        :param meta: Encoded JSON metadata
+        :param payload: Raw payload bytes
+        :param flags: Bitwise OR of the FLAG_* constants
+        """
+        self.op = op
+        self.request_id = request_id
+        self.errno = errno
+        self.meta = meta
+        self.payload = payload
+        self.flags = flags
+
+    @staticmethod
+    def request(op, request_id, **kwargs):
+        """
+        Builds a request frame, moving a bytes-like "data" argument into the
+        raw payload
+        :param op: The FuseOpType to send
+        :param request_id: Id of the request
+        :param kwargs: The arguments for the request
+        :return: The request Frame
+        """
+        flags = 0
+        payload = b""
+        data = kwargs.get("data")
+
+        if isinstance(data, _BYTES_TYPES):
+            kwargs = dict(kwargs)
+            payload = kwargs.pop("data")
+            flags |= FLAG_RAW_DATA
+
+        return Frame(
+            op,
+            request_id=request_id,
+            meta=ujson.dumps(kwargs).encode("utf-8"),
+            payload=payload,
+            flags=flags
+        )
+
+    @staticmethod
+    def response(op, request_id, result):
+        """
+        Builds a response frame from a FuseOpResult
+        :param op: The FuseOpType that was handled
+        :param request_id: Id of the request being answered
+        :param result: The FuseOpResult
+        :return: The response Frame
+        """
+        if isinstance(result.data, _BYTES_TYPES + (FileRange,)):
+            return Frame(
+                op,
+                request_id=request_id,
+                errno=result.errno,
+                payload=result.data,
+                flags=FLAG_RAW_DATA
+            )
+
+        return Frame(
+            op,
+            request_id=request_id,
+            errno=result.errno,
+            meta=ujson.dumps(result.data).encode("utf-8")
+        )
+
+    def compress(self, compressor):
+        """
+        Compresses the raw payload in place if the compressor thinks it's
+        worth it. FileRange payloads are left alone
+        :param compressor: The connection's PayloadCompressor
+        """
+        if not self.flags & FLAG_RAW_DATA or not isinstance(self.payload, _BYTES_TYPES):
+            return
+
+        self.payload, codec_id = compressor.compress(self.payload)
+        self.flags |= codec_id << _FLAG_CODEC_SHIFT
+
+    def get_payload(self, compressor=None):
+        """
+        :param compressor: The connection's PayloadCompressor, which records
+            the payload's compression ratio, or None
+        :raises ValueError: If the payload is compressed with a codec that
+            isn't available, or decompresses to more than MAX_PAYLOAD_SIZE
+        :return: The raw payload, decompressed
+        """
+        codec_id = (self.flags & FLAG_CODEC_MASK) >> _FLAG_CODEC_SHIFT
+        if compressor is not None:
+            return compressor.decompress(self.payload, codec_id, MAX_PAYLOAD_SIZE)
+        if codec_id:
+            return decompress(codec_id, self.payload, MAX_PAYLOAD_SIZE)
+        return self.payload
+
+    def as_request(self, compressor=None):
+        """
+        :param compressor: See get_payload()
+        :return: The request arguments as a dict, with the op under "type"
+        """
+        as_dict = ujson.loads(self.meta) if self.meta else dict()
+        as_dict["type"] = self.op
+        if self.flags & FLAG_RAW_DATA:
+            as_dict["data"] = self.get_payload(compressor)
+        return as_dict
+
+    def as_response(self, compressor=None):
+        """
+        :param compressor: See get_payload()
+        :return: The response as an {"errno", "data"} dict
+        """
+        if self.flags & FLAG_RAW_DATA:
+            data = self.get_payload(compressor)
+        elif self.meta:
+            data = ujson.loads(self.meta)
+        else:
+            data = ""
+        return {"errno": self.errno, "data": data}
+
+    def to_buffers(self):
+        """
+        :return: The header, metadata and payload as a list of buffers that
+            can be written with a single sendmsg() call
+        """
+        header = _HEADER.pack(
+            MAGIC,
+            WIRE_VERSION,
+            self.flags,
+            self.op,
+            self.errno,
+            self.request_id,
+            len(self.meta),
+            len(self.payload)
+        )
+        return [header, self.meta, self.payload]
+
+    @staticmethod
+    def from_stream(stream):
+        """
+        Reads a frame from a buffered binary stream. If the stream is closed
+        or times out, returns None
+        :param stream: The stream to read from
+        :return: The Frame, or None if unable to read
+        """
+        try:
+            header = stream.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE:
+                return None
+
+            flags, op, errno, request_id, meta_len, payload_len = unpack_header(header)
+
+            meta = stream.read(meta_len) if meta_len > 0 else b""
+            payload = stream.read(payload_len) if payload_len > 0 else b""
+            if len(meta) < meta_len or len(payload) < payload_len:
+                return None
+
+            return Frame(op, request_id, errno, meta, payload, flags)
+
+        except socket.timeout:
+            return None
+
+
+def unpack_header(header):
+    """
+    Decodes a frame header
+    :param header: HEADER_SIZE bytes
+    :return: (flags, op, errno, request_id, meta_len, payload_len)
+    :raises ValueError: If the header isn't a frame this version understands,
+        or announces a payload larger than MAX_PAYLOAD_SIZE
+    """
+    (
+        magic,
+        version,
+        flags,
+        op,
+        errno,
+        request_id,
+        meta_len,
+        payload_len
+    ) = _HEADER.unpack(header)
+
+    if magic != MAGIC or version > WIRE_VERSION:
+        raise ValueError(
+            "Unsupported frame (magic {}, version {})".format(magic, version)
+        )
+    if payload_len > MAX_PAYLOAD_SIZE:
+        raise ValueError("Frame payload of {} bytes is too large".format(payload_len))
+
+    return flags, op, errno, request_id, meta_len, payload_len
+
+
+def send_frame(sock, frame):
+    """
+    Writes a frame to a socket without joining its parts into a new buffer
+    :param sock: The socket to write to
+    :param frame: The Frame to send. A FileRange payload is closed once sent
+    """
+    if isinstance(frame.payload, FileRange):
+        header, meta, file_range = frame.to_buffers()
+        try:
+            with _corked(sock):
+                _send_buffers(sock, [header, meta])
+                _send_file_range(sock, file_range)
+        finally:
+            file_range.close()
+    else:
+        _send_buffers(sock, frame.to_buffers())
+
+
+def _send_buffers(sock, buffers):
+    buffers = [memoryview(b) for b in buffers if len(b) > 0]
+
+    while buffers:
+        bytes_sent = sock.sendmsg(buffers)
+        while bytes_sent > 0:
+            if bytes_sent >= len(buffers[0]):
+                bytes_sent -= len(buffers[0])
+                buffers.pop(0)
+            else:
+                buffers[0] = buffers[0][bytes_sent:]
+                bytes_sent = 0
+
+
+def _send_file_range(sock, file_range):
+    offset = file_range.offset
+    remaining = file_range.size
+
+    while remaining > 0:
+        try:
+            bytes_sent = os.sendfile(sock.fileno(), file_range.fd, offset, remaining)
+        except BlockingIOError:
+            # Sockets with a timeout are non-blocking underneath
+            _, writable, _ = select.select([], [sock], [], sock.gettimeout())
+            if not writable:
+                raise socket.timeout("Timed out sending file data")
+            continue
+
+        if bytes_sent == 0:
+            # The frame header promised more bytes than the file now has
+            raise ConnectionError("File shrank while it was being sent")
+
+        offset += bytes_sent
+        remaining -= bytes_sent
+
+
+@contextmanager
+def _corked(sock):
+    """
+    Holds back partial packets so the header and file data go out together
+    """
+    is_tcp = sock.family in (socket.AF_INET, socket.AF_INET6)
+    if not is_tcp or not hasattr(socket, "TCP_CORK"):
+        yield
+        return
+
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1)
+    try:
+        yield
+    finally:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 0)
@@ -1 +1,3 @@
 from .httpfs_server import HttpFsServer
+from .async_httpfs_server import AsyncHttpFsServer
+from .access_log import AccessLog
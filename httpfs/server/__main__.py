@@ -2,7 +2,11 @@ import argparse
 import logging
 import sys
 
-from httpfs.server import HttpFsServer
+from httpfs.common.dir_listing_cache import DirListingCache
+from httpfs.common.metrics import MetricsServer
+from httpfs.common.open_file_table import OpenFileTable
+from httpfs.server import AccessLog, AsyncHttpFsServer, HttpFsServer
+from httpfs.server.workers import run_workers
 
 LOG_FMT = "[%(asctime)s][%(levelname)s] %(message)s"
 DATE_FMT = "%Y-%m-%d %H:%M:%S"
@@ -31,6 +35,85 @@ parser.add_argument(
     help="JSON file with list of API keys",
     default=None
 )
+parser.add_argument(
+    "--async",
+    dest="async_mode",
+    help="Serve connections with asyncio, handling requests concurrently",
+    action="store_true"
+)
+parser.add_argument(
+    "--threads",
+    dest="threads",
+    help="Number of threads making filesystem calls in --async mode",
+    type=int,
+    default=AsyncHttpFsServer._DEFAULT_THREADS
+)
+parser.add_argument(
+    "--access-log",
+    dest="access_log",
+    help="Log every request",
+    action="store_true"
+)
+parser.add_argument(
+    "--access-log-sample",
+    dest="access_log_sample",
+    help="Log 1 in N requests",
+    type=int,
+    default=None
+)
+parser.add_argument(
+    "--workers",
+    dest="workers",
+    help="Number of server processes sharing the port",
+    type=int,
+    default=1
+)
+parser.add_argument(
+    "--max-open-files",
+    dest="max_open_files",
+    help="Maximum number of files one client can have open",
+    type=int,
+    default=OpenFileTable._DEFAULT_MAX_PER_CLIENT
+)
+parser.add_argument(
+    "--open-file-timeout",
+    dest="open_file_timeout",
+    help="Close files that clients haven't used for this many seconds",
+    type=float,
+    default=OpenFileTable._DEFAULT_IDLE_TIMEOUT
+)
+parser.add_argument(
+    "--session-timeout",
+    dest="session_timeout",
+    help="Keep files open for this many seconds after a client loses its "
+         "connections, so it can reconnect and carry on using them",
+    type=float,
+    default=OpenFileTable._DEFAULT_SESSION_TIMEOUT
+)
+parser.add_argument(
+    "--dir-fd-cache",
+    dest="dir_fd_cache",
+    help="Keep up to this many directories open to speed up path lookups. "
+         "Worth it for deep directory trees",
+    type=int,
+    default=0
+)
+parser.add_argument(
+    "--dir-listing-cache",
+    dest="dir_listing_cache",
+    help="MiB of memory to use for caching the names in directory "
+         "listings, 0 to disable. Attributes are always read afresh",
+    type=int,
+    default=DirListingCache._DEFAULT_MAX_BYTES // 1024**2
+)
+parser.add_argument(
+    "--metrics-port",
+    dest="metrics_port",
+    help="Serve Prometheus metrics on this local port. With --workers, "
+         "worker N serves them on this port + N",
+    type=int,
+    default=None
+)
 parser.add_argument(
     "--verbose",
     help="Be verbose",
@@ -44,14 +127,49 @@ if args.verbose:
 
 logging.basicConfig(level=log_level, format=LOG_FMT, datefmt=DATE_FMT)
 
+# Request logging is left out of the pipeline entirely unless asked for
+access_log = None
+if args.access_log or args.access_log_sample or args.verbose:
+    logging.getLogger("httpfs.access").setLevel(logging.INFO)
+    access_log = AccessLog(sample_every=args.access_log_sample or 1)
+
+server_kwargs = dict(
+    cred_store_file=args.cred_store,
+    tls_key=args.tls_key,
+    tls_cert=args.tls_cert,
+    access_log=access_log,
+    max_open_per_client=args.max_open_files,
+    open_file_timeout=args.open_file_timeout,
+    session_timeout=args.session_timeout,
+    dir_fd_cache_size=args.dir_fd_cache,
+    dir_listing_cache_bytes=args.dir_listing_cache * 1024**2
+)
+if args.async_mode:
+    server_kwargs["threads"] = args.threads
+
+server_class = AsyncHttpFsServer if args.async_mode else HttpFsServer
+
+
+def make_server(router=None):
+    server = server_class(args.port, args.fs_root, router=router, **server_kwargs)
+
+    if args.metrics_port is not None:
+        worker_id = router.get_worker_id() if router is not None else 0
+        metrics = [server.get_metrics()]
+        if server.get_dir_listings() is not None:
+            metrics.append(server.get_dir_listings())
+        MetricsServer(args.metrics_port + worker_id, metrics).start()
+
+    return server
+
+
+if args.workers > 1:
+    print("Server running on port {} with {} workers...".format(args.port, args.workers))
+    run_workers(args.workers, make_server)
+    sys.exit(0)
+
 try:
-    server = HttpFsServer(
-        args.port,
-        args.fs_root,
-        cred_store_file=args.cred_store,
-        tls_key=args.tls_key,
-        tls_cert=args.tls_cert
-    )
+    server = make_server()
 except Exception as e:
     logging.error(e)
     sys.exit(1)
@@ -0,0 +1,96 @@
+"""
+Contains the connection handler used by HttpFsServer
+"""
+
+import logging
+import socket
+import threading
+from socketserver import StreamRequestHandler
+
+from pytcp_message.message import TcpRequest
+
+from ..common.wire_protocol import MAGIC, Frame, send_frame
+
+
+class _HttpFsRequestHandler(StreamRequestHandler):
+    """
+    Like pytcp_message's request handler, but also accepts binary protocol
+    frames. Each message is answered in the format it arrived in.
+    """
+
+    def setup(self):
+        super().setup()
+        self.request.settimeout(self.server.get_timeout())
+        self._timed_out = False
+        self._compressor = None
+        self._session = None
+        self._write_lock = threading.Lock()
+
+    def finish(self):
+        self.server.end_connection(self.client_address, self._session, idle=self._timed_out)
+        super().finish()
+
+    def handle(self):
+        while self.server.is_running() and not self.rfile.closed:
+            request = self._read_request()
+            if request is None:
+                break
+
+            request.compressor = self._compressor
+            request.push = self._push
+            request.session = self._session
+            response = self.server.run_request_handlers(request)
+            self._compressor = self.server.update_compressor(request, self._compressor)
+            self._session = self.server.update_session(request, self._session)
+            try:
+                self._write_response(response)
+            except ConnectionError as excp:
+                logging.error("Closing connection from %s:%d: %s", *self.client_address, excp)
+                break
+
+    def _read_request(self):
+        """
+        :return: The next TcpRequest from the client, with a "frame" attribute
+            holding the binary Frame (None for JSON requests), or None if the
+            client disconnected
+        """
+        try:
+            first_byte = self.rfile.peek(1)[:1]
+        except socket.timeout:
+            self._timed_out = True
+            return None
+        except OSError:
+            return None
+
+        if not first_byte:
+            return None
+
+        if first_byte == MAGIC[:1]:
+            frame = Frame.from_stream(self.rfile)
+            if frame is None:
+                return None
+            request = TcpRequest(self.client_address)
+        else:
+            frame = None
+            request = TcpRequest.from_stream(self.client_address, self.rfile)
+            if request is None:
+                return None
+
+        request.frame = frame
+        return request
+
+    def _write_response(self, response):
+        frame = getattr(response, "frame", None)
+        with self._write_lock:
+            if frame is not None:
+                send_frame(self.request, frame)
+            elif not self.wfile.closed:
+                response.to_stream(self.wfile)
+
+    def _push(self, frame):
+        """
+        Sends a frame the client didn't ask for, such as an invalidation.
+        Called from other threads
+        """
+        with self._write_lock:
+            send_frame(self.request, frame)
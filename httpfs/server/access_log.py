@@ -0,0 +1,73 @@
+"""
+Contains the optional request logging stages of the HttpFsServer pipeline
+"""
+
+import itertools
+import logging
+import time
+
+from ..common import FuseOpFactory
+
+
+class AccessLog:
+    """
+    Request handlers that log each request and its response. Installed in
+    the server pipeline only when access logging is enabled, so servers that
+    don't log pay nothing for it. Busy servers can log a sample of 1 in
+    sample_every requests.
+    """
+
+    def __init__(self, sample_every=1, logger=None, level=logging.INFO):
+        """
+        :param sample_every: Log 1 in this many requests
+        :param logger: Logger to write to. Defaults to "httpfs.access"
+        :param level: Level to log at
+        """
+        if sample_every < 1:
+            raise ValueError(
+                "Sample rate must be positive, got {}".format(sample_every)
+            )
+
+        self._sample_every = sample_every
+        self._logger = logger or logging.getLogger("httpfs.access")
+        self._level = level
+        self._counter = itertools.count()
+
+    def log_request(self, req, _):
+        """
+        Logs a request, and marks it so its response is logged too
+        """
+        req.access_log_start = None
+
+        if next(self._counter) % self._sample_every != 0:
+            return True
+        if not self._logger.isEnabledFor(self._level):
+            return True
+
+        req.access_log_start = time.perf_counter()
+        self._logger.log(
+            self._level,
+            "<-- %s:%d %s",
+            *req.get_client_address(),
+            FuseOpFactory.get_op_name(req.content_json["type"])
+        )
+        return True
+
+    def log_response(self, req, _):
+        """
+        Logs the response to a request that log_request() logged
+        """
+        start = getattr(req, "access_log_start", None)
+        if start is None:
+            return True
+
+        result = getattr(req, "result", None)
+        self._logger.log(
+            self._level,
+            "--> %s:%d %s errno=%d %.3fms",
+            *req.get_client_address(),
+            FuseOpFactory.get_op_name(req.content_json["type"]),
+            result.errno if result is not None else -1,
+            (time.perf_counter() - start) * 1000
+        )
+        return True
@@ -0,0 +1,304 @@
+"""
+Contains an HttpFsServer that serves each connection with asyncio
+"""
+
+import asyncio
+import io
+import logging
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from pytcp_message.message import TcpRequest
+
+from .httpfs_server import HttpFsServer
+from ..common.wire_protocol import (
+    HEADER_SIZE,
+    MAGIC,
+    FileRange,
+    Frame,
+    unpack_header
+)
+
+
+class AsyncHttpFsServer(HttpFsServer):
+    """
+    An HttpFsServer whose connections are handled by an asyncio event loop.
+    Filesystem calls run on a bounded thread pool, so binary protocol
+    requests from the same connection are handled concurrently and answered
+    as they complete, matched to their request by request id. Legacy JSON
+    requests carry no request id and are still answered in order.
+    """
+
+    _DEFAULT_THREADS = 16
+
+    #: Maximum number of requests handled at once for a single connection
+    _MAX_IN_FLIGHT = 64
+
+    #: Seconds between calls of service_actions()
+    _SERVICE_INTERVAL = 0.5
+
+    def __init__(self, port, fs_root, threads=_DEFAULT_THREADS, **kwargs):
+        """
+        :param port: Port to run the server on
+        :param fs_root: The HttpFS filesystem root on the server
+        :param threads: Number of threads making filesystem calls
+        :param kwargs: Passed to HttpFsServer
+        """
+        super().__init__(port, fs_root, **kwargs)
+        self._thread_count = threads
+        self._executor = None
+        self._loop = None
+        self._server = None
+        self._connections = set()
+        self._service_timer = None
+        self._started = threading.Event()
+        self._stopped = threading.Event()
+
+    def start(self):
+        """
+        Starts the event loop in a background thread
+        """
+        self._is_running = True
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._thread_count,
+            thread_name_prefix="httpfs-server"
+        )
+        self._main_thread = threading.Thread(target=self._run_loop, daemon=False)
+        self._main_thread.start()
+        self._started.wait()
+
+    def stop(self):
+        """
+        Closes all connections and stops the event loop
+        """
+        with self._thread_lock:
+            self._is_running = False
+
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._shutdown)
+
+        # A join() interrupted by Ctrl-C in wait() can return early from then
+        # on, so wait for the loop to say it's done
+        self._stopped.wait()
+        self._main_thread.join()
+        self._executor.shutdown(wait=True)
+        self.server_close()
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+            self._stopped.set()
+
+    async def _serve(self):
+        self._server = await asyncio.start_server(
+            self._handle_connection,
+            sock=self.socket
+        )
+        self._started.set()
+
+        self._run_service_actions()
+
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+            self._service_timer.cancel()
+
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+
+    def _run_service_actions(self):
+        # The threaded server runs them between polls of its socket
+        self._service_timer = self._loop.call_later(
+            AsyncHttpFsServer._SERVICE_INTERVAL,
+            self._run_service_actions
+        )
+        self.service_actions()
+
+    def _shutdown(self):
+        # Also ends serve_forever()
+        if self._server.is_serving():
+            self._server.close()
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        client_address = writer.get_extra_info("peername")[:2]
+        idle = asyncio.Event()
+        write_lock = asyncio.Lock()
+        in_flight = asyncio.Semaphore(AsyncHttpFsServer._MAX_IN_FLIGHT)
+        pending = set()
+        compressor = None
+        session = None
+        push = partial(self._push, writer, write_lock)
+
+        try:
+            while self.is_running():
+                request = await self._read_request(reader, writer, client_address, idle)
+                if request is None:
+                    break
+
+                request.compressor = compressor
+                request.push = push
+                request.session = session
+                if request.frame is None:
+                    # JSON responses have no request id, so keep them ordered.
+                    # Compression and sessions are negotiated over JSON, so
+                    # no binary request is in flight when they change
+                    await self._respond(request, writer, write_lock)
+                    compressor = self.update_compressor(request, compressor)
+                    session = self.update_session(request, session)
+                    continue
+
+                await in_flight.acquire()
+                response_task = asyncio.ensure_future(
+                    self._respond(request, writer, write_lock)
+                )
+                pending.add(response_task)
+                response_task.add_done_callback(pending.discard)
+                response_task.add_done_callback(lambda _: in_flight.release())
+
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        except Exception as excp:
+            logging.error("Closing connection from %s:%d: %s", *client_address, excp)
+        finally:
+            for response_task in pending:
+                response_task.cancel()
+            writer.close()
+            self._connections.discard(task)
+
+            self.end_connection(client_address, session, idle=idle.is_set())
+
+    async def _read_request(self, reader, writer, client_address, idle):
+        """
+        :return: The next TcpRequest from the client, with a "frame" attribute
+            holding the binary Frame (None for JSON requests), or None if the
+            client disconnected or went idle. idle is set in the latter case
+        """
+        try:
+            # Cheaper than wait_for(), which wraps the read in a new task
+            idle_timer = self._loop.call_later(
+                self.get_timeout(),
+                AsyncHttpFsServer._close_idle,
+                writer,
+                idle
+            )
+            try:
+                first_byte = await reader.read(1)
+            finally:
+                idle_timer.cancel()
+
+            if not first_byte:
+                return None
+
+            if first_byte == MAGIC[:1]:
+                header = first_byte + await reader.readexactly(HEADER_SIZE - 1)
+                flags, op, errno, request_id, meta_len, payload_len = unpack_header(header)
+                meta = await reader.readexactly(meta_len)
+                payload = await reader.readexactly(payload_len)
+
+                request = TcpRequest(client_address)
+                request.frame = Frame(op, request_id, errno, meta, payload, flags)
+                return request
+
+            # pytcp_message envelope: compression byte, 8 byte length, content
+            content_len = int.from_bytes(await reader.readexactly(8), byteorder="little")
+            content = await reader.readexactly(content_len)
+            if first_byte == b"\x01":
+                content = zlib.decompress(content)
+
+            request = TcpRequest(client_address, content)
+            request.frame = None
+            return request
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+    @staticmethod
+    def _close_idle(writer, idle):
+        idle.set()
+        writer.close()
+
+    async def _respond(self, request, writer, write_lock):
+        frame = None
+        try:
+            response = await self._loop.run_in_executor(
+                self._executor,
+                self.run_request_handlers,
+                request
+            )
+
+            frame = getattr(response, "frame", None)
+            async with write_lock:
+                if frame is not None and isinstance(frame.payload, FileRange):
+                    await self._send_file_frame(frame, writer)
+                elif frame is not None:
+                    writer.writelines(frame.to_buffers())
+                else:
+                    stream = io.BytesIO()
+                    response.to_stream(stream)
+                    writer.write(stream.getvalue())
+                await writer.drain()
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as excp:
+            # The client can't tell which request failed, so hang up on it
+            logging.error("Failed to handle request: %s", excp)
+            writer.close()
+        finally:
+            if frame is not None and isinstance(frame.payload, FileRange):
+                frame.payload.close()
+
+    def _push(self, writer, write_lock, frame):
+        """
+        Sends a frame the client didn't ask for, such as an invalidation.
+        Called from other threads, which wait until the frame is written so
+        a client that is slow to read pushes back on them
+        """
+        asyncio.run_coroutine_threadsafe(
+            self._write_frame(frame, writer, write_lock),
+            self._loop
+        ).result(self.get_timeout())
+
+    @staticmethod
+    async def _write_frame(frame, writer, write_lock):
+        try:
+            async with write_lock:
+                writer.writelines(frame.to_buffers())
+                await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _send_file_frame(self, frame, writer):
+        header, meta, file_range = frame.to_buffers()
+        writer.writelines([header, meta])
+        await writer.drain()
+
+        if file_range.size == 0:
+            return
+
+        # Only the position of this private file object moves. The range's
+        # descriptor is a duplicate anyway, and reads use pread()
+        with os.fdopen(file_range.fd, "rb", buffering=0, closefd=False) as file:
+            bytes_sent = await self._loop.sendfile(
+                writer.transport,
+                file,
+                file_range.offset,
+                file_range.size
+            )
+
+        if bytes_sent < file_range.size:
+            raise ConnectionError("File shrank while it was being sent")
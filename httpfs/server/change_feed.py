@@ -0,0 +1,383 @@
+"""
+Contains the server's feed of filesystem changes to subscribed clients
+"""
+
+import errno
+import logging
+import os
+import select
+import threading
+from collections import OrderedDict, deque
+
+import ujson
+
+from . import inotify
+from ..common import FuseOpType
+from ..common.wire_protocol import Frame
+
+#: Events that change a directory entry's attributes or contents
+_CHILD_EVENTS = (
+    inotify.IN_MODIFY
+    | inotify.IN_ATTRIB
+    | inotify.IN_CLOSE_WRITE
+    | inotify.IN_CREATE
+    | inotify.IN_DELETE
+    | inotify.IN_MOVED_FROM
+    | inotify.IN_MOVED_TO
+)
+
+#: Events that also change the directory itself, its mtime and listing
+_LISTING_EVENTS = (
+    inotify.IN_CREATE
+    | inotify.IN_DELETE
+    | inotify.IN_MOVED_FROM
+    | inotify.IN_MOVED_TO
+)
+
+#: Events after which a directory's watch no longer matches its path
+_SELF_EVENTS = inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF
+
+_WATCH_MASK = _CHILD_EVENTS | _SELF_EVENTS | inotify.IN_ONLYDIR
+
+
+class _Subscription:
+    """
+    The paths one client connection asked to hear about, mapped to the
+    watch descriptors of the directories watched for them, oldest first,
+    and the invalidations
+    waiting to be pushed to it.
+
+    Each subscription pushes from its own thread, so a client that is slow
+    to read holds up only its own invalidations. At most max_queued wait;
+    past that they are replaced by one that drops everything, which covers
+    any change made before the client gets it.
+    """
+
+    __slots__ = ("push", "paths", "_queue", "_max_queued", "_closed", "_cond")
+
+    _INVALIDATE_ALL = {"paths": [], "trees": [], "all": True}
+
+    def __init__(self, push, max_queued):
+        self.push = push
+        self.paths = OrderedDict()
+        self._queue = deque()
+        self._max_queued = max_queued
+        self._closed = False
+        self._cond = threading.Condition()
+        threading.Thread(
+            target=self._run,
+            name="httpfs-change-push",
+            daemon=True
+        ).start()
+
+    def send(self, invalidation):
+        """
+        Queues an invalidation to push
+        :param invalidation: The INVALIDATE frame's meta dict
+        """
+        with self._cond:
+            if self._queue and self._queue[-1] is _Subscription._INVALIDATE_ALL:
+                return
+            if invalidation["all"] or len(self._queue) >= self._max_queued:
+                self._queue.clear()
+                invalidation = _Subscription._INVALIDATE_ALL
+
+            self._queue.append(invalidation)
+            self._cond.notify()
+
+    def close(self):
+        """
+        Stops pushing. Invalidations still queued are dropped
+        """
+        with self._cond:
+            self._closed = True
+            self._queue.clear()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                invalidation = self._queue.popleft()
+
+            frame = Frame(
+                FuseOpType.INVALIDATE,
+                meta=ujson.dumps(invalidation).encode("utf-8")
+            )
+            try:
+                self.push(frame)
+            except Exception as excp:
+                # The connection is closing and will unsubscribe
+                logging.debug("Couldn't push invalidation: %s", excp)
+                self.close()
+
+
+class ChangeFeed:
+    """
+    Tells subscribed clients when paths they have cached change, whoever
+    changed them. Clients send the paths they cache with SUBSCRIBE, and are
+    pushed INVALIDATE frames holding
+    {"paths": [...], "trees": [...], "all": bool}: paths whose attributes or
+    contents changed, directories that were moved or removed along with
+    everything below them, or, if events were lost, everything.
+
+    Changes are seen with inotify, watching the directories that contain the
+    subscribed paths, and subscribed directories themselves. Each
+    subscription keeps its max_paths most recently sent paths. inotify
+    starts on the first subscription, so an unused feed costs nothing.
+    """
+
+    _DEFAULT_MAX_PATHS = 65536
+    _DEFAULT_MAX_QUEUED = 64
+
+    def __init__(self, fs_root, max_paths=_DEFAULT_MAX_PATHS, max_queued=_DEFAULT_MAX_QUEUED):
+        """
+        :param fs_root: The filesystem root served to clients
+        :param max_paths: Maximum number of paths one subscription watches
+        :param max_queued: Maximum number of invalidations waiting to be
+            pushed to one subscription
+        """
+        self._fs_root = fs_root
+        self._max_paths = max_paths
+        self._max_queued = max_queued
+        self._inotify = None
+        self._thread = None
+        self._wake_fds = None
+        self._subscriptions = dict()
+
+        # inotify has one watch per directory, however it is reached, so
+        # watches are counted by descriptor. Directory path -> descriptor,
+        # and descriptor -> [directory path, number of paths needing it]
+        self._dirs = dict()
+        self._watches = dict()
+        self._warned_limit = False
+        self._lock = threading.Lock()
+
+    def watch(self, connection, push, paths):
+        """
+        Adds paths to a connection's subscription, creating it if needed
+        :param connection: Key of the client connection
+        :param push: Thread-safe function that sends a Frame on the
+            connection. It may block while the client is slow to read
+        :param paths: Absolute paths on the server to report changes to
+        :raises OSError: If inotify isn't available
+        """
+        with self._lock:
+            if self._inotify is None:
+                self._start()
+
+            subscription = self._subscriptions.get(connection)
+            if subscription is None:
+                subscription = _Subscription(push, self._max_queued)
+                self._subscriptions[connection] = subscription
+
+            for path in paths:
+                # The root arrives as "<root>/", but is watched as "<root>"
+                path = os.path.normpath(path)
+                if path in subscription.paths:
+                    subscription.paths.move_to_end(path)
+                    continue
+
+                subscription.paths[path] = self._watch_dirs_of(path)
+                while len(subscription.paths) > self._max_paths:
+                    _, dirs = subscription.paths.popitem(last=False)
+                    self._unwatch_dirs(dirs)
+
+    def unsubscribe(self, connection):
+        """
+        Ends a connection's subscription, if it has one
+        :param connection: Key of the client connection
+        """
+        with self._lock:
+            subscription = self._subscriptions.pop(connection, None)
+            if subscription is not None:
+                subscription.close()
+                for dirs in subscription.paths.values():
+                    self._unwatch_dirs(dirs)
+
+    def close(self):
+        """
+        Ends every subscription and stops watching
+        """
+        with self._lock:
+            if self._inotify is None:
+                return
+            for subscription in self._subscriptions.values():
+                subscription.close()
+            self._subscriptions.clear()
+            os.write(self._wake_fds[1], b"\0")
+            thread = self._thread
+
+        thread.join()
+
+        with self._lock:
+            self._inotify.close()
+            self._inotify = None
+            self._dirs.clear()
+            self._watches.clear()
+            for fd in self._wake_fds:
+                os.close(fd)
+
+    def _start(self):
+        self._inotify = inotify.Inotify()
+        self._wake_fds = os.pipe()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="httpfs-change-feed",
+            daemon=True
+        )
+        self._thread.start()
+
+    def _watch_dirs_of(self, path):
+        """
+        :return: Tuple of the watch descriptors now held for path
+        """
+        dirs = [os.path.dirname(path)]
+        if os.path.isdir(path):
+            dirs.append(path)
+        wds = (self._watch_dir(d) for d in dirs)
+        return tuple(wd for wd in wds if wd is not None)
+
+    def _watch_dir(self, dir_path):
+        """
+        :return: The directory's watch descriptor, or None if it can't be
+            watched
+        """
+        wd = self._dirs.get(dir_path)
+        if wd is None:
+            try:
+                wd = self._inotify.add_watch(dir_path, _WATCH_MASK)
+            except OSError as excp:
+                # Usually the inotify watch limit. Gone paths need no watch
+                if excp.errno != errno.ENOENT and not self._warned_limit:
+                    self._warned_limit = True
+                    logging.warning("Can't watch %s for changes: %s", dir_path, excp)
+                return None
+
+        # A directory reached by another path is already watched
+        watch = self._watches.get(wd)
+        if watch is None:
+            watch = self._watches[wd] = [dir_path, 0]
+            self._dirs[dir_path] = wd
+        watch[1] += 1
+        return wd
+
+    def _unwatch_dirs(self, wds):
+        for wd in wds:
+            # Forgotten watches are gone already
+            watch = self._watches.get(wd)
+            if watch is None:
+                continue
+
+            watch[1] -= 1
+            if watch[1] == 0:
+                self._forget_dir(wd)
+
+    def _forget_dir(self, wd):
+        watch = self._watches.pop(wd, None)
+        if watch is not None:
+            if self._dirs.get(watch[0]) == wd:
+                del self._dirs[watch[0]]
+            self._inotify.rm_watch(wd)
+
+    def _run(self):
+        inotify_fd = self._inotify.fileno()
+        wake_fd = self._wake_fds[0]
+
+        while True:
+            readable, _, _ = select.select([inotify_fd, wake_fd], [], [])
+            if wake_fd in readable:
+                return
+
+            events = self._inotify.read_events()
+            if events:
+                self._dispatch(events)
+
+    def _dispatch(self, events):
+        changed = set()
+        trees = set()
+        forgotten = set()
+        overflow = False
+
+        with self._lock:
+            for wd, mask, _, name in events:
+                if mask & inotify.IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+
+                watch = self._watches.get(wd)
+                if watch is None:
+                    continue
+                dir_path = watch[0]
+
+                if name is None:
+                    # The watched directory itself was moved or removed, so
+                    # its path no longer leads to what is watched
+                    if mask & (_SELF_EVENTS | inotify.IN_IGNORED):
+                        trees.add(dir_path)
+                        forgotten.add(wd)
+                        self._forget_dir(wd)
+                    else:
+                        changed.add(dir_path)
+                    continue
+
+                path = os.path.join(dir_path, name)
+                changed.add(path)
+                if mask & _LISTING_EVENTS:
+                    changed.add(dir_path)
+                    if mask & inotify.IN_ISDIR:
+                        trees.add(path)
+
+            # Only queued here, so a slow client can't hold up this thread
+            for subscription in self._subscriptions.values():
+                if overflow:
+                    subscription.send({"paths": [], "trees": [], "all": True})
+                    continue
+
+                hit_paths = [p for p in changed if p in subscription.paths]
+                hit_trees = [t for t in trees if self._subscribed_below(subscription, t)]
+                if forgotten:
+                    dropped = self._unsubscribe_forgotten(subscription, forgotten)
+                    hit_paths.extend(p for p in dropped if p not in changed)
+                if hit_paths or hit_trees:
+                    subscription.send({
+                        "paths": [self._to_client_path(p) for p in hit_paths],
+                        "trees": [self._to_client_path(t) for t in hit_trees],
+                        "all": False
+                    })
+
+    def _subscribed_below(self, subscription, tree):
+        """
+        Drops the subscription's paths in tree, which are re-sent once the
+        client caches them again
+        :return: Whether any were found
+        """
+        prefix = tree + "/"
+        below = [
+            p for p in subscription.paths
+            if p == tree or p.startswith(prefix)
+        ]
+        for path in below:
+            self._unwatch_dirs(subscription.paths.pop(path))
+        return len(below) > 0
+
+    def _unsubscribe_forgotten(self, subscription, forgotten):
+        """
+        Drops the subscription's paths that needed a forgotten watch, so
+        they are watched afresh once the client caches them again
+        :return: The paths dropped
+        """
+        dropped = [
+            path for path, wds in subscription.paths.items()
+            if not forgotten.isdisjoint(wds)
+        ]
+        for path in dropped:
+            self._unwatch_dirs(subscription.paths.pop(path))
+        return dropped
+
+    def _to_client_path(self, path):
+        relative = os.path.relpath(path, self._fs_root)
+        return "/" if relative == "." else "/" + relative
@@ -1,15 +1,26 @@
+import base64
+import errno
 import os
 import socket
 import threading
+import time
 import ssl
 import logging
-from datetime import datetime
 
 import ujson
 from pytcp_message import TcpServer
+from pytcp_message.message import TcpMessage
 
+from ._request_handler import _HttpFsRequestHandler
+from .change_feed import ChangeFeed
 from ..common import FuseOpFactory, FuseOpType
+from ..common.compression import PayloadCompressor, get_codec
 from ..common.credentials.TextCredStore import TextCredStore
+from ..common.dir_fd_cache import DirFdCache
+from ..common.dir_listing_cache import DirListingCache
+from ..common.metrics import OpMetrics, payload_size
+from ..common.open_file_table import OpenFileTable
+from ..common.wire_protocol import Frame
 
 
 class HttpFsServer(TcpServer):
@@ -17,16 +28,75 @@ class HttpFsServer(TcpServer):
     Server that implements the HttpFsRequestHandler methods
     """
 
-    def __init__(self, port, fs_root, cred_store_file=None, tls_key=None, tls_cert=None):
+    def __init__(
+            self,
+            port,
+            fs_root,
+            cred_store_file=None,
+            tls_key=None,
+            tls_cert=None,
+            access_log=None,
+            router=None,
+            max_open_per_client=OpenFileTable._DEFAULT_MAX_PER_CLIENT,
+            open_file_timeout=OpenFileTable._DEFAULT_IDLE_TIMEOUT,
+            session_timeout=OpenFileTable._DEFAULT_SESSION_TIMEOUT,
+            dir_fd_cache_size=0,
+            dir_listing_cache_bytes=DirListingCache._DEFAULT_MAX_BYTES,
+            change_feed=True):
         """
         :param port: Port to run the server on
         :param fs_root: The HttpFS filesystem root on the server
         :param tls_key: Optional key file for HTTPS
         :param tls_cert: Optional cert file for HTTPS
+        :param access_log: Optional AccessLog to log requests with
+        :param router: WorkerRouter when running as one of several worker
+            processes sharing the port
+        :param max_open_per_client: Maximum number of files a single client,
+            i.e. a session or a connection without one, can have open
+        :param open_file_timeout: Seconds an open file can go unused before
+            the server closes it, or None to never close idle files
+        :param session_timeout: Seconds the open files of a client are kept,
+            while unused, after its last connection drops, so a client that
+            reconnects, or uses them over its other connections, can keep
+            using them
+        :param dir_fd_cache_size: Number of directory descriptors to keep
+            open so path-based requests can skip most of the path walk. 0
+            disables the cache
+        :param dir_listing_cache_bytes: Approximate memory to use for caching
+            directory listings. 0 disables the cache
+        :param change_feed: Whether clients can subscribe to be told when
+            paths they cached change
         """
+        # Must be set before the listening socket is bound
+        self._router = router
+
         super().__init__(port, address="0.0.0.0")
+        self.RequestHandlerClass = _HttpFsRequestHandler
         self._client_timeout = 300
         self._fs_root = os.path.realpath(fs_root)
+        if router is not None:
+            self._worker_id = router.get_worker_id()
+            worker_count = router.get_worker_count()
+        else:
+            self._worker_id = 0
+            worker_count = 1
+        self._open_files = OpenFileTable(
+            worker_id=self._worker_id,
+            worker_count=worker_count,
+            max_per_client=max_open_per_client,
+            idle_timeout=open_file_timeout,
+            session_timeout=session_timeout
+        )
+        if dir_fd_cache_size > 0:
+            self._dir_fds = DirFdCache(dir_fd_cache_size)
+        else:
+            self._dir_fds = None
+        if dir_listing_cache_bytes > 0:
+            self._dir_listings = DirListingCache(dir_listing_cache_bytes)
+        else:
+            self._dir_listings = None
+        self._change_feed = ChangeFeed(self._fs_root) if change_feed else None
+        self._metrics = OpMetrics("httpfs_server")
 
         # has_tls_key = tls_key is not None and os.path.exists(tls_key)
         # has_tls_crt = tls_cert is not None and os.path.exists(tls_cert)
@@ -57,14 +127,136 @@ class HttpFsServer(TcpServer):
         self.add_request_handler(
             lambda req, res: HttpFsServer._add_server(self, req, res)
         )
-        self.add_request_handler(HttpFsServer._json_parse)
-        self.add_request_handler(HttpFsServer._log_request)
+        self.add_request_handler(HttpFsServer._parse_request)
+        if router is not None:
+            self.add_request_handler(router.route_request)
+        if access_log is not None:
+            self.add_request_handler(access_log.log_request)
         self.add_request_handler(HttpFsServer._serve_response)
-        self.add_request_handler(HttpFsServer._log_response)
+        if access_log is not None:
+            self.add_request_handler(access_log.log_response)
+
+    def run_request_handlers(self, request):
+        """
+        Passes a request through the request handlers
+        :param request: The TcpRequest, with its "frame" attribute set, and
+            a "compressor" attribute if the connection compresses payloads
+        :return: The TcpMessage response
+        """
+        response = TcpMessage()
+        for listener in self.get_request_handlers():
+            if not listener(request, response):
+                break
+
+        frame = getattr(response, "frame", None)
+        compressor = getattr(request, "compressor", None)
+        if frame is not None and compressor is not None:
+            frame.compress(compressor)
+        return response
+
+    def update_compressor(self, request, compressor):
+        """
+        Called by connection handlers after each request, to pick up the
+        compression codec negotiated by a HELLO
+        :param request: The handled TcpRequest
+        :param compressor: The connection's PayloadCompressor, or None
+        :return: The PayloadCompressor the connection should use from now on
+        """
+        as_dict = getattr(request, "content_json", None)
+        result = getattr(request, "result", None)
+        if as_dict is None or as_dict["type"] != FuseOpType.HELLO:
+            return compressor
+        if result is None or result.errno != 0:
+            return compressor
+
+        codec = get_codec(result.data.get("compression"))
+        if codec is None:
+            return None
+        return PayloadCompressor(codec, metrics=self._metrics)
+
+    def update_session(self, request, session):
+        """
+        Called by connection handlers after each request, to join the
+        connection to the session named by a HELLO
+        :param request: The handled TcpRequest
+        :param session: The connection's session id, or None
+        :return: The session id the connection belongs to from now on
+        """
+        as_dict = getattr(request, "content_json", None)
+        result = getattr(request, "result", None)
+        if as_dict is None or as_dict["type"] != FuseOpType.HELLO:
+            return session
+        if result is None or result.errno != 0:
+            return session
+
+        new_session = result.data.get("session")
+        if new_session == session:
+            return session
+
+        if session is not None:
+            self._open_files.detach(session)
+        if new_session is not None:
+            self._open_files.attach(new_session)
+        return new_session
+
+    def end_connection(self, client_address, session, idle=False):
+        """
+        Called by connection handlers when a connection ends. The files its
+        client left open are closed once no connection has used them for the
+        session timeout, since pooled clients use them over several
+        connections, and clients in a session may reconnect. If the
+        connection only went idle, they are left to the idle timeout
+        :param client_address: The connection's address
+        :param session: The connection's session id, or None
+        :param idle: Whether the connection timed out rather than dropped
+        """
+        self._open_files.detach(client_address, expire=not idle)
+        if session is not None:
+            self._open_files.detach(session, expire=not idle)
+        if self._change_feed is not None:
+            self._change_feed.unsubscribe(client_address)
 
     def get_fs_root(self):
         return self._fs_root
 
+    def server_bind(self):
+        # Worker processes share the port, and the kernel balances new
+        # connections between them
+        if self._router is not None:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def service_actions(self):
+        # Called between polls of the listening socket, so files are closed
+        # on time even when no new ones are being opened
+        self._open_files.reap_idle()
+
+    def server_close(self):
+        super().server_close()
+        self._open_files.close_all()
+        if self._dir_fds is not None:
+            self._dir_fds.close()
+        if self._change_feed is not None:
+            self._change_feed.close()
+
+    def get_worker_id(self):
+        return self._worker_id
+
+    def get_metrics(self):
+        return self._metrics
+
+    def get_open_files(self):
+        return self._open_files
+
+    def get_dir_fds(self):
+        return self._dir_fds
+
+    def get_dir_listings(self):
+        return self._dir_listings
+
+    def get_change_feed(self):
+        return self._change_feed
+
     def get_fs_lock(self):
         return self._fs_lock
 
@@ -78,48 +270,109 @@ class HttpFsServer(TcpServer):
         return True
 
     @staticmethod
-    def _json_parse(req, _):
-        as_dict = ujson.loads(req.get_content().decode("utf-8"))
-
-        # Resolve path based on FS root
-        if "path" in as_dict.keys():
-            new_path = os.path.join(
-                req.server.get_fs_root(),
-                as_dict["path"].lstrip("/")
-            )
-            as_dict["path"] = new_path
+    def _parse_request(req, _):
+        if req.frame is not None:
+            as_dict = req.frame.as_request(getattr(req, "compressor", None))
+
+            # Binary responses can send file data straight from the file,
+            # unless it has to be compressed first
+            as_dict["zero_copy"] = getattr(req, "compressor", None) is None
+        else:
+            as_dict = ujson.loads(req.get_content().decode("utf-8"))
+
+            # JSON clients send file contents base64 encoded
+            if as_dict["type"] == FuseOpType.WRITE:
+                as_dict["data"] = base64.standard_b64decode(as_dict["data"])
+
+        # Open files belong to the session of the connection that opened
+        # them, or to the connection if it has none. Forwarded requests come
+        # from another worker, not from a client. Only binary connections
+        # can be pushed frames.
+        if getattr(req, "forwarded", False):
+            connection = None
+            session = None
+            as_dict["push"] = None
+        else:
+            connection = req.get_client_address()
+            session = getattr(req, "session", None)
+            as_dict["push"] = getattr(req, "push", None) if req.frame is not None else None
+
+        req.foreign_worker = HttpFsServer._resolve_args(req.server, as_dict, connection, session)
+
+        # Batched requests are resolved the same way
+        if as_dict["type"] == FuseOpType.COMPOUND:
+            for sub_op in as_dict.get("ops", []):
+                owner = HttpFsServer._resolve_args(req.server, sub_op, connection, session)
+                if req.foreign_worker is None:
+                    req.foreign_worker = owner
 
         req.content_json = as_dict
         return True
 
     @staticmethod
-    def _log_request(req, _):
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        logging.getLogger().debug(
-            "[{}] <-- {}:{} {}".format(
-                ts,
-                *req.get_client_address(),
-                FuseOpType(req.content_json["type"]).name
-            )
-        )
-        return True
+    def _resolve_args(server, as_dict, connection=None, session=None):
+        # Resolve paths based on FS root
+        for key in ("path", "old_path", "new_path"):
+            if key in as_dict:
+                as_dict[key] = os.path.join(
+                    server.get_fs_root(),
+                    as_dict[key].lstrip("/")
+                )
+        if "paths" in as_dict:
+            as_dict["paths"] = [
+                os.path.join(server.get_fs_root(), path.lstrip("/"))
+                for path in as_dict["paths"]
+            ]
+
+        # Open directories that path-based ops resolve paths relative to,
+        # cached directory listings, and the feed that SUBSCRIBE adds to
+        as_dict["dir_fds"] = server.get_dir_fds()
+        as_dict["dir_listings"] = server.get_dir_listings()
+        as_dict["change_feed"] = server.get_change_feed()
+
+        # Open file handles, the connection the request arrived on, and the
+        # client that owns the files it opens
+        open_files = server.get_open_files()
+        as_dict["open_files"] = open_files
+        as_dict["connection"] = connection
+        as_dict["client"] = session if session is not None else connection
+
+        # Handles opened by another worker process are served by that worker
+        handle = as_dict.get("file_descriptor")
+        if handle is not None:
+            owner = open_files.get_owner(handle)
+            if owner != server.get_worker_id():
+                return owner
+
+        return None
 
     @staticmethod
     def _serve_response(req, res):
         req_content = req.content_json
         handler = FuseOpFactory.get_op_handler(req_content["type"])
-        result_json = handler.handle(**req_content).to_json()
-        res.set_content(result_json.encode("utf-8"))
-        return True
 
-    @staticmethod
-    def _log_response(req, _):
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        logging.getLogger().debug(
-            "[{}] --> {}:{} {}".format(
-                ts,
-                *req.get_client_address(),
-                FuseOpType(req.content_json["type"]).name
-            ),
-        )
+        # Ops that raise are counted as EIO, so failures show in the metrics
+        start = time.perf_counter()
+        result = None
+        try:
+            result = handler.handle(**req_content)
+        finally:
+            req.server.get_metrics().record(
+                req_content["type"],
+                result.errno if result is not None else errno.EIO,
+                time.perf_counter() - start,
+                bytes_in=payload_size(req_content.get("data")),
+                bytes_out=payload_size(result.data) if result is not None else 0
+            )
+        req.result = result
+
+        # Answer in the same format the request arrived in
+        if req.frame is not None:
+            res.frame = Frame.response(
+                req.frame.op,
+                req.frame.request_id,
+                result
+            )
+        else:
+            res.set_content(result.to_json().encode("utf-8"))
         return True
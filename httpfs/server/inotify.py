@@ -0,0 +1,113 @@
+"""
+Minimal ctypes binding to Linux's inotify API
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+_EVENT = struct.Struct("iIII")
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        for name in ("inotify_init1", "inotify_add_watch", "inotify_rm_watch"):
+            if not hasattr(libc, name):
+                raise OSError(errno.ENOSYS, "inotify is not available")
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+def _check(result):
+    if result < 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+    return result
+
+
+class Inotify:
+    """
+    An inotify instance. Watches are per directory, not recursive
+    """
+
+    def __init__(self):
+        """
+        :raises OSError: If inotify isn't available
+        """
+        self._libc = _get_libc()
+        self._fd = _check(self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+
+    def fileno(self):
+        return self._fd
+
+    def add_watch(self, path, mask):
+        """
+        :param path: Path to watch
+        :param mask: Bitwise OR of the IN_* events to report
+        :raises OSError: If the path can't be watched
+        :return: The watch descriptor. Watching the same inode twice returns
+            the same descriptor
+        """
+        return _check(self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask))
+
+    def rm_watch(self, wd):
+        """
+        :param wd: A watch descriptor returned by add_watch()
+        """
+        try:
+            _check(self._libc.inotify_rm_watch(self._fd, wd))
+        except OSError as excp:
+            # Already removed because the watched path was deleted
+            if excp.errno != errno.EINVAL:
+                raise
+
+    def read_events(self):
+        """
+        Reads the events that are ready without blocking
+        :return: List of (wd, mask, cookie, name) tuples. name is a str, or
+            None for events about the watched path itself
+        """
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = list()
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, cookie, name_len = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+            events.append((wd, mask, cookie, os.fsdecode(name) if name else None))
+
+        return events
+
+    def close(self):
+        os.close(self._fd)
@@ -0,0 +1,245 @@
+"""
+Contains support for running HttpFsServer as several worker processes that
+share one listening port
+"""
+
+import base64
+import errno
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+from queue import Empty, LifoQueue
+from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+
+import ujson
+from pytcp_message.message import TcpRequest
+
+from ..common import FuseOpType
+from ..common._fuse_ops import FuseOpResult
+from ..common.wire_protocol import Frame, send_frame
+
+
+class WorkerRouter:
+    """
+    Sends requests for file handles opened by another worker process to
+    that worker. Each worker listens on a unix socket in a directory shared
+    by all workers, and forwarded requests travel over it as binary frames.
+    """
+
+    def __init__(self, worker_id, worker_count, socket_dir):
+        """
+        :param worker_id: Index of this worker
+        :param worker_count: Number of workers
+        :param socket_dir: Directory holding the workers' unix sockets
+        """
+        self._worker_id = worker_id
+        self._worker_count = worker_count
+        self._socket_dir = socket_dir
+        self._links = [LifoQueue() for _ in range(worker_count)]
+        self._unix_server = None
+        self._thread = None
+
+    def get_worker_id(self):
+        return self._worker_id
+
+    def get_worker_count(self):
+        return self._worker_count
+
+    def start(self, server):
+        """
+        Starts accepting requests forwarded by the other workers
+        :param server: This worker's HttpFsServer
+        """
+        path = self._get_socket_path(self._worker_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+        self._unix_server = ThreadingUnixStreamServer(path, _ForwardedRequestHandler)
+        self._unix_server.daemon_threads = True
+        self._unix_server.httpfs_server = server
+        self._thread = threading.Thread(
+            target=self._unix_server.serve_forever,
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops accepting forwarded requests and closes all links
+        """
+        if self._unix_server is not None:
+            self._unix_server.shutdown()
+            self._unix_server.server_close()
+
+        for links in self._links:
+            while True:
+                try:
+                    link, _ = links.get_nowait()
+                    link.close()
+                except Empty:
+                    break
+
+    def route_request(self, req, res):
+        """
+        Request handler that answers requests for another worker's handles
+        by forwarding them. Other requests continue down the pipeline
+        """
+        owner = req.foreign_worker
+        if owner is None:
+            return True
+
+        # Requests mixing handles from several workers can't be served by
+        # any one of them
+        if getattr(req, "forwarded", False):
+            WorkerRouter._set_response(
+                req,
+                res,
+                Frame(req.content_json["type"], errno=errno.EBADF, meta=b'"Bad file handle"')
+            )
+            return False
+
+        if req.frame is not None:
+            frame = req.frame
+        else:
+            frame = WorkerRouter._json_to_frame(req.get_content())
+
+        try:
+            response = self._forward(owner, frame)
+        except (OSError, ValueError) as excp:
+            logging.error("Couldn't forward request to worker %d: %s", owner, excp)
+            response = Frame(
+                frame.op,
+                errno=errno.EIO,
+                meta=ujson.dumps(str(excp)).encode("utf-8")
+            )
+
+        WorkerRouter._set_response(req, res, response)
+        return False
+
+    @staticmethod
+    def _set_response(req, res, response):
+        # Answer in the same format the request arrived in
+        if req.frame is not None:
+            response.request_id = req.frame.request_id
+            res.frame = response
+        else:
+            as_dict = response.as_response()
+            result = FuseOpResult(as_dict["errno"], as_dict["data"])
+            res.set_content(result.to_json().encode("utf-8"))
+
+    def _get_socket_path(self, worker_id):
+        return os.path.join(self._socket_dir, "worker-{}.sock".format(worker_id))
+
+    def _forward(self, owner, frame):
+        links = self._links[owner]
+        try:
+            link, link_rfile = links.get_nowait()
+        except Empty:
+            link = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            link.connect(self._get_socket_path(owner))
+            link_rfile = link.makefile("rb")
+
+        try:
+            send_frame(link, frame)
+            response = Frame.from_stream(link_rfile)
+            if response is None:
+                raise ConnectionError("Worker {} closed the link".format(owner))
+        except BaseException:
+            link.close()
+            raise
+
+        links.put((link, link_rfile))
+        return response
+
+    @staticmethod
+    def _json_to_frame(content):
+        as_dict = ujson.loads(content.decode("utf-8"))
+        op = as_dict.pop("type")
+
+        # JSON clients send file contents base64 encoded
+        if op == FuseOpType.WRITE:
+            as_dict["data"] = base64.standard_b64decode(as_dict["data"])
+
+        return Frame.request(op, 0, **as_dict)
+
+
+class _ForwardedRequestHandler(StreamRequestHandler):
+    """
+    Runs requests forwarded by other workers through this worker's pipeline
+    """
+
+    def handle(self):
+        server = self.server.httpfs_server
+        client_address = ("worker", 0)
+
+        while True:
+            frame = Frame.from_stream(self.rfile)
+            if frame is None:
+                break
+
+            request = TcpRequest(client_address)
+            request.frame = frame
+            request.forwarded = True
+            response = server.run_request_handlers(request)
+            send_frame(self.request, response.frame)
+
+
+def run_workers(worker_count, make_server):
+    """
+    Forks worker_count processes that each run a server on the same port,
+    and waits for them to exit. Ctrl-C or SIGTERM stops all of them
+    :param worker_count: Number of worker processes
+    :param make_server: make_server(router) -> HttpFsServer. Called in each
+        worker
+    """
+    socket_dir = tempfile.mkdtemp(prefix="httpfs-workers-")
+    pids = list()
+
+    try:
+        for worker_id in range(worker_count):
+            pid = os.fork()
+            if pid == 0:
+                os._exit(_run_worker(worker_id, worker_count, socket_dir, make_server))
+            pids.append(pid)
+
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        for pid in pids:
+            os.waitpid(pid, 0)
+
+    except KeyboardInterrupt:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in pids:
+            os.waitpid(pid, 0)
+
+    finally:
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+def _run_worker(worker_id, worker_count, socket_dir, make_server):
+    # Ctrl-C reaches the whole process group, but workers are stopped by the
+    # parent's SIGTERM, which wait() below sees as a KeyboardInterrupt
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    router = WorkerRouter(worker_id, worker_count, socket_dir)
+    try:
+        server = make_server(router)
+        router.start(server)
+        server.start()
+        server.wait()
+        return 0
+    except KeyboardInterrupt:
+        return 0
+    except Exception as excp:
+        logging.error("Worker %d failed: %s", worker_id, excp)
+        return 1
+    finally:
+        router.stop()
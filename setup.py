@@ -8,5 +8,11 @@ setup(
     author='httpfs',
     license='GPL-3.0-or-later',
     packages=['httpfs'],
-    zip_safe=False, install_requires=['ujson', 'fusepy>=3.0.1', 'pytcp-message']
+    zip_safe=False, install_requires=['ujson', 'fusepy>=3.0.1', 'pytcp-message'],
+    extras_require={'fsspec': ['fsspec']},
+    entry_points={
+        'fsspec.specs': [
+            'httpfs=httpfs.client.fsspec_filesystem.HttpFsFileSystem'
+        ]
+    }
 )
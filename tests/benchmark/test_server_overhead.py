@@ -0,0 +1,84 @@
+"""
+Micro-benchmarks for the server's per-request overhead, measured as GET_ATTR
+ops/sec on a hot file. Run with
+    python -m pytest -s tests/benchmark
+Set HTTPFS_BENCH_MIN_OPS to fail any benchmark slower than that many ops/sec
+"""
+
+import os
+import time
+
+import pytest
+from pytcp_message.message import TcpRequest
+
+from httpfs.client.connection import HttpFsConnection
+from httpfs.common import FuseOpFactory, FuseOpType
+from httpfs.common.wire_protocol import Frame
+from httpfs.server import AsyncHttpFsServer, HttpFsServer
+
+DURATION = 0.5
+FAKE_ADDR = ("127.0.0.1", 12345)
+
+
+def _measure(name, func):
+    # Warm up caches before timing
+    for _ in range(100):
+        func()
+
+    ops = 0
+    start = time.perf_counter()
+    deadline = start + DURATION
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            func()
+        ops += 100
+
+    ops_per_sec = ops / (time.perf_counter() - start)
+    print("\n{}: {:,.0f} ops/sec".format(name, ops_per_sec))
+
+    min_ops = float(os.environ.get("HTTPFS_BENCH_MIN_OPS", 0))
+    assert ops_per_sec >= min_ops, "{} is below {} ops/sec".format(name, min_ops)
+
+
+@pytest.fixture
+def fs_root(tmp_path):
+    (tmp_path / "hot").write_bytes(b"x" * 4096)
+    return str(tmp_path)
+
+
+def test_dispatch_lookup():
+    _measure(
+        "dispatch lookup",
+        lambda: FuseOpFactory.get_op_handler(FuseOpType.GET_ATTR)
+    )
+
+
+def test_request_pipeline(fs_root):
+    server = HttpFsServer(0, fs_root)
+    frame = Frame.request(FuseOpType.GET_ATTR, 1, path="/hot", api_key=None)
+
+    def handle():
+        request = TcpRequest(FAKE_ADDR)
+        request.frame = frame
+        server.run_request_handlers(request)
+
+    try:
+        _measure("request pipeline", handle)
+    finally:
+        server.server_close()
+
+
+@pytest.mark.parametrize("server_class", [HttpFsServer, AsyncHttpFsServer])
+def test_round_trip(fs_root, server_class):
+    server = server_class(0, fs_root)
+    server.start()
+    connection = HttpFsConnection(("127.0.0.1", server.server_address[1]))
+
+    try:
+        _measure(
+            "{} round trip".format(server_class.__name__),
+            lambda: connection.request(FuseOpType.GET_ATTR, path="/hot")
+        )
+    finally:
+        connection.close()
+        server.stop()
@@ -0,0 +1,118 @@
+import asyncio
+import errno
+import os
+
+import pytest
+
+from httpfs.client import AsyncHttpFsSession
+from httpfs.common import FuseOpType
+from httpfs.server import HttpFsServer
+from httpfs.server.async_httpfs_server import AsyncHttpFsServer
+
+
+@pytest.fixture(params=[HttpFsServer, AsyncHttpFsServer])
+def server(request, tmp_path):
+    server = request.param(0, str(tmp_path))
+    server.start()
+    yield server
+    server.stop()
+    server.server_close()
+
+
+def run_session(server, test, **kwargs):
+    async def run():
+        async with AsyncHttpFsSession("127.0.0.1", server.server_address[1], **kwargs) as session:
+            return await test(session)
+
+    return asyncio.run(run())
+
+
+def test_large_reads_are_split(tmp_path, server):
+    contents = os.urandom(1000 * 1024 + 7)
+    (tmp_path / "data").write_bytes(contents)
+
+    async def test(session):
+        assert await session.read_file("/data") == contents
+        assert await session.read_file("/data", 1000, 300 * 1024) == contents[1000:1000 + 300 * 1024]
+
+        fh = await session.open("/data")
+        assert await session.read(fh, 2 * len(contents), 10) == contents[10:]
+        await session.release(fh)
+
+    run_session(server, test, chunk_size=64 * 1024)
+
+
+def test_concurrent_requests(tmp_path, server):
+    for index in range(50):
+        (tmp_path / "{}".format(index)).write_bytes(b"x" * index)
+
+    async def test(session):
+        contents = await asyncio.gather(*[
+            session.read_file("/{}".format(index)) for index in range(50)
+        ])
+        assert contents == [b"x" * index for index in range(50)]
+
+    run_session(server, test, connections=2)
+
+
+def test_batched_metadata(tmp_path, server):
+    (tmp_path / "dir").mkdir()
+    for name in ("a", "b", "c"):
+        (tmp_path / "dir" / name).write_bytes(name.encode())
+
+    async def test(session):
+        entries = await session.listdir("/dir")
+        assert sorted((name, attrs["st_size"]) for name, attrs in entries) == [("a", 1), ("b", 1), ("c", 1)]
+
+        all_attrs = await session.getattr_many(["/dir/a", "/missing", "/dir"])
+        assert all_attrs[0]["st_size"] == 1
+        assert all_attrs[1] is None
+        assert all_attrs[2]["st_mode"] == os.stat(str(tmp_path / "dir")).st_mode
+
+        assert await session.supports(FuseOpType.READDIR_PAGE)
+        with pytest.raises(FileNotFoundError):
+            await session.getattr("/missing")
+
+    run_session(server, test)
+
+
+def test_writes(tmp_path, server):
+    contents = os.urandom(200 * 1024)
+
+    async def test(session):
+        await session.mkdir("/dir")
+        await session.write_file("/dir/new", contents)
+        await session.rename("/dir/new", "/dir/renamed")
+        assert await session.read_file("/dir/renamed") == contents
+
+        await session.unlink("/dir/renamed")
+        await session.rmdir("/dir")
+
+    run_session(server, test, chunk_size=64 * 1024, compression=True)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_errors_carry_errno(server):
+    async def test(session):
+        with pytest.raises(OSError) as excinfo:
+            await session.read(123, 10)
+        assert excinfo.value.errno == errno.EBADF
+
+    run_session(server, test)
+
+
+def test_handles_survive_a_lost_connection(tmp_path, server):
+    (tmp_path / "data").write_bytes(b"0123456789")
+
+    async def test(session):
+        fh = await session.open("/data")
+        assert session._session in server.get_open_files()._handles_by_client
+        await session._connections[0].close()
+        await session.connect()
+
+        # Every connection belongs to the session that owns the handle
+        for _ in range(len(session._connections)):
+            assert await session.read(fh, 4, 0) == b"0123"
+        await session.release(fh)
+
+    run_session(server, test)
@@ -0,0 +1,92 @@
+from httpfs.client.attr_cache import AttrCache, MISSING
+
+FAKE_PATH = "/some/path"
+FAKE_ATTRS = {"st_size": 10, "st_mode": 0o100644}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_attrs_expire():
+    clock = FakeClock()
+    cache = AttrCache(ttl=1.0, clock=clock)
+
+    assert cache.get_attrs(FAKE_PATH) is MISSING
+    cache.put_attrs(FAKE_PATH, FAKE_ATTRS)
+    assert cache.get_attrs(FAKE_PATH) == FAKE_ATTRS
+
+    clock.now = 1.5
+    assert cache.get_attrs(FAKE_PATH) is MISSING
+
+
+def test_negative_entries():
+    clock = FakeClock()
+    cache = AttrCache(ttl=10.0, negative_ttl=0.5, clock=clock)
+
+    cache.put_attrs(FAKE_PATH, None)
+    assert cache.get_attrs(FAKE_PATH) is None
+
+    clock.now = 1.0
+    assert cache.get_attrs(FAKE_PATH) is MISSING
+
+
+def test_disabled():
+    cache = AttrCache(ttl=0, negative_ttl=0)
+    cache.put_attrs(FAKE_PATH, FAKE_ATTRS)
+    cache.put_attrs("/missing", None)
+    cache.put_access(FAKE_PATH, 0, 0, 4, True)
+
+    assert cache.get_attrs(FAKE_PATH) is MISSING
+    assert cache.get_attrs("/missing") is MISSING
+    assert cache.get_access(FAKE_PATH, 0, 0, 4) is MISSING
+
+
+def test_lru_eviction():
+    cache = AttrCache(max_entries=2)
+    cache.put_attrs("/a", FAKE_ATTRS)
+    cache.put_attrs("/b", FAKE_ATTRS)
+    cache.get_attrs("/a")
+    cache.put_attrs("/c", FAKE_ATTRS)
+
+    assert len(cache) == 2
+    assert cache.get_attrs("/b") is MISSING
+    assert cache.get_attrs("/a") == FAKE_ATTRS
+
+
+def test_invalidate_drops_access():
+    cache = AttrCache()
+    cache.put_attrs(FAKE_PATH, FAKE_ATTRS)
+    cache.put_access(FAKE_PATH, 1000, 1000, 4, True)
+    assert cache.get_access(FAKE_PATH, 1000, 1000, 4) is True
+    assert cache.get_access(FAKE_PATH, 0, 0, 4) is MISSING
+
+    cache.invalidate(FAKE_PATH)
+    assert cache.get_attrs(FAKE_PATH) is MISSING
+    assert cache.get_access(FAKE_PATH, 1000, 1000, 4) is MISSING
+
+
+def test_invalidate_tree():
+    cache = AttrCache()
+    for path in ["/dir", "/dir/a", "/dir/sub/b", "/dir2"]:
+        cache.put_attrs(path, FAKE_ATTRS)
+
+    cache.invalidate_tree("/dir")
+
+    assert cache.get_attrs("/dir") is MISSING
+    assert cache.get_attrs("/dir/a") is MISSING
+    assert cache.get_attrs("/dir/sub/b") is MISSING
+    assert cache.get_attrs("/dir2") == FAKE_ATTRS
+
+
+def test_stale_put_is_ignored():
+    cache = AttrCache()
+    generation = cache.get_generation()
+    cache.invalidate(FAKE_PATH)
+    cache.put_attrs(FAKE_PATH, FAKE_ATTRS, generation=generation)
+
+    assert cache.get_attrs(FAKE_PATH) is MISSING
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from httpfs.client.block_cache import BlockCache
+from httpfs.client.block_reader import BlockReader
+
+BLOCK_SIZE = 4
+FAKE_PATH = "/some/file"
+FAKE_MTIME = 1234.5
+FAKE_FILE = bytes(range(26))
+
+
+class FakeServer:
+    def __init__(self, contents=FAKE_FILE):
+        self.contents = contents
+        self.reads = list()
+
+    def fetch(self, offset, size):
+        self.reads.append(offset)
+        return self.contents[offset:offset + size]
+
+
+def test_cache_is_bounded():
+    cache = BlockCache(max_bytes=2 * BLOCK_SIZE, block_size=BLOCK_SIZE)
+    for block in range(3):
+        cache.put(FAKE_PATH, FAKE_MTIME, block, b"x" * BLOCK_SIZE)
+
+    assert cache.get_size_bytes() == 2 * BLOCK_SIZE
+    assert cache.get(FAKE_PATH, FAKE_MTIME, 0) is None
+    assert cache.get(FAKE_PATH, FAKE_MTIME, 2) is not None
+
+
+def test_cache_is_keyed_by_mtime():
+    cache = BlockCache(block_size=BLOCK_SIZE)
+    cache.put(FAKE_PATH, FAKE_MTIME, 0, b"abcd")
+    assert cache.get(FAKE_PATH, FAKE_MTIME + 1, 0) is None
+
+
+def test_invalidate():
+    cache = BlockCache(block_size=BLOCK_SIZE)
+    cache.put(FAKE_PATH, FAKE_MTIME, 0, b"abcd")
+    cache.put("/dir/file", FAKE_MTIME, 0, b"abcd")
+
+    generation = cache.get_generation()
+    cache.invalidate(FAKE_PATH)
+    cache.invalidate_tree("/dir")
+    assert len(cache) == 0
+    assert cache.get_size_bytes() == 0
+
+    # Fetched before the invalidation, so it must not be cached
+    cache.put(FAKE_PATH, FAKE_MTIME, 0, b"abcd", generation=generation)
+    assert cache.get(FAKE_PATH, FAKE_MTIME, 0) is None
+
+
+def test_reader_assembles_blocks():
+    server = FakeServer()
+    cache = BlockCache(block_size=BLOCK_SIZE)
+    reader = BlockReader(cache, FAKE_PATH, FAKE_MTIME, len(FAKE_FILE))
+
+    assert reader.read(10, 3, server.fetch) == FAKE_FILE[3:13]
+    assert reader.read(100, 20, server.fetch) == FAKE_FILE[20:]
+    assert server.reads == [0, 4, 8, 12, 20, 24]
+
+    # Served from the cache
+    assert reader.read(4, 4, server.fetch) == FAKE_FILE[4:8]
+    assert len(server.reads) == 6
+
+
+def test_sequential_reads_prefetch():
+    server = FakeServer()
+    cache = BlockCache(block_size=BLOCK_SIZE)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        reader = BlockReader(
+            cache,
+            FAKE_PATH,
+            FAKE_MTIME,
+            len(FAKE_FILE),
+            executor=executor,
+            window=3
+        )
+        assert reader.read(BLOCK_SIZE, 0, server.fetch) == FAKE_FILE[:4]
+
+    # Blocks 1-3 were prefetched, nothing past the end of the file was
+    assert sorted(server.reads) == [0, 4, 8, 12]
+    for block in range(1, 4):
+        assert cache.get(FAKE_PATH, FAKE_MTIME, block) is not None
@@ -0,0 +1,107 @@
+import os
+import socket
+from contextlib import contextmanager
+
+import pytest
+
+from httpfs.client.bulk_copy import BulkCopy
+from httpfs.common import FuseOpType
+from httpfs.server import HttpFsServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    root = tmp_path / "server"
+    root.mkdir()
+    server = HttpFsServer(0, str(root))
+    server.start()
+    yield server
+    server.stop()
+    server.server_close()
+
+
+@pytest.fixture
+def copier(server):
+    copier = BulkCopy("127.0.0.1", server.server_address[1], connections=4, chunk_size=1000)
+    yield copier
+    copier.close()
+
+
+def make_tree(root):
+    (root / "dir").mkdir(parents=True)
+    (root / "empty").write_bytes(b"")
+    (root / "dir" / "file").write_bytes(os.urandom(4321))
+
+
+def test_put_and_get_tree(tmp_path, copier):
+    make_tree(tmp_path / "src")
+
+    copier.put(str(tmp_path / "src"), "/")
+    assert copier.wait(timeout=10)
+    server_copy = tmp_path / "server" / "src"
+    assert (server_copy / "dir" / "file").read_bytes() == (tmp_path / "src" / "dir" / "file").read_bytes()
+    assert (server_copy / "empty").exists()
+
+    (tmp_path / "dest").mkdir()
+    copier.get("/src", str(tmp_path / "dest"))
+    assert copier.wait(timeout=10)
+    local_copy = tmp_path / "dest" / "src"
+    assert (local_copy / "dir" / "file").read_bytes() == (tmp_path / "src" / "dir" / "file").read_bytes()
+    assert os.stat(local_copy / "dir" / "file").st_mtime == os.stat(server_copy / "dir" / "file").st_mtime
+
+    files_copied, files_skipped, bytes_copied, _ = copier.get_stats()
+    assert (files_copied, files_skipped, bytes_copied) == (4, 0, 2 * 4321)
+    assert copier.get_errors() == []
+
+
+def test_sync_skips_unchanged_files(tmp_path, copier):
+    make_tree(tmp_path / "src")
+    copier.put(str(tmp_path / "src"), "/copy", only_changed=True)
+    assert copier.wait(timeout=10)
+
+    (tmp_path / "src" / "empty").write_bytes(b"changed")
+    copier.put(str(tmp_path / "src"), "/copy", only_changed=True)
+    assert copier.wait(timeout=10)
+
+    assert (tmp_path / "server" / "copy" / "empty").read_bytes() == b"changed"
+    files_copied, files_skipped, _, _ = copier.get_stats()
+    assert (files_copied, files_skipped) == (3, 1)
+
+
+def test_missing_source(tmp_path, copier):
+    with pytest.raises(FileNotFoundError):
+        copier.get("/missing", str(tmp_path))
+
+
+def test_cancelled_copy_stops_early(tmp_path, server):
+    (tmp_path / "big").write_bytes(os.urandom(1000 * 1000))
+    copier = BulkCopy("127.0.0.1", server.server_address[1], connections=1, chunk_size=1000)
+
+    copier.put(str(tmp_path / "big"), "/big")
+    copier.close(cancel=True)
+    _, _, bytes_copied, _ = copier.get_stats()
+    assert bytes_copied < 1000 * 1000
+
+
+@pytest.mark.parametrize("request_type, error, attempts", [
+    (FuseOpType.MKDIR, ConnectionResetError, 1),
+    (FuseOpType.CREATE, ConnectionResetError, 1),
+    (FuseOpType.GET_ATTR, ConnectionResetError, BulkCopy._RETRIES),
+    (FuseOpType.GET_ATTR, socket.timeout, 1)
+])
+def test_sent_requests_are_resent_only_if_harmless(copier, monkeypatch, request_type, error, attempts):
+    sent = list()
+
+    class DroppedConnection:
+        def request(self, request_type, **kwargs):
+            sent.append(request_type)
+            raise error()
+
+    @contextmanager
+    def connection():
+        yield DroppedConnection()
+
+    monkeypatch.setattr(copier._pool, "connection", connection)
+    with pytest.raises(error):
+        copier._request(request_type, path="/dir")
+    assert len(sent) == attempts
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+from httpfs.client.attr_cache import MISSING, AttrCache
+
+
+def long_lived_attrs():
+    return AttrCache(ttl=60, negative_ttl=5)
+
+
+def test_mount_options(server, make_client):
+    client = make_client(server.server_address[1], attr_cache=long_lived_attrs())
+    assert client.get_mount_options() == {}
+    client._pool.close()
+
+    client = make_client(server.server_address[1], attr_cache=long_lived_attrs(), coherent_cache=True)
+    assert client.get_mount_options() == {
+        "auto_cache": True,
+        "entry_timeout": 60,
+        "attr_timeout": 60,
+        "negative_timeout": 5
+    }
+    client._pool.close()
+
+    # Change notifications don't reach the kernel's caches
+    client = make_client(
+        server.server_address[1],
+        attr_cache=long_lived_attrs(),
+        coherent_cache=True,
+        change_feed=True
+    )
+    assert client.get_mount_options() == {
+        "auto_cache": True,
+        "entry_timeout": AttrCache._DEFAULT_TTL,
+        "attr_timeout": AttrCache._DEFAULT_TTL,
+        "negative_timeout": AttrCache._DEFAULT_NEGATIVE_TTL
+    }
+    client.destroy("/")
+
+
+@pytest.mark.parametrize("flags", [os.O_RDONLY, os.O_RDWR])
+def test_open_refreshes_attrs(tmp_path, server, make_client, flags):
+    client = make_client(server.server_address[1], attr_cache=long_lived_attrs(), coherent_cache=True)
+    (tmp_path / "data").write_bytes(b"old")
+    assert client.getattr("/data")["st_size"] == 3
+
+    # Changed behind the client's back, within the attribute TTL
+    (tmp_path / "data").write_bytes(b"changed")
+    assert client.getattr("/data")["st_size"] == 3
+
+    fh = client.open("/data", flags)
+    assert client.getattr("/data", fh)["st_size"] == 7
+    client.release("/data", fh)
+    client._pool.close()
+
+
+def test_blocks_are_keyed_on_the_opened_version(tmp_path, server, make_client):
+    client = make_client(server.server_address[1], attr_cache=long_lived_attrs())
+    (tmp_path / "data").write_bytes(b"old")
+    assert client.getattr("/data")["st_size"] == 3
+
+    # The cached attributes are stale, but the blocks read are new
+    (tmp_path / "data").write_bytes(b"changed")
+    fh = client.open("/data", os.O_RDONLY)
+    assert client.read("/data", 100, 0, fh) == b"changed"
+
+    stats = os.stat(str(tmp_path / "data"))
+    assert client._block_cache.get("/data", (stats.st_mtime, stats.st_size), 0) == b"changed"
+    client.release("/data", fh)
+    client._pool.close()
+
+
+def test_reads_see_writes_buffered_by_other_handles(tmp_path, server, make_client):
+    client = make_client(server.server_address[1], writeback=True)
+    (tmp_path / "data").write_bytes(b"old")
+    try:
+        writer = client.open("/data", os.O_RDWR)
+        reader = client.open("/data", os.O_RDONLY)
+        client.write("/data", b"new", 0, writer)
+        assert client.read("/data", 3, 0, reader) == b"new"
+
+        client.release("/data", reader)
+        client.release("/data", writer)
+    finally:
+        client.destroy("/")
+
+
+def test_create_caches_attrs_unless_invalidated(tmp_path, server, make_client, monkeypatch):
+    client = make_client(server.server_address[1])
+    try:
+        client.release("/quiet", client.create("/quiet", 0o644))
+        assert client._attr_cache.get_attrs("/quiet")["st_size"] == 0
+
+        # An invalidation arrives while the create is in flight
+        compound = client.compound
+
+        def invalidated_compound(ops):
+            result = compound(ops)
+            client._attr_cache.invalidate("/busy")
+            return result
+
+        monkeypatch.setattr(client, "compound", invalidated_compound)
+        client.release("/busy", client.create("/busy", 0o644))
+        assert client._attr_cache.get_attrs("/busy") is MISSING
+    finally:
+        client.destroy("/")
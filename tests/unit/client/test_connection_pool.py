@@ -0,0 +1,100 @@
+import threading
+import time
+import unittest.mock as mock
+
+import pytest
+
+from httpfs.client.connection_pool import HttpFsConnectionPool
+
+SERVER_ADDR = ("test-host", 8080)
+POOL_SIZE = 3
+
+
+@mock.patch("httpfs.client.connection_pool.HttpFsConnection")
+def test_connections_are_reused(fake_connection_cls):
+    pool = HttpFsConnectionPool(SERVER_ADDR, size=POOL_SIZE)
+
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    assert fake_connection_cls.call_count == 1
+
+
+@mock.patch("httpfs.client.connection_pool.HttpFsConnection")
+def test_broken_connections_are_dropped(fake_connection_cls):
+    fake_connection_cls.side_effect = lambda *args, **kwargs: mock.MagicMock()
+    pool = HttpFsConnectionPool(SERVER_ADDR, size=POOL_SIZE)
+
+    with pytest.raises(BrokenPipeError):
+        with pool.connection() as broken:
+            raise BrokenPipeError()
+
+    broken.close.assert_called_once()
+
+    with pool.connection() as fresh:
+        assert fresh is not broken
+
+
+@mock.patch("httpfs.client.connection_pool.HttpFsConnection")
+def test_connections_closed_by_the_server_are_replaced(fake_connection_cls):
+    fake_connection_cls.side_effect = lambda *args, **kwargs: mock.MagicMock()
+    pool = HttpFsConnectionPool(SERVER_ADDR, size=POOL_SIZE)
+
+    with pool.connection() as closed:
+        closed.is_alive.return_value = False
+
+    with pool.connection() as fresh:
+        assert fresh is not closed
+    closed.close.assert_called_once()
+
+
+@mock.patch("httpfs.client.connection_pool.HttpFsConnection")
+def test_pool_is_bounded(fake_connection_cls):
+    fake_connection_cls.side_effect = lambda *args, **kwargs: mock.MagicMock()
+    pool = HttpFsConnectionPool(SERVER_ADDR, size=POOL_SIZE)
+
+    in_flight = [0]
+    max_in_flight = [0]
+    lock = threading.Lock()
+
+    def use_connection():
+        with pool.connection():
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+
+    threads = [threading.Thread(target=use_connection) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max_in_flight[0] == POOL_SIZE
+    assert fake_connection_cls.call_count == POOL_SIZE
+
+
+@mock.patch("httpfs.client.connection_pool.HttpFsConnection")
+def test_supports_needs_no_checkout(fake_connection_cls):
+    fake_connection_cls.side_effect = lambda *args, **kwargs: mock.MagicMock()
+    pool = HttpFsConnectionPool(SERVER_ADDR, size=1)
+
+    with pool.connection() as first:
+        first.supports.return_value = True
+        assert pool.supports(1)
+
+    # Replacing the connection picks up a restarted server's ops
+    first.is_alive.return_value = False
+    with pool.connection() as second:
+        second.supports.return_value = False
+        assert not pool.supports(1)
+
+
+def test_invalid_size():
+    with pytest.raises(ValueError):
+        HttpFsConnectionPool(SERVER_ADDR, size=0)
@@ -0,0 +1,205 @@
+import os
+
+import pytest
+
+from httpfs.client.block_reader import BlockReader
+from httpfs.client.disk_block_cache import DiskBlockCache
+
+BLOCK_SIZE = 4
+SERVER = "localhost:8080"
+FAKE_PATH = "/some/file"
+FAKE_FILE = bytes(range(26))
+FAKE_VERSION = (1234.5, len(FAKE_FILE))
+
+
+@pytest.fixture
+def open_cache(tmp_path):
+    caches = list()
+
+    def _open_cache(**kwargs):
+        kwargs.setdefault("block_size", BLOCK_SIZE)
+        cache = DiskBlockCache(str(tmp_path), SERVER, **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield _open_cache
+    for cache in caches:
+        cache.close()
+
+
+# The server gets a directory of its own, apart from the caches
+@pytest.fixture
+def fs_root(tmp_path):
+    root = tmp_path / "root"
+    root.mkdir()
+    return root
+
+
+def block_files(tmp_path):
+    return [
+        os.path.join(root, name)
+        for root, _, names in os.walk(str(tmp_path))
+        for name in names
+        if os.path.basename(root) != SERVER.replace(":", "%3A")
+    ]
+
+
+def test_blocks_survive_reopening(open_cache):
+    cache = open_cache()
+    reader = BlockReader(cache, FAKE_PATH, FAKE_VERSION, len(FAKE_FILE))
+    assert reader.read(100, 0, lambda offset, size: FAKE_FILE[offset:offset + size]) == FAKE_FILE
+    cache.close()
+
+    cache = open_cache()
+    assert len(cache) == 7
+    assert cache.get_size_bytes() == len(FAKE_FILE)
+
+    def fetch(offset, size):
+        raise AssertionError("Read from the server")
+
+    reader = BlockReader(cache, FAKE_PATH, FAKE_VERSION, len(FAKE_FILE))
+    assert reader.read(100, 0, fetch) == FAKE_FILE
+    assert cache.get_stats()["hits"] == 7
+
+
+def test_cache_is_keyed_by_version(open_cache):
+    cache = open_cache()
+    cache.put(FAKE_PATH, FAKE_VERSION, 0, b"abcd")
+    assert (FAKE_PATH, FAKE_VERSION, 0) in cache
+    assert cache.get(FAKE_PATH, (1234.5, 30), 0) is None
+    assert cache.get(FAKE_PATH, (1235.5, len(FAKE_FILE)), 0) is None
+
+    # Caching the new version drops the old one
+    cache.put(FAKE_PATH, (1235.5, 4), 0, b"efgh")
+    assert cache.get(FAKE_PATH, FAKE_VERSION, 0) is None
+    assert cache.get(FAKE_PATH, (1235.5, 4), 0) == b"efgh"
+    assert len(cache) == 1
+
+
+def test_cache_is_bounded(open_cache, tmp_path):
+    cache = open_cache(max_bytes=2 * BLOCK_SIZE)
+    for block in range(3):
+        cache.put(FAKE_PATH, FAKE_VERSION, block, b"x" * BLOCK_SIZE)
+    cache.get(FAKE_PATH, FAKE_VERSION, 1)
+    cache.put(FAKE_PATH, FAKE_VERSION, 3, b"x" * BLOCK_SIZE)
+
+    assert cache.get_size_bytes() == 2 * BLOCK_SIZE
+    assert cache.get(FAKE_PATH, FAKE_VERSION, 1) is not None
+    assert cache.get(FAKE_PATH, FAKE_VERSION, 2) is None
+    assert len(block_files(tmp_path)) == 2
+
+
+def test_invalidate(open_cache, tmp_path):
+    cache = open_cache()
+    cache.put(FAKE_PATH, FAKE_VERSION, 0, b"abcd")
+    cache.put("/dir/file", FAKE_VERSION, 0, b"abcd")
+    cache.put("/dirt", FAKE_VERSION, 0, b"abcd")
+
+    generation = cache.get_generation()
+    cache.invalidate(FAKE_PATH)
+    cache.invalidate_tree("/dir")
+    assert len(cache) == 1
+    assert cache.get("/dirt", FAKE_VERSION, 0) == b"abcd"
+
+    # Fetched before the invalidation, so it must not be cached
+    cache.put(FAKE_PATH, FAKE_VERSION, 0, b"abcd", generation=generation)
+    assert cache.get(FAKE_PATH, FAKE_VERSION, 0) is None
+    assert len(block_files(tmp_path)) == 1
+
+
+def test_corrupt_blocks_are_dropped(open_cache, tmp_path):
+    cache = open_cache()
+    cache.put(FAKE_PATH, FAKE_VERSION, 0, b"abcd")
+    [block_file] = block_files(tmp_path)
+    with open(block_file, "wb") as corrupt:
+        corrupt.write(b"abce")
+
+    assert cache.get(FAKE_PATH, FAKE_VERSION, 0) is None
+    assert len(cache) == 0
+    assert cache.get_size_bytes() == 0
+
+
+def test_unclean_shutdown_is_recovered(open_cache, tmp_path):
+    cache = open_cache()
+    cache.put(FAKE_PATH, FAKE_VERSION, 0, b"abcd")
+    cache.put(FAKE_PATH, FAKE_VERSION, 1, b"efgh")
+
+    # As if the client died writing a block, and after removing a block
+    # file but before the index was committed
+    [first_file, second_file] = sorted(block_files(tmp_path))
+    stray_file = os.path.join(os.path.dirname(first_file), "1000.tmp")
+    with open(stray_file, "wb") as stray:
+        stray.write(b"ijkl")
+    os.unlink(second_file)
+    cache._db.close()
+    os.close(cache._lock_fd)
+    cache._db = None
+
+    cache = open_cache()
+    assert cache.get(FAKE_PATH, FAKE_VERSION, 0) == b"abcd"
+    assert cache.get(FAKE_PATH, FAKE_VERSION, 1) is None
+    assert block_files(tmp_path) == [first_file]
+    assert cache.get_size_bytes() == 4
+
+
+def test_directory_is_locked(open_cache):
+    open_cache()
+    with pytest.raises(OSError, match="in use"):
+        open_cache()
+
+
+def test_remounted_client_reads_from_disk(tmp_path, fs_root, server, make_client):
+    (fs_root / "data").write_bytes(FAKE_FILE * 1000)
+
+    def read_mounted(path):
+        client = make_client(
+            server.server_address[1],
+            block_cache=DiskBlockCache(str(tmp_path / "cache"), SERVER)
+        )
+        fh = client.open(path, os.O_RDONLY)
+        data = client.read(path, 64 * 1024, 0, fh)
+        client.release(path, fh)
+        client.destroy("/")
+        return data, client.get_metrics().render()
+
+    data, metrics = read_mounted("/data")
+    assert data == FAKE_FILE * 1000
+    assert 'op="READ"' in metrics
+
+    data, metrics = read_mounted("/data")
+    assert data == FAKE_FILE * 1000
+    assert 'op="READ"' not in metrics
+
+    # Changed while unmounted
+    (fs_root / "data").write_bytes(b"new")
+    data, metrics = read_mounted("/data")
+    assert data == b"new"
+    assert 'op="READ"' in metrics
+
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_lost_changes_drop_blocks_of_open_files(tmp_path, fs_root, server, make_client, on_disk):
+    (fs_root / "open").write_bytes(FAKE_FILE)
+    (fs_root / "closed").write_bytes(FAKE_FILE)
+    kwargs = {"block_cache": DiskBlockCache(str(tmp_path / "cache"), SERVER)} if on_disk else {}
+    client = make_client(server.server_address[1], **kwargs)
+
+    try:
+        closed = client.open("/closed", os.O_RDONLY)
+        client.read("/closed", len(FAKE_FILE), 0, closed)
+        client.release("/closed", closed)
+        fh = client.open("/open", os.O_RDONLY)
+        assert client.read("/open", len(FAKE_FILE), 0, fh) == FAKE_FILE
+
+        # Changed while the server lost track of changes
+        (fs_root / "open").write_bytes(FAKE_FILE[::-1])
+        client._invalidate_changes(None, None)
+        assert client.read("/open", len(FAKE_FILE), 0, fh) == FAKE_FILE[::-1]
+
+        # Blocks on disk are revalidated when their file is opened
+        closed_stats = os.stat(str(fs_root / "closed"))
+        closed_version = (closed_stats.st_mtime, closed_stats.st_size)
+        assert (client._block_cache.get("/closed", closed_version, 0) is not None) == on_disk
+        client.release("/open", fh)
+    finally:
+        client.destroy("/")
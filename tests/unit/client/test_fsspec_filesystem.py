@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+fsspec = pytest.importorskip("fsspec")
+
+from httpfs.client.fsspec_filesystem import HttpFsFileSystem  # noqa: E402
+from httpfs.server.async_httpfs_server import AsyncHttpFsServer  # noqa: E402
+
+
+@pytest.fixture
+def fs(tmp_path):
+    server = AsyncHttpFsServer(0, str(tmp_path))
+    server.start()
+    fsspec.register_implementation("httpfs", HttpFsFileSystem, clobber=True)
+    fs, _ = fsspec.core.url_to_fs("httpfs://127.0.0.1:{}/".format(server.server_address[1]), skip_instance_cache=True)
+    yield fs
+    fs.clear_instance_cache()
+    server.stop()
+    server.server_close()
+
+
+def test_reading(tmp_path, fs):
+    contents = os.urandom(100 * 1024)
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "data").write_bytes(contents)
+
+    assert fs.ls("/dir", detail=False) == ["/dir/data"]
+    assert fs.info("/dir/data")["size"] == len(contents)
+    assert fs.isdir("/dir")
+    assert not fs.exists("/missing")
+
+    assert fs.cat_file("/dir/data", start=-10) == contents[-10:]
+    assert fs.cat_ranges(["/dir/data", "/dir/data"], [0, 500], [10, 1000]) == [contents[:10], contents[500:1000]]
+
+    with fs.open("/dir/data", "rb", block_size=4096) as data:
+        data.seek(5000)
+        assert data.read(10000) == contents[5000:15000]
+
+
+def test_writing(tmp_path, fs):
+    with fs.open("/written", "wb") as written:
+        written.write(b"hello ")
+        written.write(b"world")
+    assert (tmp_path / "written").read_bytes() == b"hello world"
+
+    fs.makedirs("/a/b", exist_ok=True)
+    fs.pipe("/a/b/c", b"data")
+    fs.rm("/a", recursive=True)
+    assert sorted(os.listdir(str(tmp_path))) == ["written"]
@@ -0,0 +1,37 @@
+import os
+
+from httpfs.client.handle_table import HandleTable, RemoteHandle
+
+
+def make_handle(path, flags=os.O_RDONLY):
+    return RemoteHandle(1234, path, flags, os.getuid(), os.getgid())
+
+
+def test_handles_are_unique():
+    handles = HandleTable()
+    first = handles.add(make_handle("/a"))
+    second = handles.add(make_handle("/a"))
+    assert first != second
+    assert first > 0 and second > 0
+
+    assert handles.remove(first).path == "/a"
+    assert handles.get(first) is None
+    assert handles.remove(first) is None
+    assert len(handles) == 1
+
+
+def test_rename_moves_open_files():
+    handles = HandleTable()
+    file_handle = handles.add(make_handle("/dir/file"))
+    dir_handle = handles.add(make_handle("/dir"))
+    other_handle = handles.add(make_handle("/dirt"))
+
+    handles.rename("/dir", "/new")
+    assert handles.get(file_handle).path == "/new/file"
+    assert handles.get(dir_handle).path == "/new"
+    assert handles.get(other_handle).path == "/dirt"
+
+
+def test_reopen_flags():
+    remote_handle = make_handle("/a", os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_TRUNC | os.O_APPEND)
+    assert remote_handle.get_reopen_flags() == os.O_WRONLY | os.O_APPEND
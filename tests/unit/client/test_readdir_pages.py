@@ -0,0 +1,32 @@
+import pytest
+
+from httpfs.client import HttpFsClient
+
+
+@pytest.fixture
+def client(server, make_client):
+    client = make_client(server.server_address[1])
+    yield client
+    client._pool.close()
+
+
+def test_readdir_is_paged(tmp_path, server, client, monkeypatch):
+    monkeypatch.setattr(HttpFsClient, "_READDIR_PAGE_SIZE", 10)
+    (tmp_path / "dir").mkdir()
+    expected = sorted("file{}".format(i) for i in range(25))
+    for name in expected:
+        (tmp_path / "dir" / name).write_bytes(b"x")
+
+    fh = client.opendir("/dir")
+    assert fh != 0
+
+    listing = client.readdir("/dir", fh)
+    assert not isinstance(listing, list)
+    assert sorted(listing) == sorted([".", ".."] + expected)
+    assert 'requests_total{op="READDIR_PAGE"} 3' in client.get_metrics().render()
+
+    # Entries seed the attribute cache
+    assert client.getattr("/dir/file3")["st_size"] == 1
+
+    client.releasedir("/dir", fh)
+    assert len(server.get_open_files()) == 0
@@ -0,0 +1,198 @@
+import errno
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from fuse import FuseOSError
+
+import httpfs.client.connection
+from httpfs.client.connection import HttpFsConnection
+from httpfs.common import FuseOpType
+from httpfs.server import HttpFsServer
+from httpfs.server.async_httpfs_server import AsyncHttpFsServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+FAKE_FILE = bytes(range(256)) * 1024
+
+
+class ServerProcess:
+    """
+    A server in its own process, so it can be killed like a crashed server
+    """
+
+    def __init__(self, fs_root):
+        self.fs_root = fs_root
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.process = None
+
+    def start(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_ROOT, os.environ.get("PYTHONPATH", "")]))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "httpfs.server", str(self.port), self.fs_root],
+            env=env,
+            stdout=subprocess.DEVNULL
+        )
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", self.port)).close()
+                return
+            except ConnectionRefusedError:
+                time.sleep(0.05)
+        raise RuntimeError("Server didn't start")
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+
+@pytest.fixture
+def server_process(tmp_path):
+    (tmp_path / "root").mkdir()
+    server = ServerProcess(str(tmp_path / "root"))
+    server.start()
+    yield server
+    server.kill()
+
+
+def test_idempotent_requests():
+    assert HttpFsConnection.is_idempotent(FuseOpType.OPEN, dict(flags=os.O_RDONLY))
+    assert not HttpFsConnection.is_idempotent(FuseOpType.OPEN, dict(flags=os.O_CREAT | os.O_EXCL))
+    assert not HttpFsConnection.is_idempotent(FuseOpType.CREATE, dict(mode=0o644))
+    assert not HttpFsConnection.is_idempotent(
+        FuseOpType.COMPOUND,
+        dict(ops=[dict(type=FuseOpType.CREATE), dict(type=FuseOpType.RELEASE)])
+    )
+
+
+def test_open_files_survive_server_restart(tmp_path, server_process, make_client):
+    (tmp_path / "root" / "data").write_bytes(FAKE_FILE)
+    client = make_client(server_process.port)
+    reader = client.open("/data", os.O_RDONLY)
+    writer = client.create("/out", 0o644)
+    dir_handle = client.opendir("/")
+
+    assert client.read("/data", 100, 0, reader) == FAKE_FILE[:100]
+    assert client.write("/out", b"abc", 0, writer) == 3
+
+    # The server comes back while requests are waiting for it
+    server_process.kill()
+    restart = threading.Timer(0.5, server_process.start)
+    restart.start()
+    try:
+        assert client.read("/data", 100, len(FAKE_FILE) - 100, reader) == FAKE_FILE[-100:]
+        assert client.write("/out", b"def", 3, writer) == 3
+        assert sorted(client.readdir("/", dir_handle)) == [".", "..", "data", "out"]
+
+        client.release("/data", reader)
+        client.release("/out", writer)
+        client.releasedir("/", dir_handle)
+        assert (tmp_path / "root" / "out").read_bytes() == b"abcdef"
+    finally:
+        restart.join()
+        client.destroy("/")
+
+
+def test_changed_files_are_not_reopened(tmp_path, server_process, make_client):
+    (tmp_path / "root" / "data").write_bytes(FAKE_FILE)
+    client = make_client(server_process.port)
+    try:
+        fh = client.open("/data", os.O_RDONLY)
+
+        # Replaced while the server was down
+        server_process.kill()
+        (tmp_path / "root" / "data").write_bytes(b"new")
+        server_process.start()
+
+        with pytest.raises(FuseOSError) as excinfo:
+            client.read("/data", 100, 0, fh)
+        assert excinfo.value.errno == errno.ESTALE
+        client.release("/data", fh)
+    finally:
+        client.destroy("/")
+
+
+def test_unreachable_server_fails_requests(tmp_path, server_process, make_client):
+    client = make_client(server_process.port, reconnect_timeout=0.5)
+    try:
+        server_process.kill()
+
+        start = time.monotonic()
+        with pytest.raises(FuseOSError) as excinfo:
+            client.statfs("/")
+        assert excinfo.value.errno == errno.EIO
+        assert time.monotonic() - start < 2
+    finally:
+        client.destroy("/")
+
+
+@pytest.mark.parametrize("server_cls", [HttpFsServer, AsyncHttpFsServer])
+def test_dropped_connections_keep_files_open(tmp_path, make_client, server_cls):
+    (tmp_path / "data").write_bytes(FAKE_FILE)
+    server = server_cls(0, str(tmp_path))
+    server.start()
+    client = make_client(server.server_address[1])
+    try:
+        fh = client.open("/data", os.O_RDWR)
+        server_handle = client._handles.get(fh).server_handle
+
+        # Closing every connection leaves the session's files open
+        client._pool.close()
+        time.sleep(0.1)
+        assert len(server.get_open_files()) == 1
+
+        assert client.read("/data", 4, 0, fh) == FAKE_FILE[:4]
+        assert client._handles.get(fh).server_handle == server_handle
+        client.release("/data", fh)
+        assert len(server.get_open_files()) == 0
+    finally:
+        client.destroy("/")
+        server.stop()
+        server.server_close()
+
+
+@pytest.mark.parametrize("server_cls", [HttpFsServer, AsyncHttpFsServer])
+def test_abandoned_files_are_closed(tmp_path, make_client, server_cls):
+    (tmp_path / "data").write_bytes(FAKE_FILE)
+    server = server_cls(0, str(tmp_path), session_timeout=0.2)
+    server.start()
+    client = make_client(server.server_address[1])
+    try:
+        client.open("/data", os.O_RDONLY)
+        client._pool.close()
+
+        # Closed without waiting for anything else to be opened
+        deadline = time.monotonic() + 5
+        while len(server.get_open_files()) > 0:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    finally:
+        client.destroy("/")
+        server.stop()
+        server.server_close()
+
+
+def test_timed_out_requests_are_not_resent(tmp_path, server_process, make_client, monkeypatch):
+    client = make_client(server_process.port)
+    sent = list()
+
+    def time_out(connection, request_type, **kwargs):
+        sent.append(request_type)
+        raise socket.timeout("timed out")
+
+    try:
+        with monkeypatch.context() as patch:
+            patch.setattr(httpfs.client.connection.HttpFsConnection, "request", time_out)
+            with pytest.raises(FuseOSError) as excinfo:
+                client.statfs("/")
+        assert excinfo.value.errno == errno.EIO
+        assert len(sent) == 1
+    finally:
+        client.destroy("/")
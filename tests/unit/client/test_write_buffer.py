@@ -0,0 +1,45 @@
+from httpfs.client.write_buffer import WriteBuffer
+
+FAKE_PATH = "/some/file"
+
+
+def make_buffer():
+    return WriteBuffer(FAKE_PATH, 1000, 1000)
+
+
+def test_sequential_writes_are_coalesced():
+    write_buffer = make_buffer()
+    for offset in range(0, 12, 4):
+        assert write_buffer.add(offset, b"abcd") == 4
+
+    assert len(write_buffer) == 12
+    assert write_buffer.pop_all() == [(0, bytearray(b"abcd" * 3))]
+    assert len(write_buffer) == 0
+
+
+def test_disjoint_writes_stay_separate():
+    write_buffer = make_buffer()
+    write_buffer.add(10, b"xy")
+    write_buffer.add(0, b"ab")
+
+    assert write_buffer.pop_all() == [(0, bytearray(b"ab")), (10, bytearray(b"xy"))]
+
+
+def test_newer_data_wins_on_overlap():
+    write_buffer = make_buffer()
+    write_buffer.add(0, b"aaaa")
+    write_buffer.add(8, b"cccc")
+
+    # Bridges both ranges
+    assert write_buffer.add(2, b"bbbbbbb") == 4
+
+    assert len(write_buffer) == 12
+    assert write_buffer.pop_all() == [(0, bytearray(b"aabbbbbbbccc"))]
+
+
+def test_rewrite_inside_range():
+    write_buffer = make_buffer()
+    write_buffer.add(0, b"aaaaaa")
+    assert write_buffer.add(2, b"bb") == 0
+
+    assert write_buffer.pop_all() == [(0, bytearray(b"aabbaa"))]
@@ -0,0 +1,48 @@
+import errno
+import os
+
+from httpfs.common import FuseOpFactory, FuseOpType
+from httpfs.common.open_file_table import OpenFileTable
+
+
+def handle_compound(ops):
+    handler = FuseOpFactory.get_op_handler(FuseOpType.COMPOUND)
+    open_files = OpenFileTable()
+    for sub_op in ops:
+        sub_op["open_files"] = open_files
+    return handler.handle(ops=ops), open_files
+
+
+def test_create_chmod_release(tmp_path):
+    path = str(tmp_path / "file")
+    result, open_files = handle_compound([
+        {"type": FuseOpType.CREATE, "path": path, "mode": 0o600, "uid": os.getuid(), "gid": os.getgid()},
+        {"type": FuseOpType.CHMOD, "path": path, "mode": 0o640, "uid": os.getuid(), "gid": os.getgid()},
+        {"type": FuseOpType.RELEASE}
+    ])
+
+    assert result.errno == 0
+    assert [sub_result["errno"] for sub_result in result.data] == [0, 0, 0]
+    assert os.stat(path).st_mode & 0o777 == 0o640
+
+    # RELEASE used the descriptor from CREATE
+    assert len(open_files) == 0
+
+
+def test_stops_at_first_error(tmp_path):
+    path = str(tmp_path / "missing")
+    result, _ = handle_compound([
+        {"type": FuseOpType.GET_ATTR, "path": path},
+        {"type": FuseOpType.MKDIR, "path": path, "mode": 0o755, "uid": 0, "gid": 0}
+    ])
+
+    assert result.errno == errno.ENOENT
+    assert len(result.data) == 1
+    assert not os.path.exists(path)
+
+
+def test_file_data_ops_are_rejected():
+    result, _ = handle_compound([
+        {"type": FuseOpType.READ, "file_descriptor": 0, "offset": 0, "size": 1}
+    ])
+    assert result.errno == errno.EINVAL
@@ -0,0 +1,166 @@
+import io
+import os
+
+import pytest
+
+from httpfs.client.connection import HttpFsConnection
+from httpfs.common import FuseOpType
+from httpfs.common.compression import (
+    PayloadCompressor,
+    choose_codec,
+    decompress,
+    get_codec,
+    get_codec_names
+)
+from httpfs.common.metrics import OpMetrics
+from httpfs.common.wire_protocol import FLAG_CODEC_MASK, Frame
+from httpfs.server import AsyncHttpFsServer, HttpFsServer
+
+TEXT = b"timestamp,level,message\n" + b"2024-01-01T00:00:00,INFO,all good\n" * 4096
+
+
+def _round_trip(frame):
+    stream = io.BytesIO(b"".join(bytes(b) for b in frame.to_buffers()))
+    return Frame.from_stream(io.BufferedReader(stream))
+
+
+def test_choose_codec():
+    assert choose_codec(["brotli", "zlib"]) == "zlib"
+    assert choose_codec(["brotli"]) is None
+    assert choose_codec([]) is None
+
+
+def test_compressed_frame_round_trip():
+    metrics = OpMetrics("test")
+    compressor = PayloadCompressor(get_codec("zlib"), metrics=metrics)
+
+    frame = Frame.request(FuseOpType.WRITE, 1, file_descriptor=3, offset=0, data=TEXT)
+    frame.compress(compressor)
+    assert frame.flags & FLAG_CODEC_MASK
+    assert len(frame.payload) < len(TEXT) // 5
+
+    assert _round_trip(frame).as_request()["data"] == TEXT
+    assert 'test_compression_ratio{codec="zlib"}' in metrics.render()
+
+
+def test_received_payloads_are_measured():
+    metrics = OpMetrics("test")
+    sender = PayloadCompressor(get_codec("zlib"))
+    receiver = PayloadCompressor(get_codec("zlib"), metrics=metrics)
+
+    frame = Frame.request(FuseOpType.WRITE, 1, file_descriptor=3, offset=0, data=TEXT)
+    frame.compress(sender)
+    assert _round_trip(frame).as_request(receiver)["data"] == TEXT
+    assert 'test_compression_raw_bytes_total{{codec="zlib"}} {}'.format(len(TEXT)) in metrics.render()
+
+
+@pytest.mark.parametrize("codec_name", get_codec_names())
+def test_decompression_is_capped(codec_name):
+    codec = get_codec(codec_name)
+    compressed = codec.compress(b"\0" * 1024**2)
+    assert decompress(codec.codec_id, compressed, 1024**2) == b"\0" * 1024**2
+
+    with pytest.raises(ValueError, match="expands"):
+        decompress(codec.codec_id, compressed, 1024**2 - 1)
+
+
+def test_small_payloads_are_not_compressed():
+    compressor = PayloadCompressor(get_codec("zlib"))
+    assert compressor.compress(b"a" * 100) == (b"a" * 100, 0)
+
+
+def test_incompressible_payloads_back_off():
+    compressor = PayloadCompressor(get_codec("zlib"))
+    noise = os.urandom(4096)
+
+    # Each miss doubles the number of payloads that aren't tried
+    tried = 0
+    for _ in range(16):
+        skip_before = compressor._skip
+        assert compressor.compress(noise) == (noise, 0)
+        if skip_before == 0:
+            tried += 1
+    assert tried == 4
+
+    # A hit once tried again resets the backoff
+    while compressor._skip > 0:
+        compressor.compress(noise)
+    _, codec_id = compressor.compress(TEXT)
+    assert codec_id != 0
+    assert compressor._next_skip == 1
+
+
+def test_large_incompressible_payloads_are_sampled():
+    compressor = PayloadCompressor(get_codec("zlib"))
+    noise = os.urandom(1024**2)
+    assert compressor.compress(noise) == (noise, 0)
+    assert compressor._skip == 1
+
+
+@pytest.mark.parametrize("server_class", [HttpFsServer, AsyncHttpFsServer])
+def test_connection_negotiates_compression(tmp_path, server_class):
+    server = server_class(0, str(tmp_path))
+    server.start()
+    client_metrics = OpMetrics("httpfs_client")
+    connection = HttpFsConnection(
+        ("127.0.0.1", server.server_address[1]),
+        compression=True,
+        metrics=client_metrics
+    )
+
+    try:
+        assert connection.get_compression() in ("zlib", "lz4", "zstd")
+
+        response = connection.request(
+            FuseOpType.CREATE,
+            path="/log.csv",
+            mode=0o644,
+            uid=os.getuid(),
+            gid=os.getgid()
+        )
+        handle = response["data"]
+        response = connection.request(
+            FuseOpType.WRITE,
+            file_descriptor=handle,
+            offset=0,
+            data=TEXT
+        )
+        assert response["errno"] == 0
+        assert (tmp_path / "log.csv").read_bytes() == TEXT
+        connection.request(FuseOpType.RELEASE, file_descriptor=handle)
+
+        response = connection.request(
+            FuseOpType.OPEN,
+            path="/log.csv",
+            flags=os.O_RDONLY,
+            uid=os.getuid(),
+            gid=os.getgid()
+        )
+        handle = response["data"]
+        response = connection.request(
+            FuseOpType.READ,
+            file_descriptor=handle,
+            offset=0,
+            size=len(TEXT)
+        )
+        assert response["data"] == TEXT
+        connection.request(FuseOpType.RELEASE, file_descriptor=handle)
+
+        assert "httpfs_client_compression_ratio" in client_metrics.render()
+        assert "httpfs_server_compression_ratio" in server.get_metrics().render()
+    finally:
+        connection.close()
+        server.stop()
+        server.server_close()
+
+
+def test_compression_is_off_by_default(tmp_path):
+    server = HttpFsServer(0, str(tmp_path))
+    server.start()
+    connection = HttpFsConnection(("127.0.0.1", server.server_address[1]))
+    try:
+        assert connection.get_compression() is None
+    finally:
+        connection.close()
+        server.stop()
+        server.server_close()
@@ -0,0 +1,75 @@
+import os
+
+from httpfs.common import FuseOpFactory, FuseOpType
+from httpfs.common.dir_fd_cache import DirFdCache
+
+
+def handle(op_type, **kwargs):
+    return FuseOpFactory.get_op_handler(op_type).handle(**kwargs)
+
+
+def test_open_parent(tmp_path):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "file").write_bytes(b"abc")
+    dir_fds = DirFdCache()
+
+    with dir_fds.open_parent(str(tmp_path / "dir" / "file")) as (dir_fd, name):
+        assert name == "file"
+        assert os.stat(name, dir_fd=dir_fd).st_size == 3
+
+    # The directory is looked up once
+    with dir_fds.open_parent(str(tmp_path / "dir" / "other")) as (second_fd, _):
+        assert second_fd == dir_fd
+    assert len(dir_fds) == 1
+
+    with dir_fds.open_parent("/") as (dir_fd, name):
+        assert dir_fd is None and name == "/"
+
+    dir_fds.close()
+    assert len(dir_fds) == 0
+
+
+def test_eviction_waits_for_users(tmp_path):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+    dir_fds = DirFdCache(max_size=1)
+
+    with dir_fds.open_parent(str(tmp_path / "a" / "file")) as (dir_fd, _):
+        with dir_fds.open_parent(str(tmp_path / "b" / "file")):
+            pass
+
+        # Evicted but still in use, so not closed yet
+        assert len(dir_fds) == 1
+        assert os.stat(".", dir_fd=dir_fd)
+
+    dir_fds.close()
+
+
+def test_path_ops_after_rename(tmp_path):
+    (tmp_path / "old").mkdir()
+    (tmp_path / "old" / "file").write_bytes(b"abcdef")
+    dir_fds = DirFdCache()
+
+    result = handle(FuseOpType.GET_ATTR, path=str(tmp_path / "old" / "file"), dir_fds=dir_fds)
+    assert result.data["st_size"] == 6
+
+    result = handle(
+        FuseOpType.RENAME,
+        old_path=str(tmp_path / "old"),
+        new_path=str(tmp_path / "new"),
+        uid=0,
+        gid=0,
+        dir_fds=dir_fds
+    )
+    assert result.errno == 0
+    (tmp_path / "old").mkdir()
+
+    # The old path must not resolve through the moved directory
+    result = handle(FuseOpType.GET_ATTR, path=str(tmp_path / "old" / "file"), dir_fds=dir_fds)
+    assert result.errno != 0
+
+    result = handle(FuseOpType.TRUNCATE, path=str(tmp_path / "new" / "file"), length=2, dir_fds=dir_fds)
+    assert result.errno == 0
+    assert (tmp_path / "new" / "file").read_bytes() == b"ab"
+
+    dir_fds.close()
@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+from httpfs.common import FuseOpFactory, FuseOpType
+from httpfs.common.dir_listing_cache import DirListingCache
+from httpfs.common.open_file_table import OpenFileTable
+
+
+@pytest.fixture(autouse=True)
+def no_racy_window(monkeypatch):
+    monkeypatch.setattr(DirListingCache, "_RACY_WINDOW_NS", 0)
+
+
+def readdir(path, dir_listings):
+    handler = FuseOpFactory.get_op_handler(FuseOpType.READDIR)
+    return handler.handle(path=str(path), uid=0, gid=0, dir_listings=dir_listings)
+
+
+def test_repeated_listings_are_cached(tmp_path):
+    (tmp_path / "a").write_bytes(b"")
+    dir_listings = DirListingCache()
+
+    first = readdir(tmp_path, dir_listings)
+    second = readdir(tmp_path, dir_listings)
+    assert sorted(second.data) == [".", "..", "a"]
+    assert second.data is first.data
+
+    stats = dir_listings.get_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["hit_ratio"] == 0.5
+    assert stats["bytes"] > 0
+    assert "httpfs_server_dir_listing_cache_hits_total 1" in dir_listings.render()
+
+
+def test_changed_directories_are_relisted(tmp_path):
+    dir_listings = DirListingCache()
+
+    # Backdated so the changes below are sure to move the mtime
+    os.utime(str(tmp_path), ns=(0, 0))
+    readdir(tmp_path, dir_listings)
+
+    (tmp_path / "new").write_bytes(b"")
+    assert sorted(readdir(tmp_path, dir_listings).data) == [".", "..", "new"]
+
+    os.utime(str(tmp_path), ns=(0, 0))
+    readdir(tmp_path, dir_listings)
+    os.rename(str(tmp_path / "new"), str(tmp_path / "renamed"))
+    assert sorted(readdir(tmp_path, dir_listings).data) == [".", "..", "renamed"]
+    assert dir_listings.get_stats()["hits"] == 0
+
+
+def test_recently_changed_directories_are_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(DirListingCache, "_RACY_WINDOW_NS", 60 * 1000**3)
+    dir_listings = DirListingCache()
+    readdir(tmp_path, dir_listings)
+    assert len(dir_listings) == 0
+
+
+def test_listings_are_evicted_by_size(tmp_path):
+    for name in ("a", "b", "c"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / ("x" * 100)).write_bytes(b"")
+
+    dir_listings = DirListingCache(max_bytes=1000)
+    for name in ("a", "b", "c"):
+        readdir(tmp_path / name, dir_listings)
+
+    assert 0 < len(dir_listings) < 3
+    assert dir_listings.get_stats()["bytes"] <= 1000
+    assert readdir(tmp_path / "c", dir_listings).data is not None
+    assert dir_listings.get_stats()["hits"] == 1
+
+
+def test_readdir_plus_uses_cached_names(tmp_path):
+    (tmp_path / "a").write_bytes(b"")
+    dir_listings = DirListingCache()
+    readdir(tmp_path, dir_listings)
+
+    # A file's size changes without changing its directory
+    (tmp_path / "a").write_bytes(b"abc")
+    handler = FuseOpFactory.get_op_handler(FuseOpType.READDIR_PLUS)
+    result = handler.handle(path=str(tmp_path), uid=0, gid=0, dir_listings=dir_listings)
+    attrs = dict((name, attrs) for name, attrs in result.data)
+    assert sorted(attrs) == [".", "..", "a"]
+    assert attrs["a"]["st_size"] == 3
+    assert dir_listings.get_stats()["hits"] == 1
+
+
+def test_paged_listings_are_cached(tmp_path):
+    for name in ("a", "b", "c"):
+        (tmp_path / name).write_bytes(b"")
+    dir_listings = DirListingCache()
+    open_files = OpenFileTable()
+
+    def list_pages():
+        fd = FuseOpFactory.get_op_handler(FuseOpType.OPENDIR).handle(
+            path=str(tmp_path),
+            uid=0,
+            gid=0,
+            open_files=open_files,
+            dir_listings=dir_listings
+        ).data
+        names = list()
+        page = {"offset": 0, "eof": False}
+        while not page["eof"]:
+            page = FuseOpFactory.get_op_handler(FuseOpType.READDIR_PAGE).handle(
+                file_descriptor=fd,
+                offset=page["offset"],
+                count=2,
+                open_files=open_files
+            ).data
+            names.extend(name for name, _ in page["entries"])
+        open_files.close(fd)
+        return sorted(names)
+
+    assert list_pages() == ["a", "b", "c"]
+    assert sorted(readdir(tmp_path, dir_listings).data) == [".", "..", "a", "b", "c"]
+    assert list_pages() == ["a", "b", "c"]
+    assert dir_listings.get_stats()["hits"] == 2
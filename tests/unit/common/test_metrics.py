@@ -0,0 +1,37 @@
+import errno
+import urllib.request
+
+from httpfs.common import FuseOpType
+from httpfs.common.metrics import MetricsServer, OpMetrics
+
+
+def test_render():
+    metrics = OpMetrics("test")
+    metrics.record(FuseOpType.READ, 0, 0.0003, bytes_out=4096)
+    metrics.record(FuseOpType.READ, 0, 0.002, bytes_out=100)
+    metrics.record(FuseOpType.OPEN, errno.ENOENT, 0.00005)
+
+    lines = metrics.render().splitlines()
+    assert 'test_requests_total{op="READ"} 2' in lines
+    assert 'test_errors_total{op="OPEN",errno="ENOENT"} 1' in lines
+    assert 'test_bytes_sent_total{op="READ"} 4196' in lines
+    assert 'test_request_duration_seconds_bucket{op="READ",le="0.0001"} 0' in lines
+    assert 'test_request_duration_seconds_bucket{op="READ",le="0.0005"} 1' in lines
+    assert 'test_request_duration_seconds_bucket{op="READ",le="+Inf"} 2' in lines
+    assert 'test_request_duration_seconds_count{op="OPEN"} 1' in lines
+
+
+def test_metrics_server():
+    metrics = OpMetrics("test")
+    metrics.record(FuseOpType.GET_ATTR, 0, 0.001)
+
+    server = MetricsServer(0, [metrics])
+    server.start()
+    try:
+        url = "http://127.0.0.1:{}/metrics".format(server.get_port())
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode("utf-8")
+    finally:
+        server.stop()
+
+    assert 'test_requests_total{op="GET_ATTR"} 1' in body
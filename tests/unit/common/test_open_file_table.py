@@ -0,0 +1,186 @@
+import errno
+import os
+import time
+
+import pytest
+
+from httpfs.common import FuseOpFactory, FuseOpType
+from httpfs.common.open_file_table import HandleLimitError, OpenFileTable
+
+
+def handle(op_type, **kwargs):
+    return FuseOpFactory.get_op_handler(op_type).handle(**kwargs)
+
+
+def test_flags_to_mode():
+    assert OpenFileTable.flags_to_mode(os.O_RDONLY) == os.R_OK
+    assert OpenFileTable.flags_to_mode(os.O_WRONLY | os.O_APPEND) == os.W_OK
+    assert OpenFileTable.flags_to_mode(os.O_RDWR) == os.R_OK | os.W_OK
+
+
+def test_access_is_granted_at_open(tmp_path):
+    path = str(tmp_path / "file")
+    open_files = OpenFileTable()
+
+    fd = handle(
+        FuseOpType.CREATE,
+        path=path,
+        mode=0o644,
+        uid=os.getuid(),
+        gid=os.getgid(),
+        open_files=open_files
+    ).data
+    assert open_files.get_fd(fd, os.W_OK) >= 0
+
+    result = handle(FuseOpType.WRITE, file_descriptor=fd, data=b"abcdef", offset=2, open_files=open_files)
+    assert result.data == 6
+
+    # Create handles are write-only
+    result = handle(FuseOpType.READ, file_descriptor=fd, size=4, offset=0, open_files=open_files)
+    assert result.errno == errno.EACCES
+
+    handle(FuseOpType.RELEASE, file_descriptor=fd, open_files=open_files)
+    assert len(open_files) == 0
+
+
+def test_positional_reads(tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(b"0123456789")
+    open_files = OpenFileTable()
+
+    fd = handle(
+        FuseOpType.OPEN,
+        path=str(path),
+        flags=os.O_RDONLY,
+        uid=os.getuid(),
+        gid=os.getgid(),
+        open_files=open_files
+    ).data
+
+    read = FuseOpFactory.get_op_handler(FuseOpType.READ)
+    assert read.handle(file_descriptor=fd, size=3, offset=7, open_files=open_files).data == b"789"
+    assert read.handle(file_descriptor=fd, size=2, offset=0, open_files=open_files).data == b"01"
+
+    result = handle(FuseOpType.WRITE, file_descriptor=fd, data=b"x", offset=0, open_files=open_files)
+    assert result.errno == errno.EACCES
+
+    handle(FuseOpType.RELEASE, file_descriptor=fd, open_files=open_files)
+
+
+def test_unknown_handles(tmp_path):
+    open_files = OpenFileTable()
+    fd = os.open(str(tmp_path), os.O_RDONLY)
+    try:
+        # Raw descriptors aren't handles
+        result = handle(FuseOpType.FSYNC, file_descriptor=fd, datasync=False, open_files=open_files)
+        assert result.errno == errno.EBADF
+
+        result = handle(FuseOpType.RELEASE, file_descriptor=fd, open_files=open_files)
+        assert result.errno == errno.EBADF
+    finally:
+        os.close(fd)
+
+
+def test_worker_handles(tmp_path):
+    open_files = OpenFileTable(worker_id=1, worker_count=4)
+
+    for _ in range(8):
+        handle_ = open_files.add(os.open(str(tmp_path), os.O_RDONLY), os.R_OK)
+        assert open_files.get_owner(handle_) == 1
+    open_files.close_all()
+
+
+def test_handle_limit(tmp_path):
+    open_files = OpenFileTable(max_per_client=2)
+    client = ("127.0.0.1", 1000)
+
+    def open_dir(client):
+        return open_files.add(os.open(str(tmp_path), os.O_RDONLY), os.R_OK, client=client)
+
+    open_dir(client)
+    open_dir(client)
+    with pytest.raises(HandleLimitError):
+        open_dir(client)
+    open_dir(("127.0.0.1", 2000))
+    assert len(open_files) == 3
+    open_files.close_all()
+
+
+def test_connection_handles_outlive_the_connection(tmp_path):
+    open_files = OpenFileTable(session_timeout=100)
+    connection = ("127.0.0.1", 1000)
+    handle_ = open_files.add(os.open(str(tmp_path), os.O_RDONLY), os.R_OK, client=connection)
+
+    # Pooled clients keep using the handle over their other connections
+    open_files.detach(connection)
+    assert open_files.reap_idle(now=time.monotonic() + 50) == 0
+    assert open_files.get_fd(handle_) >= 0
+
+    assert open_files.reap_idle(now=time.monotonic() + 200) == 1
+    assert len(open_files) == 0
+
+
+def test_handles_in_use_are_closed_after_use(tmp_path):
+    open_files = OpenFileTable()
+    handle_ = open_files.add(os.open(str(tmp_path), os.O_RDONLY), os.R_OK)
+
+    with open_files.use(handle_, os.R_OK) as fd:
+        handle(FuseOpType.RELEASE, file_descriptor=handle_, open_files=open_files)
+        assert len(open_files) == 0
+        os.fstat(fd)
+
+    with pytest.raises(OSError) as excinfo:
+        os.fstat(fd)
+    assert excinfo.value.errno == errno.EBADF
+
+
+def test_idle_handles_are_reaped(tmp_path):
+    open_files = OpenFileTable(idle_timeout=100)
+    handle_ = open_files.add(os.open(str(tmp_path), os.O_RDONLY), os.R_OK)
+
+    assert open_files.reap_idle(now=time.monotonic() + 50) == 0
+    assert open_files.reap_idle(now=time.monotonic() + 200) == 1
+    with pytest.raises(OSError) as excinfo:
+        open_files.get_fd(handle_)
+    assert excinfo.value.errno == errno.EBADF
+
+
+def test_session_handles_outlive_connections(tmp_path):
+    open_files = OpenFileTable(session_timeout=100)
+    session = "0123456789abcdef"
+
+    def open_dir():
+        return open_files.add(os.open(str(tmp_path), os.O_RDONLY), os.R_OK, client=session)
+
+    # Two connections join the session, and both drop
+    open_files.attach(session)
+    open_files.attach(session)
+    first = open_dir()
+    open_files.detach(session)
+    open_files.detach(session)
+    assert open_files.reap_idle(now=time.monotonic() + 50) == 0
+
+    # The client reconnects in time
+    open_files.attach(session)
+    assert open_files.reap_idle(now=time.monotonic() + 200) == 0
+    assert open_files.get_fd(first) >= 0
+    second = open_dir()
+
+    # ...and then doesn't
+    open_files.detach(session)
+    assert open_files.reap_idle(now=time.monotonic() + 200) == 2
+    for handle_ in (first, second):
+        with pytest.raises(OSError):
+            open_files.get_fd(handle_)
+
+
+def test_idle_sessions_are_left_for_the_idle_timeout(tmp_path):
+    open_files = OpenFileTable(session_timeout=100)
+    session = "0123456789abcdef"
+    open_files.attach(session)
+    handle_ = open_files.add(os.open(str(tmp_path), os.O_RDONLY), os.R_OK, client=session)
+
+    open_files.detach(session, expire=False)
+    assert open_files.reap_idle(now=time.monotonic() + 200) == 0
+    assert open_files.get_fd(handle_) >= 0
+    open_files.close_all()
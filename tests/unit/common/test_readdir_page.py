@@ -0,0 +1,77 @@
+import errno
+import os
+
+from httpfs.common import FuseOpFactory, FuseOpType
+from httpfs.common.open_file_table import OpenFileTable
+
+
+def handle(op_type, **kwargs):
+    return FuseOpFactory.get_op_handler(op_type).handle(**kwargs)
+
+
+def read_pages(handle_id, open_files, count):
+    names = list()
+    offset = 0
+    while True:
+        result = handle(
+            FuseOpType.READDIR_PAGE,
+            file_descriptor=handle_id,
+            offset=offset,
+            count=count,
+            open_files=open_files
+        )
+        assert result.errno == 0
+        assert len(result.data["entries"]) <= count
+        names += [name for name, _ in result.data["entries"]]
+        if result.data["eof"]:
+            return names
+        offset = result.data["offset"]
+
+
+def test_directory_is_listed_in_pages(tmp_path):
+    expected = sorted("file{}".format(i) for i in range(25))
+    for name in expected:
+        (tmp_path / name).write_bytes(b"x")
+
+    open_files = OpenFileTable()
+    result = handle(FuseOpType.OPENDIR, path=str(tmp_path), uid=0, gid=0, open_files=open_files)
+    assert result.errno == 0
+    handle_id = result.data
+
+    assert sorted(read_pages(handle_id, open_files, count=10)) == expected
+
+    # Starting over at offset 0 rewinds the listing
+    assert sorted(read_pages(handle_id, open_files, count=7)) == expected
+
+    result = handle(FuseOpType.READDIR_PAGE, file_descriptor=handle_id, count=1, open_files=open_files)
+    _, attrs = result.data["entries"][0]
+    assert attrs["st_size"] == 1
+
+    assert handle(FuseOpType.RELEASE, file_descriptor=handle_id, open_files=open_files).errno == 0
+    assert len(open_files) == 0
+
+    result = handle(FuseOpType.READDIR_PAGE, file_descriptor=handle_id, open_files=open_files)
+    assert result.errno == errno.EBADF
+
+
+def test_only_directory_handles_can_be_paged(tmp_path):
+    open_files = OpenFileTable()
+    (tmp_path / "file").write_bytes(b"")
+    result = handle(
+        FuseOpType.OPEN,
+        path=str(tmp_path / "file"),
+        flags=os.O_RDONLY,
+        uid=0,
+        gid=0,
+        open_files=open_files
+    )
+
+    result = handle(FuseOpType.READDIR_PAGE, file_descriptor=result.data, open_files=open_files)
+    assert result.errno == errno.EBADF
+    open_files.close_all()
+
+
+def test_opendir_of_a_file_fails(tmp_path):
+    (tmp_path / "file").write_bytes(b"")
+    result = handle(FuseOpType.OPENDIR, path=str(tmp_path / "file"), uid=0, gid=0, open_files=OpenFileTable())
+    assert result.errno == errno.ENOTDIR
@@ -0,0 +1,21 @@
+import os
+
+from httpfs.common import FuseOpFactory, FuseOpType
+from httpfs.common._fuse_ops.ops import GetAttrOp
+
+
+def test_readdir_plus_returns_attrs(tmp_path):
+    (tmp_path / "file").write_bytes(b"12345")
+    (tmp_path / "subdir").mkdir()
+
+    handler = FuseOpFactory.get_op_handler(FuseOpType.READDIR_PLUS)
+    result = handler.handle(path=str(tmp_path), uid=0, gid=0)
+
+    assert result.errno == 0
+    listing = dict(result.data)
+    assert sorted(listing.keys()) == [".", "..", "file", "subdir"]
+    assert listing["file"]["st_size"] == 5
+    assert sorted(listing["file"].keys()) == sorted(GetAttrOp.GETATTR_KEYS)
+    assert listing["subdir"] == GetAttrOp.stat_to_dict(
+        os.lstat(str(tmp_path / "subdir"))
+    )
@@ -0,0 +1,140 @@
+import io
+import os
+import socket
+
+import pytest
+
+from httpfs.common import FuseOpFactory, FuseOpType
+from httpfs.common._fuse_ops import FuseOpResult
+from httpfs.common.open_file_table import OpenFileTable
+from httpfs.common.wire_protocol import (
+    FileRange,
+    Frame,
+    FLAG_RAW_DATA,
+    HEADER_SIZE,
+    MAX_PAYLOAD_SIZE,
+    send_frame,
+    unpack_header
+)
+
+FAKE_DATA = b"\x00\x01 some file bytes \xff" * 64
+FAKE_REQ_ID = 42
+
+
+def _round_trip(frame):
+    stream = io.BytesIO(b"".join(bytes(b) for b in frame.to_buffers()))
+    return Frame.from_stream(io.BufferedReader(stream))
+
+
+def test_write_request_carries_raw_payload():
+    frame = Frame.request(
+        FuseOpType.WRITE,
+        FAKE_REQ_ID,
+        file_descriptor=3,
+        offset=1024,
+        data=FAKE_DATA
+    )
+    assert frame.flags & FLAG_RAW_DATA
+    assert frame.payload is FAKE_DATA
+    assert b"data" not in frame.meta
+
+    request = _round_trip(frame).as_request()
+    assert request["type"] == FuseOpType.WRITE
+    assert request["file_descriptor"] == 3
+    assert request["offset"] == 1024
+    assert request["data"] == FAKE_DATA
+
+
+def test_read_response_carries_raw_payload():
+    frame = Frame.response(
+        FuseOpType.READ,
+        FAKE_REQ_ID,
+        FuseOpResult(data=FAKE_DATA)
+    )
+    parsed = _round_trip(frame)
+    assert parsed.request_id == FAKE_REQ_ID
+    assert parsed.as_response() == {"errno": 0, "data": FAKE_DATA}
+
+
+def test_json_response():
+    frame = Frame.response(
+        FuseOpType.GET_ATTR,
+        FAKE_REQ_ID,
+        FuseOpResult(errno=2, data={"st_size": 10})
+    )
+    assert _round_trip(frame).as_response() == {
+        "errno": 2,
+        "data": {"st_size": 10}
+    }
+
+
+def test_truncated_stream():
+    frame = Frame.request(FuseOpType.WRITE, FAKE_REQ_ID, data=FAKE_DATA)
+    as_bytes = b"".join(bytes(b) for b in frame.to_buffers())
+    stream = io.BufferedReader(io.BytesIO(as_bytes[:-1]))
+    assert Frame.from_stream(stream) is None
+
+
+def test_oversized_payload_is_rejected():
+    frame = Frame.request(FuseOpType.WRITE, FAKE_REQ_ID, data=FAKE_DATA)
+    frame.payload = FileRange(-1, 0, MAX_PAYLOAD_SIZE + 1)
+    header = frame.to_buffers()[0]
+    assert len(header) == HEADER_SIZE
+    with pytest.raises(ValueError, match="too large"):
+        unpack_header(header)
+
+
+def test_send_frame():
+    sender, receiver = socket.socketpair()
+    try:
+        frame = Frame.request(FuseOpType.WRITE, FAKE_REQ_ID, data=FAKE_DATA)
+        send_frame(sender, frame)
+        parsed = Frame.from_stream(receiver.makefile("rb"))
+        assert parsed.as_request()["data"] == FAKE_DATA
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_send_file_range(tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(FAKE_DATA)
+
+    sender, receiver = socket.socketpair()
+    file_range = FileRange(os.open(str(path), os.O_RDONLY), 10, 100)
+    try:
+        result = FuseOpResult(data=file_range)
+        send_frame(sender, Frame.response(FuseOpType.READ, FAKE_REQ_ID, result))
+        parsed = Frame.from_stream(receiver.makefile("rb"))
+        assert parsed.as_response()["data"] == FAKE_DATA[10:110]
+
+        # Sending the range closes it
+        assert file_range.fd == -1
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_file_range_outlives_release(tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(FAKE_DATA * 1024)
+    open_files = OpenFileTable()
+    handle = open_files.add(os.open(str(path), os.O_RDONLY), os.R_OK)
+
+    read = FuseOpFactory.get_op_handler(FuseOpType.READ)
+    result = read.handle(file_descriptor=handle, offset=10, size=64 * 1024, zero_copy=True, open_files=open_files)
+    assert isinstance(result.data, FileRange)
+    open_files.close(handle)
+
+    sender, receiver = socket.socketpair()
+    try:
+        send_frame(sender, Frame.response(FuseOpType.READ, FAKE_REQ_ID, result))
+        parsed = Frame.from_stream(receiver.makefile("rb"))
+        assert parsed.as_response()["data"] == (FAKE_DATA * 1024)[10:10 + 64 * 1024]
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_legacy_json_result_is_base64():
+    assert FuseOpResult(data=b"abc").to_json() == '{"errno":0,"data":"YWJj"}'
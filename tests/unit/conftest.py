@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from httpfs.server import HttpFsServer
+
+
+@pytest.fixture
+def fs_root(tmp_path):
+    """
+    The directory the server fixture serves. Test modules that keep other
+    files in tmp_path override it
+    """
+    return tmp_path
+
+
+@pytest.fixture
+def server(fs_root):
+    server = HttpFsServer(0, str(fs_root))
+    server.start()
+    yield server
+    server.stop()
+    server.server_close()
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    """
+    :return: make_client(port, **kwargs), which connects an HttpFsClient
+        acting as the user running the tests to a local server. Readahead is
+        off unless asked for
+    """
+    # fusepy needs libfuse, which tests that don't make clients can do without
+    import httpfs.client.httpfs_client
+    from httpfs.client import HttpFsClient
+
+    monkeypatch.setattr(
+        httpfs.client.httpfs_client,
+        "fuse_get_context",
+        lambda: (os.getuid(), os.getgid(), 0)
+    )
+
+    def _make_client(port, **kwargs):
+        kwargs.setdefault("readahead", 0)
+        return HttpFsClient("127.0.0.1", port, **kwargs)
+
+    return _make_client
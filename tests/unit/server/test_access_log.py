@@ -0,0 +1,69 @@
+import logging
+
+import pytest
+from pytcp_message.message import TcpRequest
+
+from httpfs.common import FuseOpFactory, FuseOpType
+from httpfs.common.wire_protocol import Frame
+from httpfs.server import AccessLog, HttpFsServer
+
+FAKE_ADDR = ("127.0.0.1", 12345)
+
+
+def run_getattr(server):
+    request = TcpRequest(FAKE_ADDR)
+    request.frame = Frame.request(FuseOpType.GET_ATTR, 1, path="/", api_key=None)
+    return server.run_request_handlers(request)
+
+
+def test_no_logging_stages_by_default(tmp_path):
+    server = HttpFsServer(0, str(tmp_path))
+    try:
+        assert len(server.get_request_handlers()) == 3
+    finally:
+        server.server_close()
+
+
+def test_sampled_access_log(tmp_path, caplog):
+    server = HttpFsServer(0, str(tmp_path), access_log=AccessLog(sample_every=3))
+    try:
+        with caplog.at_level(logging.INFO, logger="httpfs.access"):
+            for _ in range(6):
+                assert run_getattr(server).frame.errno == 0
+    finally:
+        server.server_close()
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert len(messages) == 4
+    assert messages[0] == "<-- 127.0.0.1:12345 GET_ATTR"
+    assert messages[1].startswith("--> 127.0.0.1:12345 GET_ATTR errno=0 ")
+
+
+def test_access_log_is_level_gated(tmp_path, caplog):
+    server = HttpFsServer(0, str(tmp_path), access_log=AccessLog())
+    try:
+        with caplog.at_level(logging.WARNING, logger="httpfs.access"):
+            run_getattr(server)
+    finally:
+        server.server_close()
+
+    assert caplog.records == []
+
+
+def test_failed_ops_are_counted(tmp_path, monkeypatch):
+    handler = FuseOpFactory.get_op_handler(FuseOpType.GET_ATTR)
+
+    def fail(**kwargs):
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr(handler, "handle", fail)
+    server = HttpFsServer(0, str(tmp_path))
+    try:
+        with pytest.raises(RuntimeError):
+            run_getattr(server)
+    finally:
+        server.server_close()
+
+    lines = server.get_metrics().render().splitlines()
+    assert 'httpfs_server_requests_total{op="GET_ATTR"} 1' in lines
+    assert 'httpfs_server_errors_total{op="GET_ATTR",errno="EIO"} 1' in lines
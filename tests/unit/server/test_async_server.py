@@ -0,0 +1,92 @@
+import os
+import socket
+import time
+
+import pytest
+import ujson
+from pytcp_message.message import TcpMessage
+
+from httpfs.common import FuseOpType
+from httpfs.common.wire_protocol import Frame, send_frame
+from httpfs.server import AsyncHttpFsServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / "file").write_bytes(b"0123456789")
+    server = AsyncHttpFsServer(0, str(tmp_path), threads=4)
+    server.start()
+    yield server
+    server.stop()
+
+
+def connect(server):
+    sock = socket.create_connection(("127.0.0.1", server.server_address[1]), timeout=5)
+    return sock, sock.makefile("rb")
+
+
+def test_pipelined_frames(server):
+    sock, rfile = connect(server)
+    for request_id in range(1, 9):
+        send_frame(
+            sock,
+            Frame.request(
+                FuseOpType.GET_ATTR,
+                request_id,
+                path="/file",
+                uid=0,
+                gid=0,
+                api_key=None
+            )
+        )
+
+    responses = [Frame.from_stream(rfile) for _ in range(8)]
+    assert sorted(r.request_id for r in responses) == list(range(1, 9))
+    assert all(r.as_response()["data"]["st_size"] == 10 for r in responses)
+    sock.close()
+
+
+def test_json_requests(server):
+    sock, rfile = connect(server)
+    wfile = sock.makefile("wb")
+    request = {"type": FuseOpType.GET_ATTR, "path": "/file", "uid": 0, "gid": 0}
+    TcpMessage(ujson.dumps(request).encode("utf-8")).to_stream(wfile)
+
+    response = ujson.loads(TcpMessage.from_stream(rfile).get_content())
+    assert response["errno"] == 0
+    assert response["data"]["st_size"] == 10
+    sock.close()
+
+
+def test_files_outlive_their_connection(server):
+    sock, rfile = connect(server)
+    send_frame(
+        sock,
+        Frame.request(
+            FuseOpType.OPEN,
+            1,
+            path="/file",
+            flags=os.O_RDONLY,
+            uid=os.getuid(),
+            gid=os.getgid(),
+            api_key=None
+        )
+    )
+    handle = Frame.from_stream(rfile).as_response()["data"]
+    rfile.close()
+    sock.close()
+
+    # Pooled clients use the file over their other connections
+    sock, rfile = connect(server)
+    send_frame(sock, Frame.request(FuseOpType.READ, 2, file_descriptor=handle, size=4, offset=0))
+    response = Frame.from_stream(rfile)
+    assert response.errno == 0
+    assert response.get_payload() == b"0123"
+    rfile.close()
+    sock.close()
+
+    # ...until none of them has for the session timeout
+    deadline = time.monotonic() + 5
+    while server.get_open_files().reap_idle(now=time.monotonic() + 1000) == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(server.get_open_files()) == 0
@@ -0,0 +1,172 @@
+import os
+import queue
+import threading
+import time
+
+import pytest
+import ujson
+
+from httpfs.client.attr_cache import AttrCache
+from httpfs.client.connection import HttpFsConnection
+from httpfs.common import FuseOpType
+from httpfs.server import AsyncHttpFsServer, HttpFsServer
+from httpfs.server.change_feed import ChangeFeed
+
+
+@pytest.fixture(params=[HttpFsServer, AsyncHttpFsServer])
+def server(tmp_path, request):
+    server = request.param(0, str(tmp_path))
+    server.start()
+    yield server
+    server.stop()
+    server.server_close()
+
+
+def receive_invalidation(connection):
+    while True:
+        frame = connection.receive()
+        assert frame is not None
+        if frame.op == FuseOpType.INVALIDATE:
+            return ujson.loads(frame.meta)
+        assert frame.errno == 0
+
+
+def test_changes_are_pushed(tmp_path, server):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "file").write_bytes(b"old")
+    (tmp_path / "other").write_bytes(b"")
+
+    connection = HttpFsConnection(("127.0.0.1", server.server_address[1]), timeout=5)
+    try:
+        connection.send(FuseOpType.SUBSCRIBE, paths=["/dir/file", "/dir"])
+        assert connection.receive().errno == 0
+
+        # Unsubscribed paths stay quiet
+        (tmp_path / "other").write_bytes(b"changed")
+
+        (tmp_path / "dir" / "file").write_bytes(b"new")
+        invalidation = receive_invalidation(connection)
+        assert invalidation["paths"] == ["/dir/file"]
+        assert not invalidation["all"]
+
+        os.rename(str(tmp_path / "dir"), str(tmp_path / "moved"))
+        invalidation = receive_invalidation(connection)
+        while "/dir" not in invalidation["trees"]:
+            invalidation = receive_invalidation(connection)
+    finally:
+        connection.close()
+
+
+def test_client_drops_changed_attrs(tmp_path, server, make_client):
+    (tmp_path / "file").write_bytes(b"old")
+    client = make_client(
+        server.server_address[1],
+        attr_cache=AttrCache(ttl=3600),
+        change_feed=True
+    )
+
+    try:
+        # Wait for the subscription, and for the path to be watched
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            client.getattr("/file")
+            feed = server.get_change_feed()
+            if feed is not None and feed._dirs:
+                break
+            time.sleep(0.02)
+
+        (tmp_path / "file").write_bytes(b"changed")
+        deadline = time.monotonic() + 5
+        while client.getattr("/file")["st_size"] != 7:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        client.destroy("/")
+
+
+def test_client_gives_up_without_a_feed(tmp_path, make_client):
+    (tmp_path / "file").write_bytes(b"")
+    server = HttpFsServer(0, str(tmp_path), change_feed=False)
+    server.start()
+    client = make_client(server.server_address[1], change_feed=True)
+
+    try:
+        client.getattr("/file")
+        listener = client._change_listener
+        listener._thread.join(5)
+        assert not listener._thread.is_alive()
+
+        # Paths cached from now on aren't queued for nobody to send
+        client.getattr("/")
+        assert listener._pending == []
+    finally:
+        client.destroy("/")
+        server.stop()
+        server.server_close()
+
+
+def test_slow_subscribers_hold_up_only_themselves(tmp_path):
+    (tmp_path / "file").write_bytes(b"")
+    feed = ChangeFeed(str(tmp_path), max_queued=2)
+    stalled = threading.Event()
+    pushed = queue.Queue()
+
+    def stuck_push(frame):
+        stalled.wait()
+
+    try:
+        feed.watch("stuck", stuck_push, [str(tmp_path / "file")])
+        feed.watch("quick", pushed.put, [str(tmp_path / "file")])
+
+        for i in range(4):
+            (tmp_path / "file").write_bytes(b"x" * i)
+            frame = pushed.get(timeout=5)
+            assert ujson.loads(frame.meta)["paths"] == ["/file"]
+
+        # Past the limit, the stuck subscriber's backlog collapses
+        stuck = feed._subscriptions["stuck"]
+        assert len(stuck._queue) <= 2
+    finally:
+        stalled.set()
+        feed.close()
+
+
+def test_root_is_watched_once(tmp_path):
+    (tmp_path / "file").write_bytes(b"")
+    feed = ChangeFeed(str(tmp_path))
+    try:
+        # The root resolves to "<root>/", its entries' parent to "<root>"
+        feed.watch("client", lambda frame: None, [os.path.join(str(tmp_path), ""), str(tmp_path / "file")])
+        assert os.path.join(str(tmp_path), "") not in feed._dirs
+        wd = feed._dirs[str(tmp_path)]
+        assert feed._watches[wd][1] == 2
+
+        feed.unsubscribe("client")
+        assert feed._dirs == {}
+        assert feed._watches == {}
+    finally:
+        feed.close()
+
+
+def test_moved_directories_are_watched_afresh(tmp_path):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "file").write_bytes(b"")
+    feed = ChangeFeed(str(tmp_path))
+    pushed = queue.Queue()
+    try:
+        feed.watch("client", pushed.put, [str(tmp_path / "dir" / "file")])
+        os.rename(str(tmp_path / "dir"), str(tmp_path / "moved"))
+        while "/dir" not in ujson.loads(pushed.get(timeout=5).meta)["trees"]:
+            pass
+        assert feed._subscriptions["client"].paths == {}
+
+        # A new directory at the old path gets a watch of its own, which the
+        # old subscription can't release
+        (tmp_path / "dir").mkdir()
+        (tmp_path / "dir" / "file").write_bytes(b"")
+        feed.watch("client", pushed.put, [str(tmp_path / "dir" / "file")])
+        feed.watch("other", pushed.put, [str(tmp_path / "dir" / "file")])
+        feed.unsubscribe("client")
+        assert str(tmp_path / "dir") in feed._dirs
+    finally:
+        feed.close()
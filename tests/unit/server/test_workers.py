@@ -0,0 +1,52 @@
+import os
+
+from pytcp_message.message import TcpRequest
+
+from httpfs.common import FuseOpType
+from httpfs.common.wire_protocol import Frame
+from httpfs.server import HttpFsServer
+from httpfs.server.workers import WorkerRouter
+
+FAKE_ADDR = ("127.0.0.1", 12345)
+
+
+def run_request(server, op, **kwargs):
+    request = TcpRequest(FAKE_ADDR)
+    request.frame = Frame.request(op, 1, api_key=None, **kwargs)
+    return server.run_request_handlers(request).frame.as_response()
+
+
+def test_requests_are_forwarded_to_owner(tmp_path):
+    root = tmp_path / "root"
+    root.mkdir()
+    (root / "file").write_bytes(b"0123456789")
+
+    routers = [WorkerRouter(i, 2, str(tmp_path)) for i in range(2)]
+    servers = [HttpFsServer(0, str(root), router=router) for router in routers]
+    try:
+        for router, server in zip(routers, servers):
+            router.start(server)
+
+        response = run_request(
+            servers[1],
+            FuseOpType.OPEN,
+            path="/file",
+            flags=os.O_RDONLY,
+            uid=os.getuid(),
+            gid=os.getgid()
+        )
+        assert response["errno"] == 0
+        fh = response["data"]
+        assert fh % 2 == 1
+
+        # Worker 0 doesn't have the file open, so it asks worker 1
+        response = run_request(servers[0], FuseOpType.READ, file_descriptor=fh, size=4, offset=3)
+        assert response == {"errno": 0, "data": b"3456"}
+
+        response = run_request(servers[0], FuseOpType.RELEASE, file_descriptor=fh)
+        assert response["errno"] == 0
+        assert len(servers[1].get_open_files()) == 0
+    finally:
+        for router, server in zip(routers, servers):
+            router.stop()
+            server.server_close()